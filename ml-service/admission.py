@@ -0,0 +1,76 @@
+"""
+Adaptive admission control for live classification requests
+An AIMD (additive increase, multiplicative decrease) limiter tracks how many
+requests may run the full model ensemble at once. Every completed request
+reports its latency: while latency stays under the target the limit grows by
+about one per limit-worth of requests, and when it exceeds the target the
+limit is cut by a constant factor (at most once per observed latency, so one
+slow burst does not collapse it to the minimum). Requests that arrive while
+the limit is reached are served by the cheap model set instead, and the full
+ensemble comes back automatically once latency recovers.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+
+class AdmissionController:
+    """AIMD concurrency limiter driven by observed request latency"""
+
+    def __init__(self, target_latency_ms=1000.0, initial_limit=8, min_limit=1, max_limit=64,
+                 backoff=0.7, history=1000):
+        self.target_latency = target_latency_ms / 1000.0
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.admitted = 0
+        self.degraded = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._latencies = collections.deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Reserve a full-ensemble slot; returns False when the request should be degraded"""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.degraded += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, latency, failed=False):
+        """Return a slot and adjust the limit from the latency (seconds) of the request"""
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self._latencies.append(latency)
+            if failed or latency > self.target_latency:
+                # Back off at most once per latency interval so a single slow batch counts once
+                if now - self._last_decrease >= latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif self.in_flight + 1 >= int(self.limit):
+                # Only grow while the limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def stats(self):
+        with self._lock:
+            latencies_ms = np.asarray(self._latencies) * 1000.0
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "degrading": self.in_flight >= int(self.limit),
+                "target_latency_ms": self.target_latency * 1000.0,
+                "admitted": self.admitted,
+                "degraded": self.degraded,
+                "decreases": self.decreases,
+                "latency_ms_p50": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+                "latency_ms_p99": float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+            }
\ No newline at end of file
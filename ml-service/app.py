@@ -3,16 +3,45 @@
 ML Service for Civic Connect
 Supports both SimpleCNN and ResNet50 models with automatic fallback
 """
-from fastapi import FastAPI, File, UploadFile, Query
+import cpu_config
+
+# Thread counts must be set up before NumPy or TensorFlow load; pinning waits for startup
+cpu_settings = cpu_config.apply()
+
+from fastapi import FastAPI, File, UploadFile, Query, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import uvicorn
 import numpy as np
 from PIL import Image
+import asyncio
+import concurrent.futures
+import hmac
 import io
 import os
 import sys
+import tempfile
+import time
 from pathlib import Path
 
+from typing import List
+from pydantic import BaseModel
+
+from admission import AdmissionController
+from area_index import AreaTypeIndex
+from circuit_breaker import CircuitBreaker
+from explain import ExplanationCache, GradCAM, overlay_text, render_overlay
+from fusion import EnsembleFusion
+import image_quality
+from job_store import JOB_LANES, DEFAULT_JOB_LANE, JobStore, JobWorker, callback_allowed, parse_hosts
+from model_registry import ModelRegistry
+import profiler
+import resource_monitor
+from scheduler import InferenceScheduler
+from similarity_index import EmbeddingIndex
+from tensor_cache import TensorCache, content_hash, to_float
+from tiling import predict_tiled
+
 # Add the classification directory to Python path
 script_dir = Path(__file__).parent
 classification_dir = script_dir.parent / "ml-models" / "classification"
@@ -22,6 +51,8 @@ sys.path.insert(0, str(classification_dir))
 ResNet50Predictor = None
 SimpleCNNPredictor = None
 GarbagePredictor = None
+MultiHeadPredictor = None
+StudentPredictor = None
 
 print("Loading ML predictors...")
 print(f"Python version: {sys.version}")
@@ -38,12 +69,28 @@ try:
 except ImportError as e:
     print(f"⚠️  SimpleCNNPredictor not available: {e}")
 
+try:
+    from predict_multihead import MultiHeadPredictor
+    print("✅ MultiHeadPredictor available")
+except ImportError as e:
+    print(f"⚠️  MultiHeadPredictor not available: {e}")
+
+try:
+    from predict_student import StudentPredictor
+    print("✅ StudentPredictor available")
+except ImportError as e:
+    print(f"⚠️  StudentPredictor not available: {e}")
+
 try:
     from predict_garbage import GarbagePredictor
     print("✅ GarbagePredictor available")
 except ImportError as e:
     print(f"⚠️  GarbagePredictor not available: {e}")
 
+cpu_config.configure_tensorflow(cpu_settings)
+print(f"CPU config: {cpu_settings['effective_cpus']} effective CPUs, {cpu_settings['workers']} worker(s), "
+      f"{cpu_settings['intra_op_threads']} threads per worker")
+
 app = FastAPI(title="Civic Connect ML Service")
 
 # Add CORS middleware
@@ -57,243 +104,789 @@ app.add_middleware(
 
 # Initialize predictors with the actual models if possible
 predictor = None
-resnet50_predictor = None
-simple_cnn_predictor = None
-garbage_predictor = None
 active_model_type = "none"
+model_weights_dir = script_dir.parent / "ml-models" / "model_weights"
+
+# Models are loaded lazily on first use and evicted least-recently-used first
+# when their resident size exceeds ML_MEMORY_BUDGET_MB (0 = unlimited).
+# ML_PARK_DTYPE=float16|bfloat16 keeps evicted Keras weights in half precision.
+models = ModelRegistry(
+    budget_bytes=int(float(os.environ.get("ML_MEMORY_BUDGET_MB", "0")) * 2**20),
+    park_dtype=os.environ.get("ML_PARK_DTYPE"))
 
-print("\nInitializing ML models...")
+print("\nRegistering ML models...")
+
+# Multi-head model: one ResNet50 backbone shared by the civic and garbage heads.
+# When it loads, the two standalone ResNet50 models are never touched.
+multihead_model_path = model_weights_dir / "resnet50_multihead_model.h5"
+multihead_heads_path = model_weights_dir / "multihead_heads.json"
+if MultiHeadPredictor and multihead_model_path.exists() and multihead_heads_path.exists():
+    models.register("multihead", lambda: MultiHeadPredictor(str(multihead_model_path), str(multihead_heads_path)))
+    print(f"✅ Multi-head model registered: {multihead_model_path}")
+else:
+    print("⏭️  Multi-head model not built (see build_multihead.py)")
 
-# Load both models if available
 # ResNet50 model (preferred for streetlight detection)
-if ResNet50Predictor:
-    try:
-        model_path = script_dir.parent / "ml-models" / "model_weights" / "resnet50_civic_model.h5"
-        class_indices_path = script_dir.parent / "ml-models" / "model_weights" / "class_indices.npy"
-        if model_path.exists() and class_indices_path.exists():
-            print("Attempting to load ResNet50 model...")
-            resnet50_predictor = ResNet50Predictor(str(model_path), str(class_indices_path))
-            if resnet50_predictor.is_loaded:
-                print(f"✅ ResNet50 model loaded successfully from {model_path}")
-            else:
-                print(f"⚠️  Failed to load ResNet50 model from {model_path}")
-        else:
-            print("⚠️  ResNet50 model files not found")
-    except Exception as e:
-        print(f"⚠️  Error loading ResNet50 model: {e}")
+resnet50_model_path = model_weights_dir / "resnet50_civic_model.h5"
+resnet50_class_indices_path = model_weights_dir / "class_indices.npy"
+if ResNet50Predictor and resnet50_model_path.exists() and resnet50_class_indices_path.exists():
+    models.register("resnet50", lambda: ResNet50Predictor(str(resnet50_model_path), str(resnet50_class_indices_path)))
+    print(f"✅ ResNet50 model registered: {resnet50_model_path}")
+elif ResNet50Predictor:
+    print("⚠️  ResNet50 model files not found")
 else:
     print("⏭️  Skipping ResNet50 model (TensorFlow not available)")
 
 # SimpleCNN model (for pothole and garbage detection)
-if SimpleCNNPredictor:
-    try:
-        model_path = script_dir.parent / "ml-models" / "model_weights" / "simple_cnn_model.pkl"
-        if model_path.exists():
-            print("Attempting to load SimpleCNN model...")
-            simple_cnn_predictor = SimpleCNNPredictor(str(model_path), silent=True)
-            if simple_cnn_predictor.is_loaded:
-                print(f"✅ SimpleCNN model loaded successfully from {model_path}")
-            else:
-                print(f"⚠️  Failed to load SimpleCNN model from {model_path}")
-        else:
-            print("⚠️  SimpleCNN model file not found")
-    except Exception as e:
-        print(f"⚠️  Error loading SimpleCNN model: {e}")
-elif predictor is None:
+simple_cnn_model_path = model_weights_dir / "simple_cnn_model.pkl"
+if SimpleCNNPredictor and simple_cnn_model_path.exists():
+    models.register("simple_cnn", lambda: SimpleCNNPredictor(str(simple_cnn_model_path), silent=True))
+    print(f"✅ SimpleCNN model registered: {simple_cnn_model_path}")
+elif SimpleCNNPredictor:
+    print("⚠️  SimpleCNN model file not found")
+else:
     print("⏭️  Skipping SimpleCNN model (predictor not available)")
 
 # Garbage-specific model (specialized for garbage detection)
-if GarbagePredictor:
-    try:
-        model_path = script_dir.parent / "ml-models" / "model_weights" / "resnet50_garbage_model.h5"
-        class_indices_path = script_dir.parent / "ml-models" / "model_weights" / "garbage_class_indices.npy"
-        if model_path.exists():
-            print("Attempting to load Garbage detection model...")
-            garbage_predictor = GarbagePredictor(str(model_path), str(class_indices_path))
-            if garbage_predictor.is_loaded:
-                print(f"✅ Garbage detection model loaded successfully from {model_path}")
-            else:
-                print(f"⚠️  Failed to load Garbage detection model from {model_path}")
-        else:
-            print("⚠️  Garbage detection model file not found")
-    except Exception as e:
-        print(f"⚠️  Error loading Garbage detection model: {e}")
-elif predictor is None:
+garbage_model_path = model_weights_dir / "resnet50_garbage_model.h5"
+garbage_class_indices_path = model_weights_dir / "garbage_class_indices.npy"
+if GarbagePredictor and garbage_model_path.exists():
+    models.register("garbage", lambda: GarbagePredictor(str(garbage_model_path), str(garbage_class_indices_path)))
+    print(f"✅ Garbage detection model registered: {garbage_model_path}")
+elif GarbagePredictor:
+    print("⚠️  Garbage detection model file not found")
+else:
     print("⏭️  Skipping Garbage detection model (predictor not available)")
 
-# Report model status
-resnet50_available = resnet50_predictor is not None and resnet50_predictor.is_loaded if resnet50_predictor else False
-simple_cnn_available = simple_cnn_predictor is not None and simple_cnn_predictor.is_loaded if simple_cnn_predictor else False
-garbage_model_available = garbage_predictor is not None and garbage_predictor.is_loaded if garbage_predictor else False
+# Distilled student model (see distill.py): serves /classify on its own with ML_SERVING_MODEL=student
+student_model_path = model_weights_dir / "student_model.h5"
+student_info_path = model_weights_dir / "student_model.json"
+serving_model = os.environ.get("ML_SERVING_MODEL", "ensemble")
+if StudentPredictor and student_model_path.exists() and student_info_path.exists():
+    models.register("student", lambda: StudentPredictor(str(student_model_path), str(student_info_path)))
+    print(f"✅ Student model registered: {student_model_path} (serving: {serving_model})")
+else:
+    print("⏭️  Student model not trained (see distill.py)")
 
-print(f"ResNet50 model: {'✅ Available' if resnet50_available else '❌ Not available'}")
-print(f"SimpleCNN model: {'✅ Available' if simple_cnn_available else '❌ Not available'}")
-print(f"Garbage detection model: {'✅ Available' if garbage_model_available else '❌ Not available'}")
+def preload_models():
+    """Load the models a full classification needs (standalone ResNet50s only without the multi-head model)"""
+    if serving_model == "student" and models.available("student"):
+        with models.use("student") as student_predictor:
+            if student_predictor:
+                return
+    with models.use("multihead") as multihead_predictor:
+        names = ["simple_cnn"] if multihead_predictor else ["resnet50", "simple_cnn", "garbage"]
+    for name in names:
+        with models.use(name):
+            pass
 
 # Define issue types, severities, and area types
 issue_types = ['pothole', 'garbage', 'streetlight', 'water_leak', 'other']
 severities = ['low', 'medium', 'high']
 area_types = ['urban', 'busy', 'residential', 'rural']
 
+# Embedding index of complaint images for duplicate detection
+similarity_index_dir = os.environ.get(
+    "SIMILARITY_INDEX_DIR", str(script_dir.parent / "ml-models" / "similarity_index"))
+try:
+    similarity_index = EmbeddingIndex.load(similarity_index_dir)
+    print(f"Similarity index: {len(similarity_index)} complaints loaded from {similarity_index_dir}")
+except Exception as e:
+    print(f"⚠️  Failed to load similarity index, starting empty: {e}")
+    similarity_index = EmbeddingIndex()
+    similarity_index.path = similarity_index_dir
+
+# Offline land-use grid index for area type lookups (built with area_index.py)
+area_index = None
+area_index_path = script_dir.parent / "ml-models" / "model_weights" / "area_index.npz"
+if area_index_path.exists():
+    try:
+        area_index = AreaTypeIndex(str(area_index_path))
+        print(f"✅ Area type index loaded: {len(area_index)} cells from {area_index_path}")
+    except Exception as e:
+        print(f"⚠️  Failed to load area type index: {e}")
+else:
+    print("⚠️  Area type index not found, /area-type will return placeholder results")
+
+def save_temp_image(contents):
+    """Write uploaded image bytes to a unique temporary JPEG file"""
+    image = Image.open(io.BytesIO(contents))
+    fd, temp_path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    image.convert('RGB').save(temp_path)
+    return temp_path
+
+def compute_embedding(image_path):
+    """Pooled ResNet50 embedding of an image, from whichever ResNet50 model is loaded"""
+    with models.use("multihead") as multihead_predictor:
+        if multihead_predictor:
+            result = multihead_predictor.predict(image_path)
+            return result["embedding"] if result else None
+    with models.use("resnet50") as resnet50_predictor:
+        if resnet50_predictor:
+            return resnet50_predictor.get_embedding(image_path)
+    return None
+
+def split_item(item):
+    """(path, options) of a scheduler item, which is a path or a (path, options) pair"""
+    return item if isinstance(item, tuple) else (item, {})
+
+def prefilter_items(items):
+    """Unusable-image results by index for the items whose quality was not checked yet"""
+    rejected = {}
+    for i, item in enumerate(items):
+        image_path, options = split_item(item)
+        if options.get("quality_checked") or not os.path.exists(image_path):
+            continue
+        try:
+            assessment = image_quality.assess(image_path)
+        except Exception:
+            # Unreadable images fail in the models with their usual error
+            continue
+        if not assessment["usable"]:
+            rejected[i] = image_quality.unusable_result(assessment)
+    return rejected
+
+def classify_with_student(items):
+    """Classify a micro-batch with the student model in one forward pass; None if it cannot be loaded"""
+    with models.use("student") as student_predictor:
+        if not student_predictor:
+            return None
+        outcomes = [None] * len(items)
+        arrays = []
+        batched = []
+        for i, item in enumerate(items):
+            image_path, options = split_item(item)
+            tiling = options.get("tiling")
+            if not os.path.exists(image_path):
+                outcomes[i] = FileNotFoundError(f"Image not found: {image_path}")
+            elif tiling:
+                try:
+                    outcomes[i] = predict_tiled(student_predictor, image_path, **tiling)
+                except Exception as e:
+                    outcomes[i] = e
+            else:
+                img_array = student_predictor.preprocess_image(image_path)
+                if img_array is None:
+                    outcomes[i] = ValueError(f"Could not read image: {image_path}")
+                else:
+                    arrays.append(img_array[0])
+                    batched.append(i)
+        if arrays:
+            for i, result in zip(batched, student_predictor.predict_batch(np.stack(arrays))):
+                outcomes[i] = result
+
+    for i, result in enumerate(outcomes):
+        if isinstance(result, dict):
+            outcomes[i] = {"issueType": result["class"], "confidence": result["confidence"], "degraded": False}
+            if "tiles" in result:
+                outcomes[i]["tiles"] = result["tiles"]
+    return outcomes
+
+def classify_batch(items, degraded=False):
+    """Scheduler handler: classify a micro-batch of image files
+
+    Items are image paths or (path, options) pairs, options holding "tiling"
+    and the request's "deadline" (time.perf_counter() seconds). The models run
+    per image, then one vectorized fusion step decides the whole batch. With
+    ML_SERVING_MODEL=student the student model replaces the ensemble. Items not
+    yet marked "quality_checked" go through the image-quality pre-filter first.
+    """
+    if quality_filter_enabled and not all(split_item(item)[1].get("quality_checked") for item in items):
+        outcomes = prefilter_items(items)
+        kept = [i for i in range(len(items)) if i not in outcomes]
+        checked = [(path, dict(options, quality_checked=True)) for path, options in map(split_item, items)]
+        if kept:
+            outcomes.update(zip(kept, classify_batch([checked[i] for i in kept], degraded)))
+        return [outcomes[i] for i in range(len(items))]
+
+    if serving_model == "student" and not degraded:
+        outcomes = classify_with_student(items)
+        if outcomes is not None:
+            return outcomes
+
+    outcomes = [None] * len(items)
+    model_results = []
+    members = []
+    tile_summaries = []
+    fused = []
+    for i, item in enumerate(items):
+        image_path, options = split_item(item)
+        if not os.path.exists(image_path):
+            outcomes[i] = FileNotFoundError(f"Image not found: {image_path}")
+            continue
+        try:
+            results, member_info = predict_models(image_path, degraded, options.get("tiling"), options.get("deadline"))
+            model_results.append(results)
+            members.append(member_info)
+            tile_summaries.append(next((r["tiles"] for r in results if r and "tiles" in r), None))
+            fused.append(i)
+        except Exception as e:
+            outcomes[i] = e
+
+    decisions = fusion.decide(model_results) if model_results else []
+    for i, decision, member_info, tiles in zip(fused, decisions, members, tile_summaries):
+        if decision is None:
+            # No model produced a prediction
+            outcomes[i] = {"issueType": "other", "confidence": 0.0, "degraded": True}
+        else:
+            # A partial ensemble (members skipped or abandoned) is a degraded answer too
+            outcomes[i] = {"issueType": decision["issueType"], "confidence": decision["confidence"],
+                           "degraded": degraded or bool(member_info["skipped"])}
+        outcomes[i].update(member_info)
+        if tiles is not None:
+            outcomes[i]["tiles"] = tiles
+    return outcomes
+
+def remove_job_image(job):
+    """Delete uploaded job images once the job has finished"""
+    if job["owns_image"] and os.path.exists(job["image_path"]):
+        os.remove(job["image_path"])
+
+# Log-linear fusion of the model outputs (weights fitted with fit_fusion.py)
+fusion_weights_path = model_weights_dir / "fusion_weights.json"
+if fusion_weights_path.exists():
+    fusion = EnsembleFusion.load(str(fusion_weights_path))
+    print(f"✅ Fusion weights loaded from {fusion_weights_path}")
+else:
+    fusion = EnsembleFusion.default(issue_types)
+    print("⚠️  Fusion weights not fitted, using default weights (see fit_fusion.py)")
+
+# Optional store of preprocessed tensors of every classified image, for rescore.py
+tensor_cache = None
+if os.environ.get("ML_TENSOR_CACHE_DIR"):
+    try:
+        tensor_cache = TensorCache(os.environ["ML_TENSOR_CACHE_DIR"])
+        print(f"✅ Tensor cache: {len(tensor_cache)} images in {tensor_cache.path}")
+    except Exception as e:
+        print(f"⚠️  Failed to open tensor cache: {e}")
+
+def cache_tensors(image_hash, temp_path, source, result):
+    """Keep the image's canonical tensors and returned label; never fails the request"""
+    try:
+        tensor_cache.put(image_hash, temp_path, source=source, result=result)
+    except Exception as e:
+        print(f"⚠️  Failed to cache tensors of {image_hash}: {e}")
+
+# Grad-CAM heatmaps for /explain, rendered from the tensor cache in the bulk lane and kept
+# as PNGs up to ML_EXPLAIN_CACHE_MB
+explanation_cache = ExplanationCache(
+    os.environ.get("ML_EXPLAIN_CACHE_DIR", str(script_dir / "explanations")),
+    max_bytes=int(float(os.environ.get("ML_EXPLAIN_CACHE_MB", "256")) * 2**20))
+explanations_in_flight = {}
+# Registered model name -> (Keras model, {head: GradCAM}). The Grad-CAM models share the
+# Keras model's layers, so they are dropped as soon as the registry parks or unloads it
+explainers = {}
+models.add_release_listener(lambda name: explainers.pop(name, None))
+EXPLAINED_HEADS = ("civic", "garbage")
+
+def explain_target(head):
+    """(registered model, multi-head head name or None) whose Grad-CAM explains a head"""
+    if models.available("multihead"):
+        return "multihead", head
+    return ("resnet50" if head == "civic" else "garbage"), None
+
+def explain_batch(items):
+    """Scheduler handler for Grad-CAM items: render and cache heatmap overlays of cached images
+
+    Items are (image hash, {"explain": {"head", "class_name", "key"}}) pairs;
+    the result of each is the PNG bytes.
+    """
+    outcomes = [None] * len(items)
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(split_item(item)[1]["explain"]["head"], []).append(i)
+    for head, indices in groups.items():
+        name, model_head = explain_target(head)
+        try:
+            with models.use(name) as explained_predictor:
+                if not explained_predictor:
+                    raise RuntimeError(f"No ResNet50 model is available to explain the {head} head")
+                model = explained_predictor.model
+                if explainers.get(name, (None,))[0] is not model:
+                    # A model restored from parking is a new Keras model
+                    explainers[name] = (model, {})
+                gradcams = explainers[name][1]
+                if head not in gradcams:
+                    gradcams[head] = GradCAM(model, model_head)
+                class_names = explained_predictor.heads[model_head] if model_head else explained_predictor.class_names
+                class_ids = {class_name: idx for idx, class_name in class_names.items()}
+                images, requested, kept = [], [], []
+                for i in indices:
+                    image_hash, options = split_item(items[i])
+                    class_name = options["explain"]["class_name"]
+                    image = tensor_cache.get(image_hash, "224")
+                    if image is None:
+                        outcomes[i] = KeyError(f"Image {image_hash} is not in the tensor cache")
+                    elif class_name is not None and class_name not in class_ids:
+                        outcomes[i] = ValueError(f"Unknown {head} class '{class_name}', expected one of "
+                                                 f"{sorted(class_ids)}")
+                    else:
+                        images.append(image)
+                        requested.append(class_ids.get(class_name, -1))
+                        kept.append(i)
+                if kept:
+                    heatmaps, found, probabilities = gradcams[head](
+                        to_float(np.stack(images)), requested)
+        except Exception as e:
+            for i in indices:
+                if outcomes[i] is None:
+                    outcomes[i] = e
+            continue
+        for j, i in enumerate(kept):
+            text = {
+                "model": name,
+                "head": head,
+                "class": class_names[int(found[j])],
+                "probability": f"{float(probabilities[j][found[j]]):.4f}",
+                "predicted": class_names[int(np.argmax(probabilities[j]))],
+            }
+            png = render_overlay(images[j], heatmaps[j], text=text)
+            explanation_cache.put(split_item(items[i])[1]["explain"]["key"], png)
+            outcomes[i] = png
+    return outcomes
+
+def run_batch(items):
+    """Scheduler handler: Grad-CAM items go to explain_batch, all others are classified"""
+    explaining = [bool(split_item(item)[1].get("explain")) for item in items]
+    if not any(explaining):
+        return classify_batch(items)
+    outcomes = [None] * len(items)
+    for handler, wanted in ((explain_batch, True), (classify_batch, False)):
+        indices = [i for i, flag in enumerate(explaining) if flag == wanted]
+        if indices:
+            for i, outcome in zip(indices, handler([items[i] for i in indices])):
+                outcomes[i] = outcome
+    return outcomes
+
+# All inference runs through the priority-lane scheduler:
+# interactive (/classify), admin and bulk (jobs, re-scoring, explanations).
+# Batch sizes and wait come from autotune.py's measurements when present; ML_BATCH_WAIT_MS wins.
+tuned_settings = cpu_settings["tuned"] or {}
+scheduler = InferenceScheduler(
+    run_batch, max_wait_ms=float(os.environ.get("ML_BATCH_WAIT_MS", tuned_settings.get("max_wait_ms", 0))))
+if tuned_settings:
+    scheduler.configure(batch_sizes=tuned_settings.get("batch_sizes"))
+    print(f"✅ Autotuned settings from {tuned_settings['path']}: batch sizes {tuned_settings.get('batch_sizes')}, "
+          f"wait {tuned_settings.get('max_wait_ms')} ms")
+    missing = [name for name in tuned_settings.get("models", []) if name not in models]
+    if missing:
+        print(f"⚠️  Settings were tuned with models no longer registered ({', '.join(missing)}); "
+              f"re-run autotune.py")
+
+# Live requests beyond the adaptive concurrency limit are served by SimpleCNN alone
+admission = AdmissionController(
+    target_latency_ms=float(os.environ.get("ML_TARGET_LATENCY_MS", "1000")),
+    max_limit=int(os.environ.get("ML_MAX_CONCURRENCY", "64")))
+
+# Persistent job queue for asynchronous classification
+jobs_dir = Path(os.environ.get("ML_JOBS_DIR", str(script_dir / "jobs")))
+jobs_dir.mkdir(parents=True, exist_ok=True)
+job_store = JobStore(str(jobs_dir / "jobs.sqlite"))
+# Job results are only POSTed to these hosts ("host" or "host:port"), over http(s)
+callback_hosts = parse_hosts(os.environ.get("ML_CALLBACK_HOSTS", "localhost,127.0.0.1,api"))
+job_worker = JobWorker(job_store, scheduler.submit,
+                       max_in_flight=int(os.environ.get("ML_JOB_MAX_IN_FLIGHT", "16")),
+                       on_finished=remove_job_image,
+                       lease_seconds=float(os.environ.get("ML_JOB_LEASE_SECONDS", "60")),
+                       allowed_callback_hosts=callback_hosts)
+# Jobs may reference existing files only below these directories (e.g. the API server's uploads)
+job_image_roots = [
+    Path(root).resolve()
+    for root in os.environ.get("ML_JOB_IMAGE_ROOTS", str(script_dir.parent / "server" / "uploads")).split(os.pathsep)
+]
+
+@app.on_event("startup")
+async def start_job_worker():
+    """Start the scheduler and drain the job queue, resuming jobs interrupted by a restart"""
+    # Only serving workers run startup hooks, never the uvicorn supervisor
+    cpu_config.pin_worker(cpu_settings)
+    if cpu_settings["pinned_cpus"]:
+        print(f"Worker slot {cpu_settings['worker_slot']} pinned to CPUs {cpu_settings['pinned_cpus']}")
+    if os.environ.get("ML_TRACEMALLOC_FRAMES"):
+        resource_monitor.start_tracing(int(os.environ["ML_TRACEMALLOC_FRAMES"]))
+    if os.environ.get("ML_PRELOAD_MODELS") == "1":
+        preload_models()
+    scheduler.start()
+    job_worker.start()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    job_worker.stop()
+    scheduler.stop()
+
 @app.get("/")
 async def root():
     return {"message": "Civic Connect ML Service"}
 
-@app.post("/classify")
-async def classify_issue(file: UploadFile = File(...)):
-    """Classify the type of civic issue in the image using both models with improved logic"""
+# Per-member latency budgets in ms (ML_MODEL_LATENCY_BUDGETS_MS="multihead=1500,simple_cnn=200,...");
+# a member whose p90 latency exceeds its budget, or which keeps failing, is bypassed for a while
+model_latency_budgets_ms = {"multihead": 1500.0, "resnet50": 1200.0, "simple_cnn": 300.0, "garbage": 1200.0}
+for entry in os.environ.get("ML_MODEL_LATENCY_BUDGETS_MS", "").split(","):
+    if "=" in entry:
+        name, budget = entry.split("=", 1)
+        model_latency_budgets_ms[name.strip()] = float(budget)
+breakers = {
+    name: CircuitBreaker(name, latency_budget=budget / 1000.0,
+                         open_seconds=float(os.environ.get("ML_BREAKER_OPEN_SECONDS", "30")))
+    for name, budget in model_latency_budgets_ms.items()
+}
+
+# Ensemble members run concurrently so a request can stop waiting at its deadline
+member_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ML_MEMBER_THREADS", "4")), thread_name_prefix="ensemble-member")
+
+# Default deadlines per endpoint in ms (0 = none); requests may send X-Deadline-Ms instead
+classify_deadline_ms = float(os.environ.get("ML_CLASSIFY_DEADLINE_MS", "10000"))
+
+# Dark, blurred, blank and non-photo uploads are answered without running the models
+quality_filter_enabled = os.environ.get("ML_QUALITY_FILTER", "1") == "1"
+
+def request_deadline(header_ms, default_ms):
+    """Absolute deadline (time.perf_counter() seconds) from a header or the endpoint default, or None"""
     try:
-        # Read the file contents
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Save to temporary file for processing
-        temp_path = "temp_image.jpg"
-        image.save(temp_path)
-        
-        # Use all available models for classification
-        resnet50_result = None
-        simple_cnn_result = None
-        garbage_result = None
-        
-        # Get prediction from ResNet50 model if available
-        if resnet50_predictor and resnet50_predictor.is_loaded:
-            try:
-                resnet50_result = resnet50_predictor.predict(temp_path)
-            except Exception as e:
-                print(f"Error with ResNet50 prediction: {e}")
-        
-        # Get prediction from SimpleCNN model if available
-        if simple_cnn_predictor and simple_cnn_predictor.is_loaded:
-            try:
-                simple_cnn_result = simple_cnn_predictor.predict(temp_path)
-            except Exception as e:
-                print(f"Error with SimpleCNN prediction: {e}")
-        
-        # Get prediction from Garbage-specific model if available
-        if garbage_predictor and garbage_predictor.is_loaded:
+        budget_ms = float(header_ms) if header_ms else default_ms
+    except ValueError:
+        budget_ms = default_ms
+    return time.perf_counter() + budget_ms / 1000.0 if budget_ms > 0 else None
+
+def run_member(name, temp_path, tiling=None):
+    """Run one ensemble member on an image and record its outcome with its circuit breaker
+
+    Returns the predictor result (per head for the multi-head model) or None.
+    """
+    with models.use(name) as predictor:
+        if not predictor:
+            breakers[name].record(None, failed=True)
+            return None
+        started = time.perf_counter()
+        failed = True
+        try:
+            if tiling and name != "simple_cnn":
+                heads = ["civic", "garbage"] if name == "multihead" else None
+                result = predict_tiled(predictor, temp_path, heads=heads, **tiling)
+            else:
+                result = predictor.predict(temp_path)
+            failed = result is None
+            return result
+        finally:
+            # Tiled calls are slower by design, they only count towards the error rate
+            breakers[name].record(None if tiling else time.perf_counter() - started, failed)
+
+def predict_models(temp_path, degraded=False, tiling=None, deadline=None):
+    """Run the available models on an image concurrently until the deadline
+
+    Returns the results in fusion model order and {"contributors": [...],
+    "skipped": {member: reason}}. Members whose breaker is open, or whose
+    expected latency does not fit before the deadline, are not started;
+    members still running at the deadline are abandoned. With degraded=True
+    only the cheap SimpleCNN model is run (overload mode). tiling
+    ({"tile_budget": ..., "threshold": ...}) scores the ResNet50 and garbage
+    models on overlapping tiles as well as the whole image.
+    """
+    outputs = {}
+    skipped = {}
+
+    def run(names):
+        futures = {}
+        for name in names:
+            if not models.available(name):
+                continue
+            expected = breakers[name].expected_latency()
+            if deadline is not None and time.perf_counter() + (expected or 0.0) > deadline:
+                skipped[name] = "deadline"
+            elif not breakers[name].allow():
+                skipped[name] = "circuit_open"
+            else:
+                futures[member_pool.submit(run_member, name, temp_path, tiling)] = name
+        if not futures:
+            return
+        timeout = max(0.0, deadline - time.perf_counter()) if deadline is not None else None
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        for future in not_done:
+            # Abandoned: a queued call is dropped, a running one finishes in the background
+            if future.cancel():
+                # It never ran, so its breaker would never hear back (a half-open probe would stay taken)
+                breakers[futures[future]].abandon()
+            skipped[futures[future]] = "timeout"
+        for future in done:
+            name = futures[future]
             try:
-                garbage_result = garbage_predictor.predict(temp_path)
+                result = future.result()
             except Exception as e:
-                print(f"Error with Garbage detection prediction: {e}")
-        
-        # Combine predictions intelligently
-        final_prediction = None
-        final_confidence = 0.0
-        
-        # Special handling: if we have a garbage-specific model, prioritize its predictions for garbage
-        if garbage_result:
-            garbage_class = garbage_result.get("class", "")
-            garbage_conf = garbage_result.get("confidence", 0)
-            
-            # If the garbage model detects garbage with reasonable confidence, trust it
-            if garbage_class.lower() == "garbage" and garbage_conf > 0.5:
-                final_prediction = "garbage"
-                final_confidence = garbage_conf
-            # If the garbage model detects non-garbage with high confidence, consider it
-            elif garbage_class.lower() != "garbage" and garbage_conf > 0.7:
-                # Use the garbage model's prediction as additional evidence
-                # but still go through the normal combination logic
-                pass
-                
-        # If we haven't made a decision based on the garbage model, use the normal combination logic
-        if final_prediction is None:
-            if resnet50_result and simple_cnn_result:
-                # Both models available - use intelligent combination
-                resnet50_class = resnet50_result["class"]
-                resnet50_conf = resnet50_result["confidence"]
-                simple_cnn_class = simple_cnn_result["class"]
-                simple_cnn_conf = simple_cnn_result["confidence"]
-                
-                # Improved logic with better thresholds and prioritization
-                
-                # Special handling for streetlight detection (ResNet50 is specialized for this)
-                if resnet50_class == 'streetlight' and resnet50_conf > 0.8:
-                    # Very high confidence streetlight detection from ResNet50 - trust it
-                    final_prediction = 'streetlight'
-                    final_confidence = resnet50_conf
-                elif simple_cnn_class in ['pothole', 'garbage'] and simple_cnn_conf > 0.3:
-                    # For pothole and garbage, prefer SimpleCNN if it has reasonable confidence
-                    final_prediction = simple_cnn_class
-                    final_confidence = simple_cnn_conf
-                elif resnet50_class in ['pothole', 'garbage'] and resnet50_conf > 0.7:
-                    # ResNet50 also detected pothole/garbage with high confidence
-                    final_prediction = resnet50_class
-                    final_confidence = resnet50_conf
-                elif simple_cnn_class in ['pothole', 'garbage']:
-                    # When dealing with pothole/garbage, prefer SimpleCNN by default
-                    final_prediction = simple_cnn_class
-                    final_confidence = simple_cnn_conf
-                elif simple_cnn_conf > resnet50_conf + 0.2:
-                    # SimpleCNN is significantly more confident
-                    final_prediction = simple_cnn_class
-                    final_confidence = simple_cnn_conf
-                elif resnet50_conf > simple_cnn_conf + 0.3:
-                    # ResNet50 is significantly more confident
-                    # But be conservative - only trust ResNet50 for streetlight with high confidence
-                    if resnet50_class == 'streetlight' and resnet50_conf > 0.7:
-                        final_prediction = resnet50_class
-                        final_confidence = resnet50_conf
-                    else:
-                        # For other classes, prefer SimpleCNN when ResNet50 is not very confident
-                        final_prediction = simple_cnn_class
-                        final_confidence = simple_cnn_conf
-                else:
-                    # When confidence levels are similar, prioritize based on specialization
-                    if simple_cnn_class in ['pothole', 'garbage']:
-                        # Prefer SimpleCNN for pothole/garbage
-                        final_prediction = simple_cnn_class
-                        final_confidence = simple_cnn_conf
-                    elif resnet50_class == 'streetlight' and resnet50_conf > 0.6:
-                        # Prefer ResNet50 for streetlight if it has good confidence
-                        final_prediction = resnet50_class
-                        final_confidence = resnet50_conf
-                    else:
-                        # Default to SimpleCNN for pothole/garbage cases
-                        if simple_cnn_class in ['pothole', 'garbage']:
-                            final_prediction = simple_cnn_class
-                            final_confidence = simple_cnn_conf
-                        else:
-                            # For other cases, use the model with higher confidence
-                            if resnet50_conf >= simple_cnn_conf:
-                                final_prediction = resnet50_class
-                                final_confidence = resnet50_conf
-                            else:
-                                final_prediction = simple_cnn_class
-                                final_confidence = simple_cnn_conf
-            elif resnet50_result:
-                # Only ResNet50 available
-                final_prediction = resnet50_result["class"]
-                final_confidence = resnet50_result["confidence"]
-            elif simple_cnn_result:
-                # Only SimpleCNN available
-                final_prediction = simple_cnn_result["class"]
-                final_confidence = simple_cnn_result["confidence"]
+                print(f"Error with {name} prediction: {e}")
+                result = None
+            if result:
+                outputs[name] = result
             else:
-                # No models available, use fallback
-                issue_type = np.random.choice(issue_types)
-                final_prediction = issue_type
-                final_confidence = float(np.random.rand())
-        
-        # Clean up temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        
-        return {
-            "issueType": final_prediction,
-            "confidence": float(final_confidence)
+                skipped[name] = "error"
+
+    if degraded:
+        run(["simple_cnn"])
+    elif models.available("multihead"):
+        # One backbone pass for the civic and garbage predictions
+        run(["multihead", "simple_cnn"])
+        if "multihead" not in outputs and skipped.get("multihead") != "timeout":
+            run(["resnet50", "garbage"])
+    else:
+        run(["resnet50", "simple_cnn", "garbage"])
+
+    resnet50_result = outputs.get("resnet50")
+    garbage_result = outputs.get("garbage")
+    if "multihead" in outputs:
+        resnet50_result = outputs["multihead"].get("civic")
+        garbage_result = outputs["multihead"].get("garbage")
+    member_info = {"contributors": sorted(outputs), "skipped": skipped}
+    return [resnet50_result, outputs.get("simple_cnn"), garbage_result], member_info
+
+def classify_image(temp_path, degraded=False, options=None):
+    """Classify the type of civic issue in an image file using all available models"""
+    result = classify_batch([(temp_path, options or {})], degraded)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+async def run_classification(temp_path, lane, options):
+    """Run the full ensemble through the scheduler, or SimpleCNN alone when over the admission limit"""
+    admitted = admission.try_acquire()
+    if not admitted and models.available("simple_cnn"):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, classify_image, temp_path, True, options)
+
+    # Without a cheap model there is nothing to degrade to, so the request queues as usual
+    start = time.perf_counter()
+    failed = False
+    try:
+        return await asyncio.wrap_future(scheduler.submit((temp_path, options), lane))
+    except Exception:
+        failed = True
+        raise
+    finally:
+        if admitted:
+            admission.release(time.perf_counter() - start, failed=failed)
+
+@app.post("/classify")
+async def classify_issue(
+    file: UploadFile = File(...),
+    lane: str = Query("interactive", description="Scheduler lane: interactive, admin or bulk"),
+    tiled: bool = Query(False, description="Also score overlapping tiles, for small objects in large photos"),
+    tile_budget: int = Query(9, ge=1, le=32, description="Maximum images scored per model in tiled mode"),
+    tile_threshold: float = Query(0.8, gt=0, le=1, description="Stop tiling once a tile is this confident"),
+    x_deadline_ms: str = Header(None, description="Time budget of the request in ms")
+):
+    """Classify the type of civic issue in the image using both models with improved logic"""
+    deadline = request_deadline(x_deadline_ms, classify_deadline_ms)
+    temp_path = None
+    try:
+        # Save the upload to a temporary file for processing
+        contents = await file.read()
+        image_hash = content_hash(contents)
+        if quality_filter_enabled:
+            assessment = await asyncio.get_running_loop().run_in_executor(None, image_quality.assess, contents)
+            if not assessment["usable"]:
+                return dict(image_quality.unusable_result(assessment), imageHash=image_hash)
+        temp_path = save_temp_image(contents)
+        options = {
+            "tiling": {"tile_budget": tile_budget, "threshold": tile_threshold} if tiled else None,
+            "deadline": deadline,
+            "quality_checked": True,
         }
-            
+        result = await run_classification(temp_path, lane, options)
+        if tensor_cache is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, cache_tensors, image_hash, temp_path, file.filename, result)
+        return dict(result, imageHash=image_hash)
     except Exception as e:
-        # Clean up temporary file if it exists
-        if os.path.exists("temp_image.jpg"):
-            os.remove("temp_image.jpg")
-        # Fallback to random classification on error
-        issue_type = np.random.choice(issue_types)
+        # Report the failure instead of guessing a class
         return {
-            "issueType": issue_type,
-            "confidence": float(np.random.rand())
+            "issueType": "other",
+            "confidence": 0.0,
+            "degraded": True,
+            "error": str(e)
         }
+    finally:
+        # Clean up temporary file
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+@app.get("/explain/{image_hash}")
+async def explain_image(
+    image_hash: str,
+    head: str = Query("civic", description="Head to explain: civic or garbage"),
+    class_name: str = Query(None, description="Class to explain (default: the predicted class)"),
+    wait_ms: float = Query(5000, ge=0, le=60000, description="How long to wait for a heatmap not cached yet")
+):
+    """Grad-CAM heatmap (PNG) of an image classified earlier, identified by its imageHash
+
+    Heatmaps are computed on first request in the bulk scheduler lane, so
+    /classify never pays for them, and cached on disk. If the heatmap is not
+    ready within wait_ms the response is 202 and the request can be repeated.
+    """
+    if head not in EXPLAINED_HEADS:
+        return JSONResponse(status_code=400, content={"message": f"head must be one of {EXPLAINED_HEADS}",
+                                                      "success": False})
+    if tensor_cache is None:
+        return JSONResponse(status_code=409, content={
+            "message": "Explanations need the tensor cache (set ML_TENSOR_CACHE_DIR)", "success": False})
+    loop = asyncio.get_running_loop()
+    key = f"{image_hash}_{explain_target(head)[0]}_{head}_{class_name or 'predicted'}"
+    png = await loop.run_in_executor(None, explanation_cache.get, key)
+    if png is None:
+        if await loop.run_in_executor(None, tensor_cache.lookup, image_hash) is None:
+            return JSONResponse(status_code=404, content={
+                "message": "Unknown image hash (only images classified with the tensor cache enabled can be explained)",
+                "success": False})
+        future = explanations_in_flight.get(key)
+        if future is None:
+            item = (image_hash, {"explain": {"head": head, "class_name": class_name, "key": key}})
+            future = scheduler.submit(item, "bulk")
+            explanations_in_flight[key] = future
+            future.add_done_callback(lambda _: explanations_in_flight.pop(key, None))
+        try:
+            # Shielded so a client giving up does not cancel the queued computation
+            png = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), wait_ms / 1000.0)
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code=202, content={
+                "message": "Heatmap queued in the bulk lane, retry later", "status": "pending",
+                "imageHash": image_hash, "success": True})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"message": str(e), "success": False})
+        except Exception as e:
+            return JSONResponse(status_code=500, content={"message": f"Explanation failed: {e}", "success": False})
+
+    headers = {f"X-Explain-{name.capitalize()}": value for name, value in overlay_text(png).items()}
+    return Response(png, media_type="image/png", headers=headers)
+
+@app.post("/jobs")
+async def create_job(
+    file: UploadFile = File(None),
+    image_path: str = Form(None),
+    callback_url: str = Form(None),
+    priority: str = Form(DEFAULT_JOB_LANE)
+):
+    """Queue an image (upload or server-side path) for classification and return a job ID"""
+    try:
+        if priority not in JOB_LANES:
+            return {"message": f"priority must be one of {JOB_LANES}", "success": False}
+        if callback_url and not callback_allowed(callback_url, callback_hosts):
+            return {"message": "callback_url must be an http(s) URL on an allowed host (ML_CALLBACK_HOSTS)",
+                    "success": False}
+        if file is not None:
+            contents = await file.read()
+            image = Image.open(io.BytesIO(contents))
+            job_image_path = str(jobs_dir / f"upload-{time.time_ns()}.jpg")
+            image.convert('RGB').save(job_image_path)
+            owns_image = True
+        elif image_path:
+            resolved = Path(image_path).resolve()
+            if not any(root == resolved or root in resolved.parents for root in job_image_roots):
+                return {"message": "image_path is outside the allowed image directories", "success": False}
+            if not resolved.exists():
+                return {"message": f"Image not found: {image_path}", "success": False}
+            job_image_path = str(resolved)
+            owns_image = False
+        else:
+            return {"message": "Provide either a file or an image_path", "success": False}
+
+        job_id = job_store.create(job_image_path, callback_url=callback_url, owns_image=owns_image, lane=priority)
+        job_worker.notify()
+        return {"success": True, "jobId": job_id, "status": "queued"}
+    except Exception as e:
+        return {"message": f"Failed to queue job: {str(e)}", "success": False}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll the status and result of a classification job"""
+    job = job_store.get(job_id)
+    if job is None:
+        return {"message": "Job not found", "success": False}
+    return {
+        "success": True,
+        "jobId": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "callbackStatus": job["callback_status"],
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"]
+    }
+
+@app.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Per-lane queue depth and wait times of the inference scheduler and job queue"""
+    return {
+        "scheduler": scheduler.stats(),
+        "jobs": job_store.counts(),
+        "jobs_in_flight": job_worker.in_flight(),
+        "admission": admission.stats(),
+        "breakers": {name: breaker.stats() for name, breaker in breakers.items()}
+    }
+
+# Admin-only debug endpoints are disabled unless ML_ADMIN_TOKEN is set
+admin_token = os.environ.get("ML_ADMIN_TOKEN")
+
+def is_admin(token):
+    return bool(admin_token) and token is not None and hmac.compare_digest(token, admin_token)
+
+@app.get("/debug/profile")
+async def debug_profile(
+    seconds: float = Query(10.0, gt=0, le=120, description="Sampling duration in seconds"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="Sampling interval in milliseconds"),
+    tensorflow: bool = Query(False, description="Also record a TensorFlow profiler trace"),
+    x_admin_token: str = Header(None)
+):
+    """Sample all thread stacks for a while and return them as collapsed stacks (flamegraph input)"""
+    if not is_admin(x_admin_token):
+        return JSONResponse(status_code=403, content={"message": "Admin token required", "success": False})
+    try:
+        loop = asyncio.get_running_loop()
+        collapsed, samples, trace_dir = await loop.run_in_executor(
+            None, profiler.profile, seconds, interval_ms / 1000.0, tensorflow)
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"message": str(e), "success": False})
+    except ImportError:
+        return JSONResponse(status_code=400, content={"message": "TensorFlow is not installed", "success": False})
+
+    headers = {"X-Profile-Samples": str(samples)}
+    if trace_dir:
+        headers["X-TensorFlow-Trace-Dir"] = trace_dir
+    return PlainTextResponse(collapsed, headers=headers)
+
+@app.get("/debug/memory")
+async def debug_memory(
+    top: int = Query(20, ge=0, le=200, description="Allocation sites to list (needs tracemalloc tracing)"),
+    x_admin_token: str = Header(None)
+):
+    """RSS, open file descriptors, threads and temp files, and the allocation sites that grew most"""
+    if not is_admin(x_admin_token):
+        return JSONResponse(status_code=403, content={"message": "Admin token required", "success": False})
+    loop = asyncio.get_running_loop()
+    stats = resource_monitor.process_stats()
+    # Uploaded job images are deleted when their job finishes
+    stats["job_images"] = len(list(jobs_dir.glob("upload-*.jpg")))
+    # Snapshots of a large heap take a while, keep them off the event loop
+    stats["top_allocations"] = await loop.run_in_executor(None, resource_monitor.top_allocations, top) if top else None
+    return stats
+
+@app.post("/debug/memory/baseline")
+async def debug_memory_baseline(
+    frames: int = Query(10, ge=1, le=100, description="Stack frames stored per allocation"),
+    x_admin_token: str = Header(None)
+):
+    """Start tracemalloc tracing if needed and reset the baseline allocation growth is measured from"""
+    if not is_admin(x_admin_token):
+        return JSONResponse(status_code=403, content={"message": "Admin token required", "success": False})
+    baseline_at = await asyncio.get_running_loop().run_in_executor(None, resource_monitor.start_tracing, frames)
+    return {"success": True, "baseline_at": baseline_at}
+
+@app.delete("/debug/memory/baseline")
+async def debug_memory_stop(x_admin_token: str = Header(None)):
+    """Stop tracemalloc tracing (it slows every allocation down)"""
+    if not is_admin(x_admin_token):
+        return JSONResponse(status_code=403, content={"message": "Admin token required", "success": False})
+    resource_monitor.stop_tracing()
+    return {"success": True}
 
 @app.post("/severity")
 async def classify_severity(file: UploadFile = File(...)):
@@ -366,23 +959,121 @@ async def classify_area_type(
     longitude: float = Query(..., description="Longitude coordinate")
 ):
     """Classify the area type based on location"""
-    # In a real implementation, you would use geospatial data and the area type model
-    # For now, we'll simulate the response based on coordinates
-    
-    # Simple heuristic: use latitude/longitude to determine area type
-    # This is just for demonstration - in reality you'd use actual geospatial data
+    if area_index is not None:
+        area_type, confidence, source = area_index.lookup(latitude, longitude)
+        return {
+            "areaType": area_type,
+            "confidence": confidence,
+            "source": source
+        }
     
-    # Simulate different area types based on coordinate patterns
-    areaTypes = ['urban', 'busy', 'residential', 'rural']
-    # Use a simple hash of coordinates to make it deterministic
+    # No land-use index built (see area_index.py): fall back to a deterministic
+    # placeholder derived from the coordinates, with zero confidence
     coordHash = abs((latitude * 1000000 + longitude * 1000000) % 4)
-    area_type = areaTypes[int(coordHash)]
+    area_type = area_types[int(coordHash)]
     
     return {
         "areaType": area_type,
-        "confidence": float(np.random.rand())
+        "confidence": 0.0,
+        "source": "simulated"
+    }
+
+class AreaTypeBatchRequest(BaseModel):
+    latitudes: List[float]
+    longitudes: List[float]
+
+@app.post("/area-type/batch")
+async def classify_area_type_batch(request: AreaTypeBatchRequest):
+    """Classify the area type of many coordinates in one vectorized lookup"""
+    if len(request.latitudes) != len(request.longitudes):
+        return {"message": "latitudes and longitudes must have the same length", "success": False}
+    if area_index is None:
+        return {"message": "Area type index not available", "success": False}
+    
+    names, confidences, sources = area_index.lookup_batch(request.latitudes, request.longitudes)
+    return {
+        "success": True,
+        "results": [
+            {"areaType": name, "confidence": float(confidence), "source": source}
+            for name, confidence, source in zip(names, confidences, sources)
+        ]
     }
 
+@app.post("/similar")
+async def find_similar_complaints(
+    file: UploadFile = File(...),
+    latitude: float = Form(...),
+    longitude: float = Form(...),
+    radius_m: float = Form(100.0),
+    k: int = Form(5),
+    min_similarity: float = Form(0.8)
+):
+    """Find existing complaints with a similar image near the given location"""
+    temp_path = None
+    try:
+        contents = await file.read()
+        temp_path = save_temp_image(contents)
+        # A ResNet50 forward pass; keep it off the event loop
+        embedding = await asyncio.get_running_loop().run_in_executor(None, compute_embedding, temp_path)
+        if embedding is None:
+            return {"message": "No ResNet50 model available for embeddings", "success": False}
+
+        start = time.perf_counter()
+        matches = similarity_index.search(embedding, latitude, longitude, radius_m=radius_m,
+                                          k=k, min_similarity=min_similarity)
+        return {
+            "success": True,
+            "matches": matches,
+            "searchMs": (time.perf_counter() - start) * 1000.0,
+            "indexSize": len(similarity_index)
+        }
+    except Exception as e:
+        return {"message": f"Similarity search failed: {str(e)}", "success": False}
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+@app.post("/similar/add")
+async def add_similar_complaint(
+    file: UploadFile = File(...),
+    complaint_id: str = Form(...),
+    latitude: float = Form(...),
+    longitude: float = Form(...)
+):
+    """Add (or replace) a complaint image in the similarity index"""
+    temp_path = None
+    try:
+        contents = await file.read()
+        temp_path = save_temp_image(contents)
+        loop = asyncio.get_running_loop()
+        embedding = await loop.run_in_executor(None, compute_embedding, temp_path)
+        if embedding is None:
+            return {"message": "No ResNet50 model available for embeddings", "success": False}
+
+        # Appends to the index log on disk
+        await loop.run_in_executor(None, similarity_index.add, complaint_id, embedding, latitude, longitude)
+        return {"success": True, "complaint_id": complaint_id, "indexSize": len(similarity_index)}
+    except Exception as e:
+        return {"message": f"Failed to index complaint: {str(e)}", "success": False}
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+@app.delete("/similar/{complaint_id}")
+async def remove_similar_complaint(complaint_id: str):
+    """Remove a complaint from the similarity index"""
+    removed = await asyncio.get_running_loop().run_in_executor(None, similarity_index.remove, complaint_id)
+    return {"success": removed, "indexSize": len(similarity_index)}
+
+@app.on_event("shutdown")
+async def save_similarity_index():
+    """Write a snapshot of the similarity index on shutdown (changes are logged as they happen)"""
+    try:
+        similarity_index.save(similarity_index_dir)
+        similarity_index.close()
+    except Exception as e:
+        print(f"⚠️  Failed to save similarity index: {e}")
+
 # Additional endpoints for model management
 @app.get("/models/info")
 async def get_models_info():
@@ -390,84 +1081,87 @@ async def get_models_info():
     return {
         "active_model": "combined",  # Using multiple models
         "models": {
+            "multihead": {
+                "available": models.available("multihead"),
+                "resident": models.is_resident("multihead"),
+                "path": "../ml-models/model_weights/resnet50_multihead_model.h5",
+                "purpose": "Shared ResNet50 backbone with civic and garbage heads (replaces resnet50 + garbage_detector)"
+            },
             "resnet50": {
-                "available": resnet50_predictor is not None and resnet50_predictor.is_loaded if resnet50_predictor else False,
+                "available": models.available("resnet50"),
+                "resident": models.is_resident("resnet50"),
                 "path": "../ml-models/model_weights/resnet50_civic_model.h5",
                 "purpose": "Streetlight detection (higher accuracy)"
             },
             "simple_cnn": {
-                "available": simple_cnn_predictor is not None and simple_cnn_predictor.is_loaded if simple_cnn_predictor else False,
+                "available": models.available("simple_cnn"),
+                "resident": models.is_resident("simple_cnn"),
                 "path": "../ml-models/model_weights/simple_cnn_model.pkl",
                 "purpose": "Pothole and garbage detection"
             },
             "garbage_detector": {
-                "available": garbage_predictor is not None and garbage_predictor.is_loaded if garbage_predictor else False,
+                "available": models.available("garbage"),
+                "resident": models.is_resident("garbage"),
                 "path": "../ml-models/model_weights/resnet50_garbage_model.h5",
                 "purpose": "Specialized garbage detection model"
+            },
+            "student": {
+                "available": models.available("student"),
+                "resident": models.is_resident("student"),
+                "path": "../ml-models/model_weights/student_model.h5",
+                "purpose": "Small CNN distilled from the ensemble (serves alone with ML_SERVING_MODEL=student)"
             }
         },
         "classification_model": {
             "name": "Civic Issue Classifier",
             "classes": issue_types,
             "version": "1.0.0",
-            "approach": "Combined model strategy with specialization"
+            "serving": serving_model,
+            "approach": "Log-linear fusion of per-model class probabilities",
+            "fusion": fusion.meta
         },
         "severity_model": {
             "name": "Severity Classifier",
             "classes": severities,
             "version": "1.0.0"
         },
+        "memory": models.stats(),
+        "tensor_cache": tensor_cache.stats() if tensor_cache is not None else None,
+        "explanations": explanation_cache.stats(),
+        "cpu": cpu_settings,
+        "similarity_index": similarity_index.stats(),
+        "jobs": job_store.counts(),
+        "scheduler": scheduler.stats(),
+        "admission": admission.stats(),
+        "breakers": {name: breaker.stats() for name, breaker in breakers.items()},
         "area_type_model": {
             "name": "Area Type Classifier",
             "classes": area_types,
             "version": "1.0.0",
-            "path": "simulated"
+            "path": str(area_index_path) if area_index is not None else "simulated",
+            "cells": len(area_index) if area_index is not None else 0,
+            "cache": area_index.cache_info() if area_index is not None else None
         }
     }
 
 @app.post("/models/reload")
 async def reload_models():
     """Reload all ML models"""
-    global predictor, resnet50_predictor, simple_cnn_predictor, garbage_predictor
     try:
-        # Try to load ResNet50 model first (preferred for streetlight)
-        model_path = script_dir.parent / "ml-models" / "model_weights" / "resnet50_civic_model.h5"
-        class_indices_path = script_dir.parent / "ml-models" / "model_weights" / "class_indices.npy"
-        if model_path.exists() and class_indices_path.exists() and ResNet50Predictor:
-            resnet50_predictor = ResNet50Predictor(str(model_path), str(class_indices_path))
-            if resnet50_predictor.is_loaded:
-                predictor = resnet50_predictor
-                return {"message": "ResNet50 model reloaded successfully", "success": True, "model": "ResNet50"}
-            else:
-                return {"message": f"Failed to load ResNet50 model from {model_path}", "success": False}
-        elif SimpleCNNPredictor:
-            # If ResNet50 failed, try SimpleCNN model
-            model_path = script_dir.parent / "ml-models" / "model_weights" / "simple_cnn_model.pkl"
-            if model_path.exists():
-                simple_cnn_predictor = SimpleCNNPredictor(str(model_path), silent=True)
-                if simple_cnn_predictor.is_loaded:
-                    predictor = simple_cnn_predictor
-                    return {"message": "SimpleCNN model reloaded successfully", "success": True, "model": "SimpleCNN"}
-                else:
-                    return {"message": f"Failed to load SimpleCNN model from {model_path}", "success": False}
-            else:
-                return {"message": f"Model file not found at {model_path}", "success": False}
-        elif GarbagePredictor:
-            # Try to load garbage-specific model
-            model_path = script_dir.parent / "ml-models" / "model_weights" / "resnet50_garbage_model.h5"
-            class_indices_path = script_dir.parent / "ml-models" / "model_weights" / "garbage_class_indices.npy"
-            if model_path.exists() and GarbagePredictor:
-                garbage_predictor = GarbagePredictor(str(model_path), str(class_indices_path))
-                if garbage_predictor.is_loaded:
-                    return {"message": "Garbage detection model reloaded successfully", "success": True, "model": "GarbageDetector"}
-                else:
-                    return {"message": f"Failed to load Garbage detection model from {model_path}", "success": False}
-            else:
-                return {"message": "No model predictors available", "success": False}
-        else:
+        # Drop idle models and load failures; each model is reloaded from disk on its next use
+        models.unload_all()
+        await asyncio.get_running_loop().run_in_executor(None, preload_models)
+        loaded = [name for name, info in models.stats()["models"].items() if info["state"] == "resident"]
+        if not loaded:
             return {"message": "No model predictors available", "success": False}
+        return {"message": f"Models reloaded successfully: {', '.join(loaded)}", "success": True, "models": loaded}
     except Exception as e:
         return {"message": f"Failed to reload models: {str(e)}", "success": False}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = cpu_settings["workers"]
+    if workers > 1:
+        # Each worker process re-imports this module and pins itself to its own CPU slice on startup
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
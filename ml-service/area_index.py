@@ -0,0 +1,271 @@
+"""
+Offline area-type classifier backed by a land-use grid index
+The index is built once from an OpenStreetMap extract exported to GeoJSON
+(no network access at serve time), e.g.:
+
+    osmium tags-filter city.osm.pbf wr/landuse wr/leisure=park wr/natural=wood -o landuse.osm.pbf
+    osmium export landuse.osm.pbf -o landuse.geojson
+    python area_index.py build --geojson landuse.geojson
+
+Land-use polygons are rasterised into a fixed lat/lon grid. Each cell stores
+the majority area type of a few sample points and the share of samples that
+agreed (the confidence). Lookups are a binary search over the sorted cell keys
+behind a bounded LRU; lookup_batch() does the same for whole coordinate arrays.
+"""
+import argparse
+import functools
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+AREA_TYPES = ['urban', 'busy', 'residential', 'rural']
+
+# OSM tag (key, value) -> area type
+OSM_AREA_TYPES = {
+    ("landuse", "residential"): "residential",
+    ("landuse", "commercial"): "busy",
+    ("landuse", "retail"): "busy",
+    ("amenity", "marketplace"): "busy",
+    ("landuse", "industrial"): "urban",
+    ("landuse", "construction"): "urban",
+    ("landuse", "institutional"): "urban",
+    ("landuse", "education"): "urban",
+    ("landuse", "religious"): "urban",
+    ("landuse", "railway"): "urban",
+    ("landuse", "garages"): "urban",
+    ("landuse", "brownfield"): "urban",
+    ("leisure", "park"): "urban",
+    ("landuse", "farmland"): "rural",
+    ("landuse", "farmyard"): "rural",
+    ("landuse", "forest"): "rural",
+    ("landuse", "meadow"): "rural",
+    ("landuse", "orchard"): "rural",
+    ("landuse", "vineyard"): "rural",
+    ("landuse", "allotments"): "rural",
+    ("landuse", "greenhouse_horticulture"): "rural",
+    ("landuse", "plant_nursery"): "rural",
+    ("natural", "wood"): "rural",
+    ("natural", "scrub"): "rural",
+    ("natural", "grassland"): "rural",
+    ("natural", "wetland"): "rural",
+}
+
+METERS_PER_DEGREE = 111320.0
+# Cell keys are row * KEY_STRIDE + col
+KEY_STRIDE = 1 << 32
+# Sample points per cell side when rasterising
+SAMPLES_PER_SIDE = 3
+NEIGHBOR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def osm_area_type(properties):
+    """Map OSM feature tags to an area type, or None if the feature is not land use"""
+    tags = properties.get("tags", properties)
+    for (key, value), area_type in OSM_AREA_TYPES.items():
+        if tags.get(key) == value:
+            return area_type
+    return None
+
+
+def points_in_polygon(lons, lats, rings):
+    """Even-odd ray casting for arrays of points against a polygon with holes"""
+    inside = np.zeros(len(lons), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)
+        x1, y1 = ring[:-1, 0], ring[:-1, 1]
+        x2, y2 = ring[1:, 0], ring[1:, 1]
+        # Chunk points so the points x edges matrices stay small
+        for start in range(0, len(lons), 4096):
+            px = lons[start:start + 4096, None]
+            py = lats[start:start + 4096, None]
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_at = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            hits = np.count_nonzero(crosses & (px < x_at), axis=1)
+            inside[start:start + 4096] ^= (hits % 2).astype(bool)
+    return inside
+
+
+def iter_polygons(geometry):
+    """Yield the rings of each polygon in a GeoJSON Polygon/MultiPolygon geometry"""
+    if geometry is None:
+        return
+    if geometry["type"] == "Polygon":
+        yield geometry["coordinates"]
+    elif geometry["type"] == "MultiPolygon":
+        for polygon in geometry["coordinates"]:
+            yield polygon
+
+
+def build_index(geojson_path, output_path, cell_size_m=250.0):
+    """Rasterise land-use polygons from a GeoJSON file into a grid index"""
+    with open(geojson_path, 'r') as f:
+        features = json.load(f).get("features", [])
+
+    cell_deg = cell_size_m / METERS_PER_DEGREE
+    votes = {}
+    used = 0
+    offsets = (np.arange(SAMPLES_PER_SIDE) + 0.5) / SAMPLES_PER_SIDE
+
+    for feature in features:
+        area_type = osm_area_type(feature.get("properties") or {})
+        if area_type is None:
+            continue
+        type_index = AREA_TYPES.index(area_type)
+        for rings in iter_polygons(feature.get("geometry")):
+            exterior = np.asarray(rings[0], dtype=np.float64)
+            min_lon, min_lat = exterior.min(axis=0)
+            max_lon, max_lat = exterior.max(axis=0)
+            rows = np.arange(math.floor((min_lat + 90.0) / cell_deg), math.floor((max_lat + 90.0) / cell_deg) + 1)
+            cols = np.arange(math.floor((min_lon + 180.0) / cell_deg), math.floor((max_lon + 180.0) / cell_deg) + 1)
+
+            # Sample points on a regular sub-grid inside every candidate cell
+            sample_rows = (rows[:, None] + offsets[None, :]).reshape(-1)
+            sample_cols = (cols[:, None] + offsets[None, :]).reshape(-1)
+            grid_lat, grid_lon = np.meshgrid(sample_rows * cell_deg - 90.0, sample_cols * cell_deg - 180.0,
+                                             indexing='ij')
+            inside = points_in_polygon(grid_lon.reshape(-1), grid_lat.reshape(-1), rings)
+            if not inside.any():
+                continue
+
+            hit_rows = np.repeat(rows, SAMPLES_PER_SIDE)[:, None].repeat(len(sample_cols), axis=1).reshape(-1)
+            hit_cols = np.tile(np.repeat(cols, SAMPLES_PER_SIDE), len(sample_rows))
+            keys = hit_rows[inside].astype(np.int64) * KEY_STRIDE + hit_cols[inside].astype(np.int64)
+            unique_keys, counts = np.unique(keys, return_counts=True)
+            for key, count in zip(unique_keys.tolist(), counts.tolist()):
+                cell_votes = votes.get(key)
+                if cell_votes is None:
+                    cell_votes = votes[key] = np.zeros(len(AREA_TYPES), dtype=np.int32)
+                cell_votes[type_index] += count
+            used += 1
+
+    keys = np.array(sorted(votes), dtype=np.int64)
+    vote_matrix = np.stack([votes[key] for key in keys.tolist()]) if len(keys) else np.zeros((0, len(AREA_TYPES)))
+    classes = vote_matrix.argmax(axis=1).astype(np.uint8) if len(keys) else np.zeros(0, dtype=np.uint8)
+    samples = SAMPLES_PER_SIDE * SAMPLES_PER_SIDE
+    confidence = np.minimum(vote_matrix.max(axis=1) / samples, 1.0) if len(keys) else np.zeros(0)
+
+    np.savez_compressed(output_path, keys=keys, classes=classes,
+                        confidence=(confidence * 255).round().astype(np.uint8),
+                        cell_deg=np.float64(cell_deg), area_types=np.array(AREA_TYPES))
+    print(f"Built area index from {used} polygons: {len(keys)} cells of {cell_size_m:.0f} m -> {output_path}")
+
+
+class AreaTypeIndex:
+    """Grid lookup of the area type at a coordinate"""
+
+    def __init__(self, index_path, cache_size=65536, default_type="urban"):
+        data = np.load(index_path)
+        self.keys = data["keys"]
+        self.classes = data["classes"]
+        self.confidence = data["confidence"].astype(np.float32) / 255.0
+        self.cell_deg = float(data["cell_deg"])
+        self.area_types = [str(t) for t in data["area_types"]]
+        self.default_type = default_type
+        self.path = str(index_path)
+        self._lookup_cell = functools.lru_cache(maxsize=cache_size)(self._lookup_cell_uncached)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _cells(self, latitudes, longitudes):
+        rows = np.floor((np.asarray(latitudes, dtype=np.float64) + 90.0) / self.cell_deg).astype(np.int64)
+        cols = np.floor((np.asarray(longitudes, dtype=np.float64) + 180.0) / self.cell_deg).astype(np.int64)
+        return rows, cols
+
+    def _find(self, keys):
+        """Positions of keys in the index and a mask of which were found"""
+        positions = np.searchsorted(self.keys, keys)
+        positions = np.minimum(positions, max(len(self.keys) - 1, 0))
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(np.shape(keys), dtype=bool)
+        return positions, found
+
+    def _lookup_cell_uncached(self, row, col):
+        result = self.lookup_cells(np.array([row]), np.array([col]))
+        return result[0][0], float(result[1][0]), result[2][0]
+
+    def lookup(self, latitude, longitude):
+        """Area type of one coordinate as (area_type, confidence, source)"""
+        rows, cols = self._cells(latitude, longitude)
+        return self._lookup_cell(int(rows), int(cols))
+
+    def lookup_batch(self, latitudes, longitudes):
+        """Vectorised lookup for arrays of coordinates"""
+        rows, cols = self._cells(latitudes, longitudes)
+        return self.lookup_cells(np.atleast_1d(rows), np.atleast_1d(cols))
+
+    def lookup_cells(self, rows, cols):
+        """Look up grid cells, falling back to a vote of the 8 neighbours for empty cells
+
+        Returns (area types, confidences, sources) where source is 'index',
+        'neighbors' or 'default'.
+        """
+        n = len(rows)
+        types = np.full(n, -1, dtype=np.int64)
+        confidence = np.zeros(n, dtype=np.float32)
+        sources = np.full(n, "default", dtype=object)
+        if not len(self.keys):
+            return [self.default_type] * n, confidence, sources
+
+        positions, found = self._find(rows * KEY_STRIDE + cols)
+        types[found] = self.classes[positions[found]]
+        confidence[found] = self.confidence[positions[found]]
+        sources[found] = "index"
+
+        missing = np.nonzero(~found)[0]
+        if len(missing):
+            neighbor_votes = np.zeros((len(missing), len(self.area_types)), dtype=np.float32)
+            for d_row, d_col in NEIGHBOR_OFFSETS:
+                keys = (rows[missing] + d_row) * KEY_STRIDE + cols[missing] + d_col
+                positions, hit = self._find(keys)
+                hit_rows = np.nonzero(hit)[0]
+                np.add.at(neighbor_votes, (hit_rows, self.classes[positions[hit]]), self.confidence[positions[hit]])
+            has_votes = neighbor_votes.sum(axis=1) > 0
+            fallback = missing[has_votes]
+            types[fallback] = neighbor_votes[has_votes].argmax(axis=1)
+            # Neighbour evidence is weaker than a direct hit
+            confidence[fallback] = neighbor_votes[has_votes].max(axis=1) / len(NEIGHBOR_OFFSETS)
+            sources[fallback] = "neighbors"
+
+        names = [self.area_types[t] if t >= 0 else self.default_type for t in types.tolist()]
+        return names, confidence, sources
+
+    def cache_info(self):
+        """LRU statistics of single lookups"""
+        info = self._lookup_cell.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+def main():
+    """Build or query the area-type index"""
+    default_index = Path(__file__).parent.parent / "ml-models" / "model_weights" / "area_index.npz"
+    parser = argparse.ArgumentParser(description="Offline area-type grid index")
+    subparsers = parser.add_subparsers(dest="command")
+
+    build_parser = subparsers.add_parser("build", help="Build the index from a land-use GeoJSON extract")
+    build_parser.add_argument("--geojson", required=True)
+    build_parser.add_argument("--output", default=str(default_index))
+    build_parser.add_argument("--cell_m", type=float, default=250.0, help="Grid cell size in meters")
+
+    lookup_parser = subparsers.add_parser("lookup", help="Look up one coordinate")
+    lookup_parser.add_argument("--index", default=str(default_index))
+    lookup_parser.add_argument("--lat", type=float, required=True)
+    lookup_parser.add_argument("--lon", type=float, required=True)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        build_index(args.geojson, args.output, cell_size_m=args.cell_m)
+    elif args.command == "lookup":
+        index = AreaTypeIndex(args.index)
+        area_type, confidence, source = index.lookup(args.lat, args.lon)
+        print(f"{area_type} (confidence {confidence:.2f}, {source})")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,297 @@
+"""
+Autotune the ML service's batching and CPU settings for this host
+The best micro-batch size, batch wait, TensorFlow/BLAS thread count and
+number of worker processes depend on the host's CPUs and on the models
+app.py loads, so they are measured rather than guessed:
+
+- every (workers, threads) pair that fits the effective CPUs (see
+  cpu_config.py) starts that many trial processes, each importing app.py with
+  the thread count, so the real model mix, ensemble and scheduler run
+- inside the trial processes every (batch size, batch wait) pair runs for
+  --duration seconds in lock step, with --concurrency closed-loop clients per
+  process submitting images to the interactive lane
+
+Throughput is summed over the workers and the p99 taken over all their
+requests. The highest-throughput setting whose p99 stays within --p99_ms is
+written to autotune.json (or ML_AUTOTUNE_CONFIG), which cpu_config.py and
+app.py load at startup; explicitly set environment variables still win.
+
+Run it while the service is stopped, it needs the same CPUs.
+
+Usage:
+    python autotune.py
+    python autotune.py --duration 20 --batch_sizes 1,2,4,8,16 --wait_ms 0,2,5,10 --p99_ms 800
+    python autotune.py --images "../server/uploads/*.jpg"
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import cpu_config
+
+script_dir = Path(__file__).parent
+
+# Seconds between the measurement windows of two batch settings
+WINDOW_GAP = 1.0
+
+
+def int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def float_list(text):
+    return [float(value) for value in text.split(",") if value.strip()]
+
+
+def synthetic_images(directory, count=16, size=(1024, 768), seed=0):
+    """JPEGs of smooth random scenes with sensor-like noise, a stand-in for complaint photos"""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        coarse = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize(size, Image.BICUBIC)
+        noisy = np.asarray(coarse, dtype=np.float32) + rng.normal(0.0, 12.0, (size[1], size[0], 3))
+        path = os.path.join(directory, f"synthetic-{i}.jpg")
+        Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def closed_loop(submit, images, concurrency, warmup, duration):
+    """(latencies in the measured window, failures) of concurrent clients each waiting for its last result"""
+    now = time.perf_counter()
+    measure_from = now + warmup
+    stop_at = measure_from + duration
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def client(index):
+        k = index
+        while True:
+            started = time.perf_counter()
+            if started >= stop_at:
+                return
+            try:
+                result = submit((images[k % len(images)], {"quality_checked": True}), "interactive").result()
+                failed = bool(result.get("skipped"))
+            except Exception:
+                failed = True
+            ended = time.perf_counter()
+            with lock:
+                if started >= measure_from and ended <= stop_at:
+                    latencies.append(ended - started)
+                    failures[0] += failed
+            k += concurrency
+
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, failures[0]
+
+
+def trial_environment(workers, threads):
+    """Environment of a trial process; thread counts must be set before it imports NumPy"""
+    env = dict(os.environ)
+    for var in cpu_config.BLAS_ENV_VARS:
+        env[var] = str(threads)
+    env["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    env["TF_NUM_INTEROP_THREADS"] = str(min(2, threads))
+    env["ML_CPU_THREADS"] = str(threads)
+    env["ML_WORKERS"] = str(workers)
+    # Measure the settings under test, not a previous tuning run
+    env["ML_AUTOTUNE_CONFIG"] = ""
+    # Slow members must not be bypassed by their circuit breakers while being measured
+    env["ML_MODEL_LATENCY_BUDGETS_MS"] = "multihead=1e9,resnet50=1e9,simple_cnn=1e9,garbage=1e9"
+    return env
+
+
+def run_trial(args):
+    """Trial process: load app.py with the environment's thread count and measure every batch setting"""
+    import app
+
+    # Pin like a serving worker would on startup
+    app.cpu_config.pin_worker(app.cpu_settings)
+    app.preload_models()
+    app.scheduler.start()
+    images = json.loads(Path(args.images_file).read_text())
+    # One warm-up pass so lazy initialisation is not measured
+    for image in images[:2]:
+        app.scheduler.submit((image, {"quality_checked": True}), "interactive").result()
+    Path(args.trial_output + ".ready").touch()
+
+    start_at = float(sys.stdin.readline())
+    combos = list(itertools.product(int_list(args.batch_sizes), float_list(args.wait_ms)))
+    results = []
+    for k, (batch_size, wait_ms) in enumerate(combos):
+        app.scheduler.configure(max_wait_ms=wait_ms, batch_sizes={"interactive": batch_size})
+        window = start_at + k * (args.warmup + args.duration + WINDOW_GAP)
+        time.sleep(max(0.0, window - time.time()))
+        latencies, failures = closed_loop(app.scheduler.submit, images, args.concurrency, args.warmup, args.duration)
+        results.append({"batch_size": batch_size, "wait_ms": wait_ms, "latencies": latencies, "failures": failures})
+    app.scheduler.stop()
+
+    models = [name for name, info in app.models.stats()["models"].items() if info["state"] == "resident"]
+    Path(args.trial_output).write_text(json.dumps({"models": models, "results": results}))
+
+
+def run_setting(args, workers, threads, images_file, work_dir):
+    """Start `workers` trial processes with `threads` threads each; rows per batch setting, models"""
+    outputs = [os.path.join(work_dir, f"trial-{workers}x{threads}-{i}.json") for i in range(workers)]
+    processes = []
+    for output in outputs:
+        command = [sys.executable, __file__, "--trial", "--workers", str(workers), "--threads", str(threads),
+                   "--images_file", images_file, "--trial_output", output, "--batch_sizes", args.batch_sizes,
+                   "--wait_ms", args.wait_ms, "--duration", str(args.duration), "--warmup", str(args.warmup),
+                   "--concurrency", str(args.concurrency)]
+        processes.append(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                          cwd=str(script_dir), env=trial_environment(workers, threads), text=True))
+    try:
+        deadline = time.time() + args.startup_timeout
+        while not all(os.path.exists(output + ".ready") for output in outputs):
+            if time.time() > deadline or any(process.poll() is not None for process in processes):
+                raise RuntimeError(f"Trial processes for {workers}x{threads} failed to start")
+            time.sleep(0.5)
+        # Start every worker's measurement windows at the same moment
+        start_at = f"{time.time() + 2.0}\n"
+        for process in processes:
+            process.stdin.write(start_at)
+            process.stdin.flush()
+        for process in processes:
+            if process.wait() != 0:
+                raise RuntimeError(f"A trial process for {workers}x{threads} exited with {process.returncode}")
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+    trials = [json.loads(Path(output).read_text()) for output in outputs]
+    rows = []
+    for k, first in enumerate(trials[0]["results"]):
+        latencies = np.concatenate([np.asarray(trial["results"][k]["latencies"]) for trial in trials]) * 1000.0
+        failures = sum(trial["results"][k]["failures"] for trial in trials)
+        rows.append({
+            "workers": workers,
+            "threads": threads,
+            "batch_size": first["batch_size"],
+            "wait_ms": first["wait_ms"],
+            "requests": int(len(latencies)),
+            "throughput": len(latencies) / args.duration,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "failures": failures,
+        })
+    return rows, trials[0]["models"]
+
+
+def best_setting(rows, p99_ms):
+    """Highest throughput within the p99 budget, else the lowest p99"""
+    # Failed or partial-ensemble answers are cheaper than real ones, so settings with many are not comparable
+    measured = [row for row in rows if row["requests"] and row["failures"] <= 0.01 * row["requests"]]
+    within = [row for row in measured if row["p99_ms"] <= p99_ms]
+    if within:
+        return max(within, key=lambda row: (row["throughput"], -row["p99_ms"])), True
+    if measured:
+        return min(measured, key=lambda row: row["p99_ms"]), False
+    return None, False
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Measure and save the best batching and CPU settings for this host")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker counts (default: 1,2,4,...)")
+    parser.add_argument("--threads", default=None, help="Comma-separated threads per worker (default: 1,2,4,...)")
+    parser.add_argument("--batch_sizes", default="1,2,4,8,16")
+    parser.add_argument("--wait_ms", default="0,2,5,10", help="Comma-separated batch wait times")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop clients per worker")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per setting")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each setting")
+    parser.add_argument("--p99_ms", type=float, default=float(os.environ.get("ML_TARGET_LATENCY_MS", "1000")),
+                        help="p99 latency budget of the chosen setting")
+    parser.add_argument("--images", default=None, help="Glob of sample images (default: synthetic photos)")
+    parser.add_argument("--startup_timeout", type=float, default=600.0, help="Seconds to wait for models to load")
+    parser.add_argument("--output", default=os.environ.get("ML_AUTOTUNE_CONFIG") or str(script_dir / "autotune.json"))
+    parser.add_argument("--trial", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--images_file", help=argparse.SUPPRESS)
+    parser.add_argument("--trial_output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        run_trial(args)
+        return
+
+    print("Civic Connect - ML Service Autotune")
+    print("=" * 45)
+    effective = cpu_config.plan(workers=1, pin="none")["effective_cpus"]
+    powers = [2 ** i for i in range(effective.bit_length()) if 2 ** i <= effective]
+    workers_list = int_list(args.workers) if args.workers else powers
+    threads_list = int_list(args.threads) if args.threads else sorted(set(powers + [effective]))
+    settings = [(w, t) for w in workers_list for t in threads_list if w * t <= effective]
+    combos = len(int_list(args.batch_sizes)) * len(float_list(args.wait_ms))
+    print(f"{effective} effective CPUs; {len(settings)} worker/thread settings x {combos} batch settings, "
+          f"about {len(settings) * combos * (args.duration + args.warmup + WINDOW_GAP) / 60:.0f} min plus model loading")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        images = sorted(glob.glob(args.images)) if args.images else synthetic_images(work_dir)
+        if not images:
+            parser.error(f"No images match {args.images}")
+        images_file = os.path.join(work_dir, "images.json")
+        Path(images_file).write_text(json.dumps([os.path.abspath(image) for image in images]))
+
+        rows = []
+        models = []
+        for workers, threads in settings:
+            print(f"\n{workers} worker(s) x {threads} thread(s)")
+            try:
+                setting_rows, models = run_setting(args, workers, threads, images_file, work_dir)
+            except RuntimeError as e:
+                print(f"  ⚠️  {e}")
+                continue
+            for row in setting_rows:
+                p99 = f"{row['p99_ms']:8.1f}" if row["p99_ms"] is not None else "     n/a"
+                print(f"  batch {row['batch_size']:>3}  wait {row['wait_ms']:>5.1f} ms  "
+                      f"{row['throughput']:7.2f} img/s  p99 {p99} ms  failures {row['failures']}")
+            rows.extend(setting_rows)
+
+    best, within_budget = best_setting(rows, args.p99_ms)
+    if best is None:
+        print("\n❌ No setting completed any request")
+        sys.exit(1)
+    if not within_budget:
+        print(f"\n⚠️  No setting met the p99 budget of {args.p99_ms:.0f} ms; saving the lowest-latency one")
+
+    batch_size = best["batch_size"]
+    config = {
+        "tuned_at": time.time(),
+        "effective_cpus": effective,
+        "models": models,
+        "workers": best["workers"],
+        "threads": best["threads"],
+        # Lower lanes keep smaller batches so they delay interactive requests less (see scheduler.py)
+        "batch_sizes": {"interactive": batch_size, "admin": batch_size, "bulk": max(1, batch_size // 2)},
+        "max_wait_ms": best["wait_ms"],
+        "p99_budget_ms": args.p99_ms,
+        "measured": best,
+        "trials": rows,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"\n✅ {best['workers']} worker(s) x {best['threads']} thread(s), batch {batch_size}, "
+          f"wait {best['wait_ms']:.1f} ms: {best['throughput']:.2f} img/s, p99 {best['p99_ms']:.1f} ms")
+    print(f"Saved to {args.output}; the service loads it at startup")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Batch prediction over preprocessed tensors
+Runs the available predictors over whole batches of canonical uint8 tensors
+(see tensor_cache.py) and returns the per-image model results in fusion model
+order, ready for EnsembleFusion.decide().
+"""
+import time
+
+import numpy as np
+
+from fusion import FUSION_MODELS
+from tensor_cache import to_float
+
+
+def predict_batch(predictor, img_batch):
+    """Per-image result dicts from a predictor for a preprocessed float32 batch
+
+    Predictors without predict_batch (e.g. GarbagePredictor) are run through
+    their Keras model and class_names mapping directly.
+    """
+    if hasattr(predictor, "predict_batch"):
+        return predictor.predict_batch(img_batch)
+    predictions = predictor.model.predict(img_batch, verbose=0)
+    class_names = predictor.class_names
+    results = []
+    for probabilities in predictions:
+        best = int(np.argmax(probabilities))
+        results.append({
+            "class": class_names[best],
+            "confidence": float(probabilities[best]),
+            "all_predictions": {name: float(probabilities[idx]) for idx, name in class_names.items()}
+        })
+    return results
+
+
+def score_batch(predictors, tensors, timings=None):
+    """Model results for a batch of canonical tensors ({"224": ..., "64": ...} uint8 arrays)
+
+    predictors maps "multihead", "resnet50", "garbage" and "simple_cnn" to loaded
+    predictors; missing models yield None entries. If timings is a dict, the
+    seconds each predictor spent on the batch are appended to timings[name].
+    """
+    def timed(name, run):
+        started = time.perf_counter()
+        results = run()
+        if timings is not None:
+            timings.setdefault(name, []).append(time.perf_counter() - started)
+        return results
+
+    n = len(next(iter(tensors.values())))
+    by_model = {name: [None] * n for name in FUSION_MODELS}
+    large = to_float(tensors["224"]) if any(name in predictors for name in ("multihead", "resnet50", "garbage")) else None
+
+    if "multihead" in predictors:
+        for i, output in enumerate(timed("multihead", lambda: predictors["multihead"].predict_batch(large))):
+            by_model["resnet50"][i] = output.get("civic")
+            by_model["garbage"][i] = output.get("garbage")
+    for name in ("resnet50", "garbage"):
+        if name in predictors:
+            by_model[name] = timed(name, lambda: predict_batch(predictors[name], large))
+    if "simple_cnn" in predictors:
+        small = to_float(tensors["64"])
+        by_model["simple_cnn"] = timed("simple_cnn", lambda: predict_batch(predictors["simple_cnn"], small))
+
+    return [[by_model[name][i] for name in FUSION_MODELS] for i in range(n)]
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Build the multi-head ResNet50 model from the existing civic and garbage models
+The civic model's ResNet50 backbone (up to global average pooling) is kept
+once and both classification heads are attached to its pooled embedding.
+
+By default the garbage head is copied from resnet50_garbage_model.h5. That is
+exact only when both models were trained on the same (frozen) backbone; the
+script checks this and otherwise recommends --retrain_garbage, which fits a
+fresh garbage head on frozen backbone features computed once per image.
+
+Usage:
+    python build_multihead.py
+    python build_multihead.py --retrain_garbage --data ../data/shards/224
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Activation, GlobalAveragePooling2D, Input
+from tensorflow.keras.models import Model
+
+script_dir = Path(__file__).parent
+weights_dir = script_dir.parent / "ml-models" / "model_weights"
+
+# Dataset helpers live with the data preparation scripts
+sys.path.insert(0, str(script_dir.parent / "scripts"))
+
+
+def split_model(model):
+    """Split a trained classifier into its pooled-embedding backbone and head layers"""
+    pool_index = None
+    for i, layer in enumerate(model.layers):
+        if isinstance(layer, GlobalAveragePooling2D):
+            pool_index = i
+        elif isinstance(layer, Model) and len(layer.output_shape) == 2:
+            # ResNet50(pooling='avg') nested as a single layer
+            pool_index = i
+    if pool_index is None:
+        raise ValueError(f"Could not find the pooling layer of {model.name}")
+
+    backbone = Model(model.input, model.layers[pool_index].get_output_at(-1), name="backbone")
+    return backbone, model.layers[pool_index + 1:]
+
+
+def attach_head(features, head_layers, name, reinitialize=False):
+    """Re-create a sequential head on new features, copying weights unless reinitialized"""
+    x = features
+    for i, layer in enumerate(head_layers):
+        config = layer.get_config()
+        # Name the final layer after the head so it becomes the model output name
+        config["name"] = name if i == len(head_layers) - 1 else f"{name}_{layer.name}"
+        new_layer = layer.__class__.from_config(config)
+        x = new_layer(x)
+        if not reinitialize:
+            new_layer.set_weights(layer.get_weights())
+    return x
+
+
+def backbones_match(backbone_a, backbone_b):
+    """Check whether two backbones carry identical weights"""
+    weights_a = backbone_a.get_weights()
+    weights_b = backbone_b.get_weights()
+    return len(weights_a) == len(weights_b) and all(np.array_equal(a, b) for a, b in zip(weights_a, weights_b))
+
+
+def load_class_indices(path):
+    """Load a class_indices.npy file as {class_name: index}"""
+    return {name: int(idx) for name, idx in np.load(path, allow_pickle=True).item().items()}
+
+
+def garbage_label(class_name, class_indices):
+    """Map a dataset class to a garbage-head label, or None to skip the sample"""
+    if class_name in class_indices:
+        return class_indices[class_name]
+    # Binary garbage heads: every other civic class is a negative example
+    negatives = [name for name in class_indices if "garbage" not in name.lower()]
+    if len(class_indices) == 2 and len(negatives) == 1:
+        return class_indices[negatives[0]]
+    return None
+
+
+def iter_image_batches(data, split, batch_size):
+    """Yield (float32 images, class names) from a shard pack or a split manifest/directory"""
+    from shard_dataset import PACK_MANIFEST_NAME, ShardDataset, collect_samples, load_image, to_float
+
+    data = Path(data)
+    if (data / PACK_MANIFEST_NAME).exists():
+        dataset = ShardDataset(data, split)
+        for images, labels in dataset.batches(batch_size, shuffle=False):
+            yield to_float(images), [dataset.classes[label] for label in labels]
+        return
+
+    if data.suffix == ".json":
+        from prepare_data import load_split_manifest
+        samples = load_split_manifest(data).get(split, [])
+    else:
+        samples = collect_samples(data).get(split, [])
+    for offset in range(0, len(samples), batch_size):
+        chunk = samples[offset:offset + batch_size]
+        images = np.stack([load_image(path, 224) for path, _ in chunk])
+        yield to_float(images), [class_name for _, class_name in chunk]
+
+
+def compute_embeddings(backbone, data, split, class_indices, batch_size=64):
+    """Run the frozen backbone once over a split, returning (embeddings, labels)"""
+    embeddings = []
+    labels = []
+    for images, class_names in iter_image_batches(data, split, batch_size):
+        batch_labels = [garbage_label(name, class_indices) for name in class_names]
+        keep = [i for i, label in enumerate(batch_labels) if label is not None]
+        if not keep:
+            continue
+        features = backbone.predict(images[keep], verbose=0)
+        embeddings.append(features)
+        labels.extend(batch_labels[i] for i in keep)
+    if not embeddings:
+        return None, None
+    return np.concatenate(embeddings), np.asarray(labels)
+
+
+def retrain_head(head_layers, embeddings, labels, val_data=None, epochs=10):
+    """Fit a freshly initialized copy of a head on cached embeddings"""
+    inputs = Input(shape=(embeddings.shape[1],))
+    head = Model(inputs, attach_head(inputs, head_layers, "garbage", reinitialize=True), name="garbage_head")
+    head.compile(optimizer="adam", loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+    head.fit(embeddings, labels, epochs=epochs, batch_size=64, validation_data=val_data, verbose=2)
+    return head
+
+
+def build_multihead(civic_model_path, civic_indices_path, garbage_model_path, garbage_indices_path,
+                    output_path, heads_path, data=None, retrain_garbage=False, epochs=10):
+    """Build and save the multi-head model and its heads description"""
+    print(f"Loading civic model from {civic_model_path}")
+    civic_model = tf.keras.models.load_model(civic_model_path)
+    print(f"Loading garbage model from {garbage_model_path}")
+    garbage_model = tf.keras.models.load_model(garbage_model_path)
+
+    civic_backbone, civic_head = split_model(civic_model)
+    garbage_backbone, garbage_head = split_model(garbage_model)
+    civic_backbone.trainable = False
+    civic_indices = load_class_indices(civic_indices_path)
+    garbage_indices = load_class_indices(garbage_indices_path)
+
+    inputs = Input(shape=civic_model.input_shape[1:])
+    features = civic_backbone(inputs)
+    embedding = Activation("linear", name="embedding")(features)
+    civic_output = attach_head(embedding, civic_head, "civic")
+
+    if retrain_garbage:
+        if data is None:
+            raise ValueError("--retrain_garbage needs --data")
+        print("Computing backbone embeddings for the garbage head...")
+        train_x, train_y = compute_embeddings(civic_backbone, data, "train", garbage_indices)
+        if train_x is None:
+            raise ValueError(f"No usable training images found in {data}")
+        val_x, val_y = compute_embeddings(civic_backbone, data, "val", garbage_indices)
+        val_data = (val_x, val_y) if val_x is not None else None
+        trained = retrain_head(garbage_head, train_x, train_y, val_data, epochs=epochs)
+        garbage_output = trained(embedding)
+        garbage_output = Activation("linear", name="garbage")(garbage_output)
+    else:
+        if not backbones_match(civic_backbone, garbage_backbone):
+            print("⚠️  The garbage model was fine-tuned on a different backbone; its copied head")
+            print("   may lose accuracy. Consider --retrain_garbage --data <dataset>.")
+        garbage_output = attach_head(embedding, garbage_head, "garbage")
+
+    multihead = Model(inputs, [embedding, civic_output, garbage_output], name="multihead_resnet50")
+    multihead.save(output_path)
+
+    heads_info = {
+        "input_size": list(civic_model.input_shape[1:3]),
+        "embedding_dim": int(embedding.shape[-1]),
+        "heads": {
+            "civic": {"class_indices": civic_indices, "source": Path(civic_model_path).name},
+            "garbage": {"class_indices": garbage_indices, "source": Path(garbage_model_path).name,
+                        "retrained": bool(retrain_garbage)},
+        },
+    }
+    with open(heads_path, 'w') as f:
+        json.dump(heads_info, f, indent=2)
+
+    single_params = civic_model.count_params() + garbage_model.count_params()
+    print(f"✅ Multi-head model saved to {output_path}")
+    print(f"   Parameters: {multihead.count_params():,} (was {single_params:,} across two models)")
+    return multihead
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Build the shared-backbone multi-head ResNet50 model")
+    parser.add_argument("--civic_model", default=str(weights_dir / "resnet50_civic_model.h5"))
+    parser.add_argument("--civic_indices", default=str(weights_dir / "class_indices.npy"))
+    parser.add_argument("--garbage_model", default=str(weights_dir / "resnet50_garbage_model.h5"))
+    parser.add_argument("--garbage_indices", default=str(weights_dir / "garbage_class_indices.npy"))
+    parser.add_argument("--output", default=str(weights_dir / "resnet50_multihead_model.h5"))
+    parser.add_argument("--heads", default=str(weights_dir / "multihead_heads.json"))
+    parser.add_argument("--retrain_garbage", action="store_true",
+                        help="Fit the garbage head on frozen civic-backbone features")
+    parser.add_argument("--data", default=None,
+                        help="Shard pack, split manifest or train/val/<class> directory for retraining")
+    parser.add_argument("--epochs", type=int, default=10)
+    args = parser.parse_args()
+
+    print("Civic Connect - Multi-head Model Builder")
+    print("=" * 45)
+    build_multihead(args.civic_model, args.civic_indices, args.garbage_model, args.garbage_indices,
+                    args.output, args.heads, data=args.data, retrain_garbage=args.retrain_garbage,
+                    epochs=args.epochs)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
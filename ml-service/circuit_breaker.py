@@ -0,0 +1,121 @@
+"""
+Per-model circuit breakers for the ensemble
+Each ensemble member keeps a rolling window of its recent calls. When the
+error rate or the p90 latency over the window exceeds its limits, the breaker
+opens and the member is bypassed for open_seconds. After that a single probe
+call is let through (half-open); its outcome closes the breaker or opens it
+again. A probe that is cancelled before it runs is given back with abandon(),
+and one that has not reported back after probe_timeout seconds counts as
+failed, so a lost probe cannot keep the breaker half-open forever. The
+window's latencies also estimate how long the member takes, so a request can
+skip a member that cannot finish before its deadline.
+"""
+import collections
+import threading
+import time
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a window of (latency, failed) calls"""
+
+    def __init__(self, name, latency_budget=2.0, max_error_rate=0.5, window=20, min_calls=5, open_seconds=30.0,
+                 probe_timeout=None):
+        self.name = name
+        self.latency_budget = latency_budget
+        self.max_error_rate = max_error_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout if probe_timeout is not None else max(open_seconds, 10 * latency_budget)
+        self.state = "closed"
+        self.opened_at = None
+        self.reason = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._calls = collections.deque(maxlen=window)
+        self._probe_in_flight = False
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead; in the half-open state only one probe at a time"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    if time.monotonic() - self._probe_started > self.probe_timeout:
+                        self._open(f"probe gave no result in {self.probe_timeout:g} s")
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+            return True
+
+    def abandon(self):
+        """Give back a call allowed by allow() that never ran, releasing the half-open probe"""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def _open(self, reason):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.reason = reason
+        self.times_opened += 1
+        self._probe_in_flight = False
+
+    def record(self, latency, failed=False):
+        """Record a finished call; latency None counts the call for the error rate only"""
+        with self._lock:
+            self._calls.append((latency, failed))
+            if self.state == "half_open":
+                if failed:
+                    self._open("probe failed")
+                elif latency is not None and latency > self.latency_budget:
+                    self._open(f"probe took {latency * 1000.0:.0f} ms")
+                else:
+                    self.state = "closed"
+                    self.reason = None
+                    # Judge the recovered member on fresh calls only
+                    self._calls.clear()
+                    self._calls.append((latency, failed))
+                    self._probe_in_flight = False
+                return
+            if self.state != "closed" or len(self._calls) < self.min_calls:
+                return
+            error_rate = sum(1 for _, call_failed in self._calls if call_failed) / len(self._calls)
+            latencies = [call_latency for call_latency, _ in self._calls if call_latency is not None]
+            if error_rate > self.max_error_rate:
+                self._open(f"error rate {error_rate:.0%}")
+            elif len(latencies) >= self.min_calls and percentile(latencies, 90) > self.latency_budget:
+                self._open(f"p90 latency {percentile(latencies, 90) * 1000.0:.0f} ms")
+
+    def expected_latency(self):
+        """Median latency of the recent successful calls in seconds, or None before any"""
+        with self._lock:
+            latencies = [latency for latency, failed in self._calls if latency is not None and not failed]
+        return percentile(latencies, 50) if latencies else None
+
+    def stats(self):
+        expected = self.expected_latency()
+        with self._lock:
+            calls = list(self._calls)
+            return {
+                "state": self.state,
+                "reason": self.reason,
+                "latency_budget_ms": self.latency_budget * 1000.0,
+                "expected_ms": expected * 1000.0 if expected is not None else None,
+                "window_calls": len(calls),
+                "window_errors": sum(1 for _, failed in calls if failed),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
\ No newline at end of file
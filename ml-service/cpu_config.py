@@ -0,0 +1,227 @@
+"""
+CPU topology aware thread configuration for the ML service
+TensorFlow's intra/inter-op pools, the BLAS library behind NumPy and uvicorn
+all size themselves from the number of host cores, so several worker
+processes in a container with a small CPU quota oversubscribe the CPU. This
+module works out the CPUs the process may really use (affinity mask and
+cgroup v1/v2 quota), splits them between the configured number of workers
+and exports explicit thread counts before NumPy and TensorFlow are imported.
+
+It must be imported (and apply() called) before numpy/tensorflow, which is why
+it only uses the standard library. Pinning is separate (pin_worker()) and must
+only run in a serving worker: with several workers the uvicorn supervisor
+imports app.py too, and a slot it claimed, or an affinity mask it set, would
+be inherited by every worker it spawns.
+
+Environment variables:
+    ML_WORKERS          number of uvicorn worker processes (default 1)
+    ML_CPU_PIN          none | cores | numa: pin each worker to its own CPU slice
+    ML_CPU_THREADS      override the detected per-worker thread count
+    ML_AUTOTUNE_CONFIG  settings written by autotune.py (default autotune.json
+                        next to this file, empty to ignore)
+Explicitly set OMP_NUM_THREADS / TF_NUM_INTRAOP_THREADS etc. are respected.
+The tuned workers and threads apply only where these variables are unset and
+only if the file was tuned for the same number of effective CPUs.
+"""
+import glob
+import json
+import math
+import os
+import tempfile
+
+# Thread-count variables read by the BLAS/OpenMP runtimes NumPy may be linked against
+BLAS_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                 "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+_slot_lock = None  # keeps the worker slot lock file open for the life of the process
+
+
+def parse_cpu_list(text):
+    """Parse a Linux CPU list such as '0-3,8-11' into a list of ints"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota():
+    """CPU quota of the container in CPUs (may be fractional), or None if unlimited"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    # cgroup v1
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") or _read("/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us") or _read("/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def allowed_cpus():
+    """CPUs in this process's affinity mask"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes(cpus):
+    """Map NUMA node -> allowed CPUs on that node (a single node when unknown)"""
+    allowed = set(cpus)
+    nodes = {}
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        node = int(os.path.basename(os.path.dirname(path))[4:])
+        node_cpus = [cpu for cpu in parse_cpu_list(_read(path) or "") if cpu in allowed]
+        if node_cpus:
+            nodes[node] = node_cpus
+    return nodes or {0: list(cpus)}
+
+
+def claim_worker_slot(workers, name="civic-ml"):
+    """Claim the lowest free worker index with an exclusive lock file (None if unsupported)"""
+    global _slot_lock
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    lock_dir = os.path.join(tempfile.gettempdir(), f"{name}-slots")
+    os.makedirs(lock_dir, exist_ok=True)
+    for slot in range(workers):
+        handle = open(os.path.join(lock_dir, f"slot-{slot}.lock"), 'w')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_lock = handle
+        return slot
+    return None
+
+
+def load_tuned(path=None):
+    """Settings written by autotune.py, or None if there are none"""
+    path = path if path is not None else os.environ.get(
+        "ML_AUTOTUNE_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "autotune.json"))
+    text = _read(path) if path else None
+    if not text:
+        return None
+    try:
+        tuned = json.loads(text)
+    except ValueError:
+        return None
+    tuned["path"] = path
+    return tuned
+
+
+def plan(workers=None, pin=None, threads=None):
+    """Work out the effective CPUs and per-worker thread counts (without pinning)"""
+    cpus = allowed_cpus()
+    quota = cgroup_cpu_quota()
+    effective = len(cpus) if quota is None else max(1, min(len(cpus), math.ceil(quota)))
+
+    tuned = load_tuned()
+    if tuned and tuned.get("effective_cpus") != effective:
+        # Tuned on a different CPU budget, the measurements do not carry over
+        tuned = None
+    tuned = tuned or {}
+    workers = workers or int(os.environ.get("ML_WORKERS", tuned.get("workers", 1)))
+    pin = pin or os.environ.get("ML_CPU_PIN", "none")
+    threads = threads or (int(os.environ["ML_CPU_THREADS"]) if os.environ.get("ML_CPU_THREADS")
+                          else tuned.get("threads"))
+
+    config = {
+        "host_cpus": os.cpu_count(),
+        "allowed_cpus": len(cpus),
+        "cgroup_quota": quota,
+        "effective_cpus": effective,
+        "workers": workers,
+        "pin": pin,
+        "worker_slot": None,
+        "pinned_cpus": None,
+        "tuned": tuned or None,
+    }
+
+    threads = threads or max(1, effective // workers)
+    config["intra_op_threads"] = threads
+    # Inter-op parallelism only helps with independent graph branches; keep it small
+    config["inter_op_threads"] = min(2, threads)
+    config["blas_threads"] = threads
+    return config
+
+
+def pin_worker(config):
+    """Claim a worker slot and pin this process to its CPU slice, if ML_CPU_PIN asks for it
+
+    Call it in the serving process only (e.g. from a startup hook), never in a
+    process that spawns the workers.
+    """
+    pin, workers = config["pin"], config["workers"]
+    if pin not in ("cores", "numa") or not hasattr(os, "sched_setaffinity") or config["pinned_cpus"]:
+        return config
+    slot = claim_worker_slot(workers)
+    if slot is None:
+        return config
+    cpus = allowed_cpus()
+    if pin == "numa":
+        nodes = list(numa_nodes(cpus).values())
+        node_cpus = nodes[slot % len(nodes)]
+        # Workers sharing a node split its CPUs between them
+        sharing = [s for s in range(workers) if s % len(nodes) == slot % len(nodes)]
+        share = max(1, len(node_cpus) // len(sharing))
+        start = sharing.index(slot) * share
+        assigned = node_cpus[start:start + share]
+    else:
+        per_worker = max(1, config["effective_cpus"] // workers)
+        assigned = cpus[slot * per_worker:(slot + 1) * per_worker]
+    if assigned:
+        os.sched_setaffinity(0, assigned)
+        config["worker_slot"] = slot
+        config["pinned_cpus"] = assigned
+    return config
+
+
+def apply(config=None):
+    """Export thread-count variables; call before importing numpy"""
+    config = config or plan()
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(config["blas_threads"]))
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(config["intra_op_threads"]))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(config["inter_op_threads"]))
+    # Report what the libraries will actually see, including explicit overrides
+    config["env"] = {var: os.environ[var] for var in BLAS_ENV_VARS + ["TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]}
+    return config
+
+
+def configure_tensorflow(config):
+    """Apply the thread counts to TensorFlow if it is installed and not yet initialised"""
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(int(config["env"]["TF_NUM_INTRAOP_THREADS"]))
+        tf.config.threading.set_inter_op_parallelism_threads(int(config["env"]["TF_NUM_INTEROP_THREADS"]))
+        config["tensorflow"] = {
+            "intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+            "inter_op": tf.config.threading.get_inter_op_parallelism_threads(),
+        }
+    except ImportError:
+        config["tensorflow"] = None
+    except RuntimeError as e:
+        # The TensorFlow runtime was already initialised; the env variables still apply
+        config["tensorflow"] = {"error": str(e)}
+    return config
\ No newline at end of file
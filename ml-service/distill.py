@@ -0,0 +1,236 @@
+"""
+Distil the ensemble into a small student classifier
+The full ensemble (civic ResNet50 + garbage ResNet50, or the multi-head model,
+plus SimpleCNN, combined by the fitted fusion) labels the dataset with soft
+issue-type probabilities. A small depthwise-separable CNN is then trained on
+a mix of those soft labels (softened by a temperature) and the true labels,
+validated on a held-out split for agreement with the teacher and latency, and
+exported next to the other models for the service (ML_SERVING_MODEL=student).
+
+Teacher outputs and the student-size images are cached per split in
+distill_cache/, so the student can be retrained without running the
+ensemble again. A cache is only reused while the teacher's model and fusion
+files and the split's samples are unchanged.
+
+Usage:
+    python distill.py --data ../data/splits.json
+    python distill.py --data ../data/processed --input_size 96 --epochs 60
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from evaluate import run_models
+from fit_fusion import MODEL_FILES, cache_fingerprint, label_indices, load_cache, load_predictors, load_split
+from fusion import stack_results
+from rescore import load_fusion
+from tensor_cache import CANONICAL_SIZES, to_float
+
+script_dir = Path(__file__).parent
+weights_dir = script_dir.parent / "ml-models" / "model_weights"
+
+
+def teacher_outputs(samples, predictors, fusion, input_size, batch_size=32, workers=4):
+    """Student-size uint8 images, teacher posteriors, true labels and teacher ms per image"""
+    images = []
+    sizes = dict(CANONICAL_SIZES, student=tuple(input_size))
+    results, kept, timings, _ = run_models(samples, predictors, batch_size, workers, sizes=sizes,
+                                           on_batch=lambda _, tensors: images.append(tensors["student"]))
+    if not kept:
+        return None
+    probs, present = stack_results(results, fusion.labels, fusion.models)
+    # Images no model could score carry no teacher signal
+    scored = present.any(axis=1)
+    teacher_ms = sum(sum(seconds) for seconds in timings.values()) * 1000.0 / len(kept)
+    targets = label_indices([class_name for _, class_name in kept], fusion.labels)
+    return np.concatenate(images)[scored], fusion.posterior(probs, present)[scored], targets[scored], teacher_ms
+
+
+def cached_teacher_outputs(data, split, predictors, fusion, input_size, cache_dir, batch_size, workers):
+    """Teacher outputs for a split, reusing a cache from an earlier run with the same teacher and samples"""
+    samples = load_split(data, split)
+    if not samples:
+        return None
+    fingerprint = cache_fingerprint(samples, predictors, MODEL_FILES + ["fusion_weights.json"])
+    cache_path = Path(cache_dir) / f"distill_{split}_{input_size[0]}x{input_size[1]}.npz" if cache_dir else None
+    cached = load_cache(cache_path, fingerprint)
+    if cached is not None:
+        return cached["images"], cached["soft"], cached["targets"], float(cached["teacher_ms"])
+
+    if not predictors:
+        raise ValueError("No teacher models could be loaded")
+    print(f"Running the teacher over {len(samples)} '{split}' images...")
+    outputs = teacher_outputs(samples, predictors, fusion, input_size, batch_size, workers)
+    if outputs is None:
+        return None
+    if cache_path:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        images, soft, targets, teacher_ms = outputs
+        np.savez(cache_path, images=images, soft=soft, targets=targets, teacher_ms=teacher_ms,
+                 fingerprint=fingerprint)
+    return outputs
+
+
+def soften(probabilities, temperature):
+    """Raise teacher probabilities to 1/T and renormalise (T > 1 exposes the runner-up classes)"""
+    scaled = np.power(np.clip(probabilities, 1e-8, 1.0), 1.0 / temperature)
+    return scaled / scaled.sum(axis=1, keepdims=True)
+
+
+def distillation_targets(soft, targets, temperature=2.0, alpha=0.7):
+    """alpha * softened teacher + (1 - alpha) * one-hot truth
+
+    Cross-entropy is linear in the target, so training on the mixture is the
+    weighted sum of the distillation and the supervised loss.
+    """
+    one_hot = np.eye(soft.shape[1])[targets]
+    return alpha * soften(soft, temperature) + (1.0 - alpha) * one_hot
+
+
+def build_student(input_size, num_classes, width=16):
+    """Depthwise-separable CNN of a few tens of thousands of parameters"""
+    from tensorflow.keras.layers import (BatchNormalization, Conv2D, Dense, Dropout, GlobalAveragePooling2D,
+                                         Input, ReLU, SeparableConv2D)
+    # TensorFlow 2.3 only has the preprocessing layers under experimental
+    from tensorflow.keras.layers.experimental.preprocessing import RandomFlip
+    from tensorflow.keras.models import Model
+
+    inputs = Input(shape=(input_size[1], input_size[0], 3))
+    x = RandomFlip("horizontal")(inputs)
+    x = Conv2D(width, 3, strides=2, padding="same", use_bias=False)(x)
+    x = ReLU()(BatchNormalization()(x))
+    for multiplier in (2, 4, 6, 8):
+        for strides in (2, 1):
+            x = SeparableConv2D(width * multiplier, 3, strides=strides, padding="same", use_bias=False)(x)
+            x = ReLU()(BatchNormalization()(x))
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.2)(x)
+    outputs = Dense(num_classes, activation="softmax", name="issue_type")(x)
+    return Model(inputs, outputs, name="student")
+
+
+def train_student(model, train_set, val_set=None, temperature=2.0, alpha=0.7, epochs=40, batch_size=64):
+    """Fit the student on the distillation targets, keeping the best epoch on the held-out split"""
+    import tensorflow as tf
+
+    images, soft, targets, _ = train_set
+    validation = None
+    if val_set is not None:
+        validation = (to_float(val_set[0]), distillation_targets(val_set[1], val_set[2], temperature, alpha))
+    model.compile(optimizer=tf.keras.optimizers.Adam(1e-3), loss="categorical_crossentropy",
+                  metrics=["accuracy"])
+    callbacks = [tf.keras.callbacks.EarlyStopping(monitor="val_loss" if validation else "loss", patience=6,
+                                                  restore_best_weights=True)]
+    model.fit(to_float(images), distillation_targets(soft, targets, temperature, alpha),
+              validation_data=validation, epochs=epochs, batch_size=batch_size, shuffle=True,
+              callbacks=callbacks, verbose=2)
+    return model
+
+
+def student_latency_ms(model, images, batch_size=32, repeats=3):
+    """Best-of-repeats per-image latency of the student, batched and at batch size 1"""
+    batch = to_float(images[:batch_size])
+    single = batch[:1]
+    model(single, training=False)  # build and warm up
+
+    def best(inputs):
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            model(inputs, training=False)
+            times.append(time.perf_counter() - started)
+        return min(times) * 1000.0 / len(inputs)
+
+    return {"batched": best(batch), "single": best(single)}
+
+
+def validate(model, eval_set, labels, teacher_ms):
+    """Agreement with the teacher, accuracy of both and the per-image speedup"""
+    images, soft, targets, _ = eval_set
+    student = np.concatenate([np.asarray(model(to_float(images[i:i + 256]), training=False))
+                              for i in range(0, len(images), 256)])
+    student_labels = student.argmax(axis=1)
+    teacher_labels = soft.argmax(axis=1)
+    latency = student_latency_ms(model, images)
+    return {
+        "samples": int(len(images)),
+        "agreement": float(np.mean(student_labels == teacher_labels)),
+        "student_accuracy": float(np.mean(student_labels == targets)),
+        "teacher_accuracy": float(np.mean(teacher_labels == targets)),
+        "per_class_agreement": {
+            label: float(np.mean(student_labels[teacher_labels == i] == i)) if np.any(teacher_labels == i) else None
+            for i, label in enumerate(labels)
+        },
+        "teacher_ms_per_image": teacher_ms,
+        "student_ms_per_image": latency["batched"],
+        "student_ms_single_image": latency["single"],
+        "speedup": teacher_ms / latency["batched"] if latency["batched"] > 0 else None,
+    }
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Distil the ensemble into a small student classifier")
+    parser.add_argument("--data", required=True, help="Split manifest or directory of <split>/<class> images")
+    parser.add_argument("--split", default="train", help="Split to train the student on")
+    parser.add_argument("--eval_split", default="val", help="Held-out split for teacher agreement and latency")
+    parser.add_argument("--input_size", type=int, default=112)
+    parser.add_argument("--width", type=int, default=16, help="Channels of the first student layer")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the teacher's soft labels")
+    parser.add_argument("--epochs", type=int, default=40)
+    parser.add_argument("--batch_size", type=int, default=32, help="Teacher batch size")
+    parser.add_argument("--workers", type=int, default=4, help="Image decoding threads")
+    parser.add_argument("--cache_dir", default=str(script_dir / "distill_cache"),
+                        help="Where teacher outputs are cached between runs ('' to disable)")
+    parser.add_argument("--output", default=str(weights_dir / "student_model.h5"))
+    parser.add_argument("--info", default=str(weights_dir / "student_model.json"))
+    args = parser.parse_args()
+
+    print("Civic Connect - Ensemble Distillation")
+    print("=" * 45)
+    input_size = (args.input_size, args.input_size)
+    fusion = load_fusion()
+    predictors = load_predictors()
+    print(f"Teacher models: {sorted(predictors)}")
+
+    train_set = cached_teacher_outputs(args.data, args.split, predictors, fusion, input_size, args.cache_dir,
+                                       args.batch_size, args.workers)
+    if train_set is None:
+        print(f"No images found for split '{args.split}' in {args.data}")
+        return
+    eval_set = cached_teacher_outputs(args.data, args.eval_split, predictors, fusion, input_size, args.cache_dir,
+                                      args.batch_size, args.workers) if args.eval_split else None
+
+    model = build_student(input_size, len(fusion.labels), args.width)
+    print(f"Student parameters: {model.count_params():,}")
+    train_student(model, train_set, eval_set, args.temperature, args.alpha, args.epochs)
+
+    metrics = validate(model, eval_set if eval_set is not None else train_set, fusion.labels, train_set[3])
+    print(f"Agreement with teacher: {metrics['agreement']:.3f}")
+    print(f"Accuracy: student {metrics['student_accuracy']:.3f}, teacher {metrics['teacher_accuracy']:.3f}")
+    print(f"Per image: teacher {metrics['teacher_ms_per_image']:.1f} ms, "
+          f"student {metrics['student_ms_per_image']:.2f} ms ({metrics['speedup']:.1f}x)")
+    if metrics["speedup"] is not None and metrics["speedup"] < 10:
+        print("⚠️  Speedup below the 10x target, consider a smaller --input_size or --width")
+
+    model.save(args.output)
+    info = {
+        "input_size": list(input_size),
+        "class_indices": {label: i for i, label in enumerate(fusion.labels)},
+        "teacher": {"models": sorted(predictors), "fusion": fusion.meta},
+        "training": {"split": args.split, "eval_split": args.eval_split, "samples": int(len(train_set[0])),
+                     "temperature": args.temperature, "alpha": args.alpha, "width": args.width},
+        "metrics": metrics,
+        "created_at": time.time(),
+    }
+    with open(args.info, 'w') as f:
+        json.dump(info, f, indent=2)
+    print(f"✅ Student model saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+Offline evaluation of every model and ensemble configuration
+Loads a labelled split, decodes images in parallel (the next batch is
+decoded while the models run on the current one) and runs each predictor
+over whole batches. Ensemble configurations are evaluated by fusing the
+same per-model outputs with the other models masked out, so every
+configuration is measured on identical predictions.
+
+Reported per model and per configuration: accuracy, confusion matrix,
+per-class precision/recall/F1, images/sec and per-batch and per-image latency
+percentiles. Results are written as JSON.
+
+Usage:
+    python evaluate.py --data ../data/splits.json --split test
+    python evaluate.py --data ../data/processed --split test --batch_size 64 --output eval.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from batch_predict import score_batch
+from fit_fusion import label_indices, load_predictors, load_split
+from fusion import BINARY_MODELS, FUSION_MODELS, stack_results
+from rescore import load_fusion
+from tensor_cache import CANONICAL_SIZES, canonical_tensors
+
+# Ensemble configurations: name -> fusion models that take part
+CONFIGURATIONS = {
+    "ensemble": FUSION_MODELS,
+    "resnet50+simple_cnn": ["resnet50", "simple_cnn"],
+    "resnet50+garbage": ["resnet50", "garbage"],
+    "simple_cnn+garbage": ["simple_cnn", "garbage"],
+}
+
+
+def decode_batch(pool, samples, sizes=CANONICAL_SIZES):
+    """Canonical tensors of a batch, decoded in parallel; unreadable images are dropped"""
+    def decode(sample):
+        try:
+            return canonical_tensors(sample[0], sizes)
+        except Exception as e:
+            print(f"  skipping {sample[0]}: {e}")
+            return None
+
+    decoded = list(pool.map(decode, samples))
+    kept = [i for i, tensors in enumerate(decoded) if tensors is not None]
+    if not kept:
+        return [], None
+    tensors = {name: np.stack([decoded[i][name] for i in kept]) for name in decoded[kept[0]]}
+    return [samples[i] for i in kept], tensors
+
+
+def run_models(samples, predictors, batch_size=32, workers=4, sizes=CANONICAL_SIZES, on_batch=None):
+    """Per-image model results, the samples that could be decoded and per-model batch timings
+
+    sizes may add tensor sizes to decode; on_batch(samples, tensors) is called
+    for every decoded batch, e.g. to keep the tensors.
+    """
+    batches = [samples[i:i + batch_size] for i in range(0, len(samples), batch_size)]
+    results, kept, timings, batch_sizes = [], [], {}, []
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(decode_batch, pool, batches[0], sizes) if batches else None
+        for index in range(len(batches)):
+            batch_samples, tensors = pending.result()
+            if index + 1 < len(batches):
+                pending = prefetch.submit(decode_batch, pool, batches[index + 1], sizes)
+            if not batch_samples:
+                continue
+            results.extend(score_batch(predictors, tensors, timings))
+            if on_batch is not None:
+                on_batch(batch_samples, tensors)
+            kept.extend(batch_samples)
+            batch_sizes.append(len(batch_samples))
+            print(f"  {len(kept)}/{len(samples)} images")
+    return results, kept, timings, np.array(batch_sizes)
+
+
+def classification_metrics(targets, predictions, labels):
+    """Accuracy, confusion matrix (rows = true label) and per-class precision/recall/F1"""
+    k = len(labels)
+    confusion = np.bincount(targets * k + predictions, minlength=k * k).reshape(k, k)
+    true_positives = np.diag(confusion).astype(np.float64)
+    predicted = confusion.sum(axis=0)
+    actual = confusion.sum(axis=1)
+    precision = np.divide(true_positives, predicted, out=np.zeros(k), where=predicted > 0)
+    recall = np.divide(true_positives, actual, out=np.zeros(k), where=actual > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(k), where=(precision + recall) > 0)
+    return {
+        "samples": int(len(targets)),
+        "accuracy": float(np.mean(targets == predictions)) if len(targets) else None,
+        "labels": list(labels),
+        "confusion_matrix": confusion.tolist(),
+        "per_class": {
+            label: {"precision": float(precision[i]), "recall": float(recall[i]), "f1": float(f1[i]),
+                    "support": int(actual[i])}
+            for i, label in enumerate(labels)
+        },
+    }
+
+
+def latency_stats(batch_seconds, batch_sizes):
+    """Throughput and latency percentiles from per-batch timings"""
+    batch_seconds = np.asarray(batch_seconds)
+    per_image = batch_seconds / batch_sizes[:len(batch_seconds)]
+    return {
+        "images_per_sec": float(batch_sizes[:len(batch_seconds)].sum() / batch_seconds.sum()),
+        "batch_ms": {f"p{q}": float(np.percentile(batch_seconds, q) * 1000.0) for q in (50, 90, 99)},
+        "per_image_ms": {f"p{q}": float(np.percentile(per_image, q) * 1000.0) for q in (50, 90, 99)},
+    }
+
+
+def model_predictions(probs, present, m, model, labels):
+    """Label indices predicted by one model alone, and the mask of images it scored"""
+    positive = BINARY_MODELS.get(model)
+    if positive is None:
+        return probs[:, m].argmax(axis=1), present[:, m]
+    # Binary models only say garbage / not garbage: predict "other" for negatives
+    is_positive = probs[:, m, labels.index(positive)] >= 0.5
+    return np.where(is_positive, labels.index(positive), labels.index("other")), present[:, m]
+
+
+def evaluate(samples, predictors, fusion, batch_size=32, workers=4):
+    labels = fusion.labels
+    started = time.perf_counter()
+    results, kept, timings, batch_sizes = run_models(samples, predictors, batch_size, workers)
+    wall_seconds = time.perf_counter() - started
+    targets = label_indices([class_name for _, class_name in kept], labels)
+    probs, present = stack_results(results, labels, fusion.models)
+
+    report = {
+        "generated_at": time.time(),
+        "images": len(kept),
+        "skipped": len(samples) - len(kept),
+        "batch_size": batch_size,
+        "wall_seconds": wall_seconds,
+        "fusion": fusion.meta,
+        "timings": {name: latency_stats(seconds, batch_sizes) for name, seconds in timings.items()},
+        "models": {},
+        "configurations": {},
+    }
+
+    for m, model in enumerate(fusion.models):
+        predictions, scored = model_predictions(probs, present, m, model, labels)
+        if not scored.any():
+            continue
+        metrics = classification_metrics(targets[scored], predictions[scored], labels)
+        if model in BINARY_MODELS:
+            metrics["note"] = f"binary model: negatives are counted as 'other', only '{BINARY_MODELS[model]}' is meaningful"
+        report["models"][model] = metrics
+
+    for name, members in CONFIGURATIONS.items():
+        if not all(present[:, fusion.models.index(model)].any() for model in members):
+            continue
+        config_present = present & np.array([model in members for model in fusion.models])
+        started = time.perf_counter()
+        predictions = fusion.posterior(probs, config_present).argmax(axis=1)
+        fusion_seconds = time.perf_counter() - started
+        metrics = classification_metrics(targets, predictions, labels)
+        # A configuration costs the sum of its models (the multi-head model serves resnet50 and garbage)
+        sources = {("multihead" if "multihead" in timings and model in ("resnet50", "garbage") else model)
+                   for model in members}
+        model_seconds = sum(sum(timings[source]) for source in sources if source in timings)
+        metrics["images_per_sec"] = len(kept) / (model_seconds + fusion_seconds) if model_seconds else None
+        metrics["fusion_ms_per_image"] = fusion_seconds * 1000.0 / max(len(kept), 1)
+        report["configurations"][name] = metrics
+
+    return report
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Evaluate every model and ensemble configuration on a labelled split")
+    parser.add_argument("--data", required=True, help="Split manifest or directory of <split>/<class> images")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="Image decoding threads")
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate at most this many images")
+    parser.add_argument("--output", default=None, help="JSON results path (default: eval_<split>_<time>.json)")
+    args = parser.parse_args()
+
+    print("Civic Connect - Model Evaluation")
+    print("=" * 45)
+    samples = load_split(args.data, args.split)[:args.limit]
+    if not samples:
+        print(f"No images found for split '{args.split}' in {args.data}")
+        return
+    predictors = load_predictors()
+    if not predictors:
+        print("No models could be loaded")
+        return
+    print(f"Models: {sorted(predictors)}, images: {len(samples)}")
+
+    report = evaluate(samples, predictors, load_fusion(), args.batch_size, args.workers)
+
+    print(f"\n{'name':<24}{'accuracy':>10}{'images/sec':>12}")
+    for name, metrics in list(report["models"].items()) + list(report["configurations"].items()):
+        speed = metrics.get("images_per_sec")
+        if speed is None:
+            source = "multihead" if name in ("resnet50", "garbage") and "multihead" in report["timings"] else name
+            speed = report["timings"].get(source, {}).get("images_per_sec")
+        print(f"{name:<24}{metrics['accuracy']:>10.3f}{speed if speed is not None else float('nan'):>12.1f}")
+
+    output = Path(args.output or f"eval_{args.split}_{int(report['generated_at'])}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
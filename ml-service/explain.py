@@ -0,0 +1,191 @@
+"""
+Grad-CAM explanation heatmaps for the ResNet50 classifiers
+A heatmap shows which parts of the photo pushed a head towards a class. The
+ResNet50 models pool their last convolutional block with global average
+pooling, so the Grad-CAM channel weights (the spatial mean of the class
+score's gradient over the feature maps) are exactly the gradient with respect
+to the pooled embedding. One backbone pass gives the feature maps, and only
+the small head is differentiated.
+
+Heatmaps are computed on demand from the tensor cache (see app.py's
+/explain/{image_hash}) and kept as PNG overlays in an ExplanationCache, a
+directory bounded in size that evicts the least recently read files first.
+"""
+import io
+import os
+import re
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+
+def feature_map_model(model):
+    """Model from a classifier's image input to its last 4-D activation
+
+    A nested backbone that pools internally (ResNet50(pooling='avg'), the
+    multi-head model's backbone) is searched recursively; it must take the
+    image input directly.
+    """
+    import tensorflow as tf
+
+    for layer in reversed(model.layers):
+        shape = layer.output_shape
+        if isinstance(shape, list):
+            # Input layers and multi-output models
+            continue
+        if len(shape) == 4:
+            return tf.keras.Model(model.input, layer.get_output_at(-1))
+        if isinstance(layer, tf.keras.Model):
+            return feature_map_model(layer)
+    raise ValueError(f"{model.name} has no convolutional feature maps")
+
+
+def head_layers(model, head=None):
+    """Layers from the pooled embedding to a head's probabilities
+
+    head names a head of the multi-head model (layers civic, civic_*); a
+    standalone classifier has one head after its pooling layer.
+    """
+    if head is not None:
+        return [layer for layer in model.layers if layer.name == head or layer.name.startswith(f"{head}_")]
+    from build_multihead import split_model
+
+    return split_model(model)[1]
+
+
+class GradCAM:
+    """Grad-CAM of one head of a Keras ResNet50 classifier"""
+
+    def __init__(self, model, head=None):
+        import tensorflow as tf
+
+        self.tf = tf
+        self.feature_model = feature_map_model(model)
+        # Calling the model's own layers on a new input shares their weights
+        inputs = tf.keras.Input(shape=(self.feature_model.output_shape[-1],))
+        x = inputs
+        for layer in head_layers(model, head):
+            x = layer(x)
+        self.head_model = tf.keras.Model(inputs, x)
+
+    def __call__(self, images, class_indices=None):
+        """(heatmaps (N, h, w) in 0-1, class indices, probabilities) for a float32 batch
+
+        class_indices has one entry per image, -1 for the predicted class.
+        """
+        tf = self.tf
+        maps = self.feature_model(images, training=False)
+        pooled = tf.reduce_mean(maps, axis=(1, 2))
+        with tf.GradientTape() as tape:
+            tape.watch(pooled)
+            probabilities = self.head_model(pooled, training=False)
+            indices = tf.argmax(probabilities, axis=-1, output_type=tf.int32)
+            if class_indices is not None:
+                requested = tf.constant(class_indices, dtype=tf.int32)
+                indices = tf.where(requested >= 0, requested, indices)
+            # Log-probabilities keep the gradient from vanishing on confident predictions
+            scores = tf.math.log(tf.gather(probabilities, indices, batch_dims=1) + 1e-7)
+        weights = tape.gradient(scores, pooled)
+        cams = tf.nn.relu(tf.einsum("nhwk,nk->nhw", maps, weights)).numpy()
+        peaks = cams.reshape(len(cams), -1).max(axis=1)
+        cams /= np.where(peaks > 0, peaks, 1.0)[:, None, None]
+        return cams, indices.numpy(), probabilities.numpy()
+
+
+def colorize(heatmap):
+    """Jet-style uint8 RGB colouring of a 0-1 heatmap"""
+    x = np.clip(heatmap, 0.0, 1.0)[..., None]
+    channels = np.clip(1.5 - np.abs(4.0 * x - np.array([3.0, 2.0, 1.0])), 0.0, 1.0)
+    return (channels * 255.0).astype(np.uint8)
+
+
+def render_overlay(image, heatmap, alpha=0.45, text=None):
+    """PNG bytes of a heatmap blended over a uint8 RGB image, with optional tEXt metadata"""
+    height, width = image.shape[:2]
+    heat = Image.fromarray((np.clip(heatmap, 0.0, 1.0) * 255.0).astype(np.uint8)).resize((width, height),
+                                                                                          Image.BILINEAR)
+    colored = colorize(np.asarray(heat, dtype=np.float32) / 255.0)
+    blended = (1.0 - alpha) * image.astype(np.float32) + alpha * colored.astype(np.float32)
+    info = PngImagePlugin.PngInfo()
+    for key, value in (text or {}).items():
+        info.add_text(key, str(value))
+    buffer = io.BytesIO()
+    Image.fromarray(blended.astype(np.uint8)).save(buffer, format="PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def overlay_text(png):
+    """tEXt metadata of a rendered overlay (read without decoding the pixels)"""
+    return dict(Image.open(io.BytesIO(png)).text)
+
+
+class ExplanationCache:
+    """Directory of PNG heatmaps bounded by total size, least recently read evicted first"""
+
+    def __init__(self, path, max_bytes=256 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._total = sum(entry.stat().st_size for entry in os.scandir(path) if entry.name.endswith(".png"))
+
+    def _file(self, key):
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".png")
+
+    def get(self, key):
+        """PNG bytes of a cached heatmap, or None"""
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # The modification time doubles as the last-read time for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._file(key)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+            self._total += len(data) - previous
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted((entry for entry in os.scandir(self.path) if entry.name.endswith(".png")),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._total -= size
+            self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+            }
\ No newline at end of file
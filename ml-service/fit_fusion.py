@@ -0,0 +1,190 @@
+"""
+Fit the ensemble fusion weights on a labelled image set
+Every available model is run once over the labelled images and the mapped
+probability vectors are cached (until the model files or the split's samples
+change), then per-model, per-class log-linear weights
+are fitted by multinomial logistic regression (see fusion.py). The service
+loads the result from ml-models/model_weights/fusion_weights.json.
+
+Usage:
+    python fit_fusion.py --data ../data/splits.json --split val --eval_split test
+    python fit_fusion.py --data ../data/processed --split val --l2 0.01
+"""
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from fusion import EnsembleFusion, normalize_label, stack_results
+
+script_dir = Path(__file__).parent
+weights_dir = script_dir.parent / "ml-models" / "model_weights"
+
+sys.path.insert(0, str(script_dir.parent / "ml-models" / "classification"))
+sys.path.insert(0, str(script_dir.parent / "scripts"))
+
+ISSUE_TYPES = ['pothole', 'garbage', 'streetlight', 'water_leak', 'other']
+
+# Files in model_weights that determine the models' predictions
+MODEL_FILES = ["resnet50_multihead_model.h5", "multihead_heads.json", "resnet50_civic_model.h5",
+               "class_indices.npy", "resnet50_garbage_model.h5", "garbage_class_indices.npy",
+               "simple_cnn_model.pkl"]
+
+
+def load_predictors():
+    """Load the models the service would use, keyed by fusion model name"""
+    predictors = {}
+    multihead_path = weights_dir / "resnet50_multihead_model.h5"
+    heads_path = weights_dir / "multihead_heads.json"
+    if multihead_path.exists() and heads_path.exists():
+        from predict_multihead import MultiHeadPredictor
+        multihead = MultiHeadPredictor(str(multihead_path), str(heads_path))
+        if multihead.is_loaded:
+            predictors["multihead"] = multihead
+
+    if "multihead" not in predictors:
+        try:
+            from predict_resnet50 import ResNet50Predictor
+            predictors["resnet50"] = ResNet50Predictor(str(weights_dir / "resnet50_civic_model.h5"),
+                                                       str(weights_dir / "class_indices.npy"))
+        except ImportError as e:
+            print(f"ResNet50 predictor not available: {e}")
+        try:
+            from predict_garbage import GarbagePredictor
+            predictors["garbage"] = GarbagePredictor(str(weights_dir / "resnet50_garbage_model.h5"),
+                                                     str(weights_dir / "garbage_class_indices.npy"))
+        except ImportError as e:
+            print(f"Garbage predictor not available: {e}")
+
+    from predict_simple import SimpleCNNPredictor
+    predictors["simple_cnn"] = SimpleCNNPredictor(str(weights_dir / "simple_cnn_model.pkl"), silent=True)
+    return {name: predictor for name, predictor in predictors.items() if predictor.is_loaded}
+
+
+def predict_samples(samples, predictors):
+    """Per-image lists of model results in fusion model order"""
+    results = []
+    for i, (path, _) in enumerate(samples):
+        by_model = {}
+        if "multihead" in predictors:
+            output = predictors["multihead"].predict(path) or {}
+            by_model["resnet50"], by_model["garbage"] = output.get("civic"), output.get("garbage")
+        for name in ("resnet50", "simple_cnn", "garbage"):
+            if name in predictors:
+                by_model[name] = predictors[name].predict(path)
+        results.append([by_model.get(name) for name in ("resnet50", "simple_cnn", "garbage")])
+        if (i + 1) % 100 == 0:
+            print(f"  predicted {i + 1}/{len(samples)} images")
+    return results
+
+
+def label_indices(class_names, labels):
+    index = {label: i for i, label in enumerate(labels)}
+    return np.array([index.get(normalize_label(name), index["other"]) for name in class_names])
+
+
+def load_split(data, split):
+    if Path(data).suffix == ".json":
+        from prepare_data import load_split_manifest
+        return load_split_manifest(data).get(split, [])
+    from shard_dataset import collect_samples
+    splits = collect_samples(data)
+    return splits.get(split) or splits.get("all", [])
+
+
+def cache_fingerprint(samples, predictors, files=MODEL_FILES):
+    """Digest of a split's samples, the loaded models and their files' size and mtime
+
+    Model files are not hashed (they are hundreds of MB); retraining or
+    publishing a model always changes its mtime.
+    """
+    digest = hashlib.sha256(json.dumps(sorted(predictors)).encode())
+    for name in files:
+        path = weights_dir / name
+        if path.exists():
+            stat = path.stat()
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    for path, class_name in samples:
+        digest.update(f"{path}\0{class_name}\n".encode())
+    return digest.hexdigest()
+
+
+def load_cache(cache_path, fingerprint):
+    """Arrays of a cache file written for the same fingerprint, or None"""
+    if not cache_path or not cache_path.exists():
+        return None
+    cached = np.load(cache_path)
+    if "fingerprint" not in cached.files or str(cached["fingerprint"]) != fingerprint:
+        print(f"Ignoring stale cache {cache_path} (models or split changed)")
+        return None
+    print(f"Using cached predictions from {cache_path}")
+    return cached
+
+
+def cached_predictions(data, split, predictors, cache_dir):
+    """Model probabilities for a split, reusing a cache from an earlier run with the same models and samples"""
+    samples = load_split(data, split)
+    if not samples:
+        return None
+    fingerprint = cache_fingerprint(samples, predictors)
+    cache_path = Path(cache_dir) / f"fusion_{split}.npz" if cache_dir else None
+    cached = load_cache(cache_path, fingerprint)
+    if cached is not None:
+        return cached["probs"], cached["present"], cached["targets"]
+
+    print(f"Running {len(predictors)} model(s) over {len(samples)} '{split}' images...")
+    probs, present = stack_results(predict_samples(samples, predictors), ISSUE_TYPES)
+    targets = label_indices([class_name for _, class_name in samples], ISSUE_TYPES)
+    if cache_path:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(cache_path, probs=probs, present=present, targets=targets, fingerprint=fingerprint)
+    return probs, present, targets
+
+
+def accuracy(fusion, probs, present, targets):
+    return float(np.mean(fusion.posterior(probs, present).argmax(axis=1) == targets))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Fit log-linear ensemble fusion weights")
+    parser.add_argument("--data", required=True, help="Split manifest or directory of <split>/<class> images")
+    parser.add_argument("--split", default="val", help="Split to fit on")
+    parser.add_argument("--eval_split", default=None, help="Held-out split to report accuracy on")
+    parser.add_argument("--output", default=str(weights_dir / "fusion_weights.json"))
+    parser.add_argument("--cache_dir", default=str(script_dir / "fusion_cache"),
+                        help="Where model predictions are cached between runs ('' to disable)")
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--epochs", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("Civic Connect - Ensemble Fusion Fitting")
+    print("=" * 45)
+    predictors = load_predictors()
+    print(f"Models: {sorted(predictors)}")
+
+    fit_set = cached_predictions(args.data, args.split, predictors, args.cache_dir)
+    if fit_set is None:
+        print(f"No images found for split '{args.split}' in {args.data}")
+        return
+    eval_set = cached_predictions(args.data, args.eval_split, predictors, args.cache_dir) if args.eval_split else None
+
+    default = EnsembleFusion.default(ISSUE_TYPES)
+    fusion = EnsembleFusion.default(ISSUE_TYPES)
+    nll = fusion.fit(*fit_set, l2=args.l2, epochs=args.epochs)
+    print(f"Fitted on {len(fit_set[2])} images, mean NLL {nll:.4f}")
+    print(f"'{args.split}' accuracy: default {accuracy(default, *fit_set):.3f}, fitted {accuracy(fusion, *fit_set):.3f}")
+    if eval_set is not None:
+        fusion.meta["eval_accuracy"] = accuracy(fusion, *eval_set)
+        print(f"'{args.eval_split}' accuracy: default {accuracy(default, *eval_set):.3f}, "
+              f"fitted {fusion.meta['eval_accuracy']:.3f}")
+
+    fusion.save(args.output)
+    print(f"Fusion weights saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+Log-linear fusion of the ensemble's probability vectors
+Every model's all_predictions dict is mapped onto the shared issue-type label
+space and the ensemble posterior is computed as
+
+    score[c] = bias[c] + sum_m present[m] * weight[m, c] * log p_m[c]
+    posterior = softmax(score)
+
+for a whole batch at once with NumPy. Per-model, per-class weights let the
+fusion trust SimpleCNN on potholes and ResNet50 on streetlights without a
+chain of thresholds, and a model that did not run simply contributes nothing.
+Weights are fitted on a labelled set with fit_fusion.py; without a fitted file
+the default weights approximate the old hand-tuned preferences.
+"""
+import json
+import time
+
+import numpy as np
+
+# Models in the order of the probability tensor's second axis
+FUSION_MODELS = ["resnet50", "simple_cnn", "garbage"]
+
+# Models with a garbage / not-garbage output: their probability of the
+# positive label is kept and the remaining mass is spread over the other labels
+BINARY_MODELS = {"garbage": "garbage"}
+
+EPSILON = 1e-6
+
+
+def normalize_label(name):
+    return str(name).strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def to_label_space(all_predictions, labels, positive=None):
+    """Map one model's {class: probability} dict onto a probability vector over labels"""
+    index = {label: i for i, label in enumerate(labels)}
+    other = index.get("other")
+    vector = np.zeros(len(labels), dtype=np.float64)
+    for class_name, probability in all_predictions.items():
+        label = normalize_label(class_name)
+        if label in index:
+            vector[index[label]] += probability
+        elif other is not None:
+            vector[other] += probability
+
+    if positive is not None:
+        p = vector[index[positive]]
+        vector[:] = (1.0 - p) / max(len(labels) - 1, 1)
+        vector[index[positive]] = p
+
+    total = vector.sum()
+    return vector / total if total > 0 else np.full(len(labels), 1.0 / len(labels))
+
+
+def stack_results(results, labels, models=FUSION_MODELS):
+    """Turn per-image lists of model results into (probs [N, M, K], present [N, M])
+
+    results[i][m] is the predictor output dict of model m for image i, or None.
+    """
+    probs = np.full((len(results), len(models), len(labels)), 1.0 / len(labels))
+    present = np.zeros((len(results), len(models)), dtype=bool)
+    for i, image_results in enumerate(results):
+        for m, (model, result) in enumerate(zip(models, image_results)):
+            if not result:
+                continue
+            all_predictions = result.get("all_predictions") or {result["class"]: result["confidence"]}
+            probs[i, m] = to_label_space(all_predictions, labels, BINARY_MODELS.get(model))
+            present[i, m] = True
+    return probs, present
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _features(probs, present):
+    """Masked log-probabilities [N, M, K]"""
+    return np.log(np.clip(probs, EPSILON, 1.0)) * present[:, :, None]
+
+
+class EnsembleFusion:
+    """Calibrated log-linear combination of per-model class probabilities"""
+
+    def __init__(self, labels, weights, bias=None, models=FUSION_MODELS, meta=None):
+        self.labels = list(labels)
+        self.models = list(models)
+        self.weights = np.asarray(weights, dtype=np.float64).reshape(len(self.models), len(self.labels))
+        self.bias = np.zeros(len(self.labels)) if bias is None else np.asarray(bias, dtype=np.float64)
+        self.meta = meta or {}
+
+    @classmethod
+    def default(cls, labels):
+        """Unfitted weights that mirror the old rules: SimpleCNN for potholes and
+        garbage, ResNet50 for streetlights, and the garbage model as extra garbage evidence"""
+        preferences = {
+            "resnet50": {"pothole": 0.6, "garbage": 0.6, "streetlight": 1.5},
+            "simple_cnn": {"pothole": 1.4, "garbage": 1.4, "streetlight": 0.6},
+            "garbage": {},
+        }
+        weights = [[preferences[model].get(label, 1.0) for label in labels] for model in FUSION_MODELS]
+        return cls(labels, weights, meta={"source": "default"})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(data["labels"], data["weights"], data.get("bias"), data.get("models", FUSION_MODELS),
+                   meta=data.get("meta"))
+
+    def save(self, path):
+        data = {
+            "labels": self.labels,
+            "models": self.models,
+            "weights": self.weights.tolist(),
+            "bias": self.bias.tolist(),
+            "meta": self.meta,
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def posterior(self, probs, present):
+        """Fused class probabilities [N, K] for a batch"""
+        scores = np.einsum("nmk,mk->nk", _features(probs, present), self.weights) + self.bias
+        return _softmax(scores)
+
+    def decide(self, results):
+        """Fuse per-image model results; returns one {issueType, confidence} dict per image
+
+        Images without any model result get None so the caller can report them.
+        """
+        probs, present = stack_results(results, self.labels, self.models)
+        posterior = self.posterior(probs, present)
+        best = posterior.argmax(axis=1)
+        decisions = []
+        for i in range(len(results)):
+            if not present[i].any():
+                decisions.append(None)
+                continue
+            decisions.append({
+                "issueType": self.labels[best[i]],
+                "confidence": float(posterior[i, best[i]]),
+                "probabilities": {label: float(p) for label, p in zip(self.labels, posterior[i])},
+            })
+        return decisions
+
+    def fit(self, probs, present, targets, l2=1e-3, learning_rate=0.5, epochs=2000):
+        """Fit weights and bias by multinomial logistic regression (full-batch gradient descent)
+
+        targets are label indices. Returns the final mean negative log-likelihood.
+        """
+        features = _features(probs, present)
+        n = len(targets)
+        onehot = np.zeros((n, len(self.labels)))
+        onehot[np.arange(n), targets] = 1.0
+        for _ in range(epochs):
+            posterior = _softmax(np.einsum("nmk,mk->nk", features, self.weights) + self.bias)
+            error = (posterior - onehot) / n
+            self.weights -= learning_rate * (np.einsum("nmk,nk->mk", features, error) + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+        posterior = self.posterior(probs, present)
+        nll = float(-np.mean(np.log(np.clip(posterior[np.arange(n), targets], EPSILON, 1.0))))
+        self.meta = {"source": "fitted", "samples": int(n), "nll": nll, "fitted_at": time.time()}
+        return nll
\ No newline at end of file
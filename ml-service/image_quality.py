@@ -0,0 +1,105 @@
+"""
+Image-quality pre-filter
+Dark, blurred, blank and non-photo uploads get essentially random labels from
+the models, so they are rejected before any model runs. The checks work on a
+greyscale thumbnail of at most 256 pixels a side (JPEGs are decoded at reduced
+scale), using one histogram and one Laplacian pass in NumPy:
+
+- uniform: almost no variation at all (lens cap, blank frame)
+- too_dark / overexposed: brightness histogram piled up at one end
+- low_contrast: narrow spread between the 5th and 95th brightness percentile
+- blurry: low variance of the Laplacian (no edges survive)
+- non_photo: most pixels share a handful of grey levels (graphics, screenshots)
+
+Thresholds are deliberately conservative: a rejected complaint photo costs
+more than a wasted inference.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+THUMBNAIL_SIZE = 256
+
+DEFAULT_THRESHOLDS = {
+    "uniform_std": 4.0,
+    "dark_mean": 30.0,
+    "dark_p95": 70.0,
+    "bright_mean": 235.0,
+    "bright_p5": 200.0,
+    "min_contrast": 20.0,
+    "min_laplacian_var": 8.0,
+    "max_top_levels_fraction": 0.7,
+}
+
+
+def thumbnail(image, size=THUMBNAIL_SIZE):
+    """Greyscale float32 thumbnail of an image (bytes, path or PIL image)"""
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    elif not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image.draft('L', (size, size))
+    image = image.convert('L')
+    image.thumbnail((size, size))
+    return np.asarray(image, dtype=np.float32)
+
+
+def quality_metrics(gray):
+    """Brightness, contrast, sharpness and level-concentration measures of a greyscale array"""
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    cumulative = np.cumsum(histogram) / histogram.sum()
+    p5, p95 = np.searchsorted(cumulative, [0.05, 0.95])
+    if gray.shape[0] >= 3 and gray.shape[1] >= 3:
+        laplacian = (4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1] - gray[1:-1, :-2] - gray[1:-1, 2:])
+        laplacian_var = float(laplacian.var())
+    else:
+        laplacian_var = 0.0
+    return {
+        "mean": float(gray.mean()),
+        "std": float(gray.std()),
+        "p5": int(p5),
+        "p95": int(p95),
+        "laplacian_var": laplacian_var,
+        "top_levels_fraction": float(np.sort(histogram)[-3:].sum() / histogram.sum()),
+        "width": int(gray.shape[1]),
+        "height": int(gray.shape[0]),
+    }
+
+
+def rejection_reasons(metrics, thresholds=DEFAULT_THRESHOLDS):
+    """Reasons an image is unusable (empty if it is fine)"""
+    t = thresholds
+    if metrics["std"] < t["uniform_std"]:
+        # Nothing else is meaningful on a flat frame
+        return ["uniform"]
+    reasons = []
+    if metrics["mean"] < t["dark_mean"] and metrics["p95"] < t["dark_p95"]:
+        reasons.append("too_dark")
+    if metrics["mean"] > t["bright_mean"] and metrics["p5"] > t["bright_p5"]:
+        reasons.append("overexposed")
+    if metrics["p95"] - metrics["p5"] < t["min_contrast"]:
+        reasons.append("low_contrast")
+    if metrics["laplacian_var"] < t["min_laplacian_var"]:
+        reasons.append("blurry")
+    if metrics["top_levels_fraction"] > t["max_top_levels_fraction"]:
+        reasons.append("non_photo")
+    return reasons
+
+
+def assess(image, thresholds=DEFAULT_THRESHOLDS):
+    """{"usable", "reasons", "metrics"} for one image (bytes, path or PIL image)"""
+    metrics = quality_metrics(thumbnail(image))
+    reasons = rejection_reasons(metrics, thresholds)
+    return {"usable": not reasons, "reasons": reasons, "metrics": metrics}
+
+
+def unusable_result(assessment):
+    """Classification result returned instead of running the models on an unusable image"""
+    return {
+        "issueType": "other",
+        "confidence": 0.0,
+        "degraded": False,
+        "unusable": True,
+        "quality": {"reasons": assessment["reasons"], "metrics": assessment["metrics"]},
+    }
\ No newline at end of file
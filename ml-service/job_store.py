@@ -0,0 +1,311 @@
+"""
+Persistent job queue for asynchronous classification requests
+Jobs are stored in a local SQLite database so queued and running work survives
+a restart of the ML service. A background worker claims queued jobs per
+priority lane, hands them to the inference scheduler and optionally POSTs
+each result to the job's callback URL.
+
+Several worker processes may share the database. A claimed job records its
+worker (owner) and a lease that the worker renews while it is alive; only
+jobs whose lease has expired (their worker crashed or was stopped) are put
+back in the queue. Callbacks are only sent over http(s) to allowed hosts.
+"""
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+JOB_LANES = ["admin", "bulk"]
+DEFAULT_JOB_LANE = "bulk"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    lane TEXT NOT NULL DEFAULT 'bulk',
+    image_path TEXT NOT NULL,
+    owns_image INTEGER NOT NULL DEFAULT 0,
+    callback_url TEXT,
+    callback_status TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+# Columns added after the first release, applied to existing databases
+MIGRATIONS = {
+    "lane": "ALTER TABLE jobs ADD COLUMN lane TEXT NOT NULL DEFAULT 'bulk'",
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    "lease_expires": "ALTER TABLE jobs ADD COLUMN lease_expires REAL",
+}
+
+
+class JobStore:
+    """SQLite-backed job table"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(statement)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_lane_status ON jobs (lane, status, created_at)")
+            self._conn.commit()
+
+    def create(self, image_path, callback_url=None, owns_image=False, lane=DEFAULT_JOB_LANE):
+        """Queue a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, lane, image_path, owns_image, callback_url, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, lane, image_path, int(owns_image), callback_url, time.time()))
+            self._conn.commit()
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def claim(self, limit, lane, owner, lease_seconds):
+        """Atomically move up to limit of the oldest queued jobs of a lane to running under a lease"""
+        now = time.time()
+        with self._lock:
+            # Take the write lock up front so worker processes sharing the database never claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND lane = ? ORDER BY created_at LIMIT ?",
+                (JOB_QUEUED, lane, limit)).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_expires = ? WHERE id = ?",
+                    [(JOB_RUNNING, now, owner, now + lease_seconds, row["id"]) for row in rows])
+            self._conn.commit()
+        return [self._to_dict(row) for row in rows]
+
+    def renew_leases(self, owner, lease_seconds):
+        """Extend the leases of an owner's running jobs"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE status = ? AND owner = ?",
+                (time.time() + lease_seconds, JOB_RUNNING, owner))
+            self._conn.commit()
+
+    def finish(self, job_id, result=None, error=None):
+        """Record the result (or error) of a job"""
+        status = JOB_FAILED if error else JOB_DONE
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+            self._conn.commit()
+
+    def set_callback_status(self, job_id, callback_status):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id))
+            self._conn.commit()
+
+    def requeue_expired(self):
+        """Put running jobs whose lease expired (their worker is gone) back in the queue
+
+        Jobs claimed before leases existed have none and are requeued too.
+        """
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires = NULL "
+                "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+                (JOB_QUEUED, JOB_RUNNING, time.time())).rowcount
+            self._conn.commit()
+        return count
+
+    def counts(self):
+        """Number of jobs per lane and status"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lane, status, COUNT(*) AS n FROM jobs GROUP BY lane, status").fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["lane"], {})[row["status"]] = row["n"]
+        return counts
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["owns_image"] = bool(job["owns_image"])
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+
+def parse_hosts(text):
+    """Lower-cased set of "host" or "host:port" entries from a comma-separated list"""
+    return {host.strip().lower() for host in text.split(",") if host.strip()}
+
+
+def callback_allowed(url, allowed_hosts):
+    """Whether a callback URL is http(s) to one of the allowed hosts ("host" or "host:port")"""
+    try:
+        parsed = urllib.parse.urlsplit(url)
+        port = parsed.port
+    except ValueError:
+        return False
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    host = parsed.hostname.lower()
+    return host in allowed_hosts or (port is not None and f"{host}:{port}" in allowed_hosts)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects as errors, so a callback cannot be bounced to a host that is not allowed"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def post_callback(url, payload, retries=3, timeout=5.0):
+    """POST a JSON payload to a callback URL, retrying with backoff; returns a status string"""
+    data = json.dumps(payload).encode()
+    last_error = None
+    for attempt in range(retries):
+        try:
+            request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+            with _callback_opener.open(request, timeout=timeout) as response:
+                return f"delivered ({response.status})"
+        except Exception as e:
+            last_error = e
+            time.sleep(0.5 * (2 ** attempt))
+    return f"failed: {last_error}"
+
+
+class JobWorker:
+    """Background thread that feeds queued jobs to the inference scheduler
+
+    submit(image_path, lane) must return a Future. At most max_in_flight jobs
+    per lane are held in memory; the rest of a backlog stays in the database.
+    Claimed jobs are leased for lease_seconds and renewed every poll while the
+    worker runs. Callbacks go only to allowed_callback_hosts.
+    """
+
+    def __init__(self, store, submit, lanes=JOB_LANES, max_in_flight=16, poll_interval=1.0, on_finished=None,
+                 lease_seconds=60.0, allowed_callback_hosts=()):
+        self.store = store
+        self.submit = submit
+        self.lanes = list(lanes)
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.on_finished = on_finished
+        self.lease_seconds = lease_seconds
+        self.allowed_callback_hosts = set(allowed_callback_hosts)
+        # Unique per process start, so a restarted worker never mistakes old leases for its own
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._in_flight = {lane: 0 for lane in self.lanes}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._callbacks = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job-callback")
+
+    def start(self):
+        self._requeue_expired()
+        self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._callbacks.shutdown(wait=False)
+
+    def notify(self):
+        """Wake the worker after a job was queued or finished"""
+        self._wakeup.set()
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._in_flight)
+
+    def _requeue_expired(self):
+        requeued = self.store.requeue_expired()
+        if requeued:
+            print(f"Re-queued {requeued} interrupted jobs")
+
+    def _run(self):
+        renewed_at = requeued_at = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now - renewed_at >= self.lease_seconds / 3:
+                self.store.renew_leases(self.owner, self.lease_seconds)
+                renewed_at = now
+            if now - requeued_at >= self.lease_seconds:
+                # Pick up the jobs of sibling workers that died
+                self._requeue_expired()
+                requeued_at = now
+            claimed = 0
+            for lane in self.lanes:
+                with self._lock:
+                    free = self.max_in_flight - self._in_flight[lane]
+                if free <= 0:
+                    continue
+                for job in self.store.claim(free, lane, self.owner, self.lease_seconds):
+                    with self._lock:
+                        self._in_flight[lane] += 1
+                    future = self.submit(job["image_path"], lane)
+                    future.add_done_callback(functools.partial(self._on_done, job))
+                    claimed += 1
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _on_done(self, job, future):
+        """Record the outcome of a job once the scheduler has run it"""
+        error = future.exception()
+        result = None if error else future.result()
+        error = str(error) if error else None
+
+        self.store.finish(job["id"], result=result, error=error)
+        with self._lock:
+            self._in_flight[job["lane"]] -= 1
+        self._wakeup.set()
+
+        if self.on_finished:
+            self.on_finished(job)
+        if job["callback_url"]:
+            payload = {"jobId": job["id"], "status": JOB_FAILED if error else JOB_DONE,
+                       "result": result, "error": error}
+            self._callbacks.submit(self._deliver, job["id"], job["callback_url"], payload)
+
+    def _deliver(self, job_id, url, payload):
+        if not callback_allowed(url, self.allowed_callback_hosts):
+            self.store.set_callback_status(job_id, "rejected: callback host is not allowed")
+            return
+        self.store.set_callback_status(job_id, post_callback(url, payload))
\ No newline at end of file
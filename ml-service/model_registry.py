@@ -0,0 +1,282 @@
+"""
+Memory-budgeted registry of lazily loaded predictors
+Models are registered with a loader and only loaded on first use. After every
+load the registry checks the resident size of all models against the memory
+budget and evicts the least recently used ones that are not currently in use.
+
+With a park dtype (float16 or bfloat16) a Keras model is first "parked"
+instead of dropped: its architecture and a half-precision copy of its weights
+stay in memory and the TensorFlow model is released. Using a parked model
+rebuilds it with float32 weights, which is much faster than reading the .h5
+file again, so computation always happens in float32. Parked models that still
+do not fit are unloaded completely and reloaded from disk when needed.
+
+Loading and unparking run without the registry lock: the entry is marked as
+loading (an event other users of the same model wait on) and is left alone
+by eviction until it is resident, so a slow load of one model never blocks
+requests for the others.
+
+Objects derived from a model (e.g. Grad-CAM models sharing its layers) must
+not outlive it: add_release_listener() callbacks are told the model name
+whenever a model is parked or unloaded, so they can drop them.
+"""
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+STATE_UNLOADED = "unloaded"
+STATE_RESIDENT = "resident"
+STATE_PARKED = "parked"
+STATE_FAILED = "failed"
+
+
+def _park_numpy_dtype(name):
+    """NumPy dtype used to store parked weights"""
+    if name == "bfloat16":
+        import tensorflow as tf
+        return tf.bfloat16.as_numpy_dtype
+    return np.dtype(name)
+
+
+def _is_keras(predictor):
+    model = getattr(predictor, "model", None)
+    return model is not None and hasattr(model, "get_weights") and hasattr(model, "to_json")
+
+
+def resident_bytes(predictor):
+    """Approximate memory held by a predictor's model weights"""
+    model = getattr(predictor, "model", None)
+    if model is None:
+        return 0
+    if _is_keras(predictor):
+        return sum(int(np.prod(w.shape)) * w.dtype.size for w in model.weights)
+    # scikit-learn style models: the pickled size is a close estimate of their arrays
+    try:
+        return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class _Entry:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.predictor = None
+        self.parked = None  # (architecture json, half-precision weights)
+        self.state = STATE_UNLOADED
+        self.nbytes = 0
+        self.pins = 0
+        self.loading = None  # threading.Event while a load or unpark is in progress
+        self.last_used = 0.0
+        self.loads = 0
+        self.evictions = 0
+        self.error = None
+
+
+class ModelRegistry:
+    """Lazily loads registered predictors and keeps them within a memory budget"""
+
+    def __init__(self, budget_bytes=0, park_dtype=None):
+        self.budget_bytes = budget_bytes
+        self.park_dtype = park_dtype if park_dtype not in (None, "", "float32") else None
+        self._entries = {}
+        self._release_listeners = []
+        self._lock = threading.RLock()
+
+    def register(self, name, loader):
+        """Register a loader returning a predictor with an is_loaded attribute"""
+        with self._lock:
+            self._entries[name] = _Entry(name, loader)
+
+    def add_release_listener(self, callback):
+        """Call callback(name) whenever a model is parked or unloaded (under the registry lock)"""
+        self._release_listeners.append(callback)
+
+    def _released(self, entry):
+        for callback in self._release_listeners:
+            try:
+                callback(entry.name)
+            except Exception as e:
+                print(f"⚠️  Release listener failed for model '{entry.name}': {e}")
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def available(self, name):
+        """True if a model is registered and has not failed to load"""
+        entry = self._entries.get(name)
+        return entry is not None and entry.state != STATE_FAILED
+
+    def is_resident(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and entry.state == STATE_RESIDENT
+
+    @contextmanager
+    def use(self, name):
+        """Yield the loaded predictor (or None) and keep it from being evicted meanwhile"""
+        entry = self._acquire(name)
+        try:
+            yield entry.predictor if entry else None
+        finally:
+            if entry:
+                with self._lock:
+                    entry.pins -= 1
+
+    def _pin(self, entry):
+        entry.pins += 1
+        entry.last_used = time.monotonic()
+        self._enforce_budget()
+        return entry
+
+    def _acquire(self, name):
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None or entry.state == STATE_FAILED:
+                    return None
+                if entry.state == STATE_RESIDENT:
+                    return self._pin(entry)
+                loading = entry.loading
+                if loading is None:
+                    entry.loading = threading.Event()
+            if loading is None:
+                break
+            # Another thread is loading this model
+            loading.wait()
+
+        try:
+            if entry.state == STATE_PARKED:
+                self._unpark(entry)
+            if entry.state == STATE_UNLOADED:
+                self._load(entry)
+        finally:
+            with self._lock:
+                loading, entry.loading = entry.loading, None
+                if entry.state == STATE_RESIDENT:
+                    self._pin(entry)
+            loading.set()
+        return entry if entry.state == STATE_RESIDENT else None
+
+    def _load(self, entry):
+        """Run the loader (without the registry lock) and install its predictor"""
+        started = time.perf_counter()
+        error = None
+        try:
+            predictor = entry.loader()
+        except Exception as e:
+            predictor, error = None, str(e)
+        with self._lock:
+            if predictor is None or not getattr(predictor, "is_loaded", False):
+                entry.state = STATE_FAILED
+                entry.error = error or "loader did not produce a loaded model"
+                print(f"⚠️  Failed to load model '{entry.name}': {entry.error}")
+                return
+            entry.predictor = predictor
+            entry.error = None
+            entry.state = STATE_RESIDENT
+            entry.nbytes = resident_bytes(predictor)
+            entry.loads += 1
+        print(f"✅ Loaded model '{entry.name}' ({entry.nbytes / 2**20:.1f} MB) "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    def _park(self, entry):
+        """Keep the architecture and half-precision weights, release the TensorFlow model"""
+        predictor = entry.predictor
+        try:
+            dtype = _park_numpy_dtype(self.park_dtype)
+            architecture = predictor.model.to_json()
+            weights = [w.astype(dtype) for w in predictor.model.get_weights()]
+        except Exception as e:
+            print(f"⚠️  Could not park model '{entry.name}', unloading it instead: {e}")
+            self._unload(entry)
+            return
+        predictor.model = None
+        if hasattr(predictor, "embedding_model"):
+            predictor.embedding_model = None
+        predictor.is_loaded = False
+        entry.parked = (architecture, weights)
+        entry.nbytes = sum(w.nbytes for w in weights)
+        entry.state = STATE_PARKED
+        entry.evictions += 1
+        self._released(entry)
+
+    def _unpark(self, entry):
+        """Rebuild a parked model with float32 weights (without the registry lock)"""
+        import tensorflow as tf
+        architecture, weights = entry.parked
+        try:
+            model = tf.keras.models.model_from_json(architecture)
+            model.set_weights([w.astype(np.float32) for w in weights])
+        except Exception as e:
+            print(f"⚠️  Could not restore parked model '{entry.name}', reloading it: {e}")
+            with self._lock:
+                self._unload(entry)
+            return
+        with self._lock:
+            entry.predictor.model = model
+            entry.predictor.is_loaded = True
+            entry.parked = None
+            entry.nbytes = resident_bytes(entry.predictor)
+            entry.state = STATE_RESIDENT
+
+    def _unload(self, entry):
+        held = entry.state in (STATE_RESIDENT, STATE_PARKED)
+        if held:
+            entry.evictions += 1
+        entry.predictor = None
+        entry.parked = None
+        entry.nbytes = 0
+        entry.state = STATE_UNLOADED
+        if held:
+            self._released(entry)
+
+    def _total_bytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def _enforce_budget(self):
+        """Park, then unload, least recently used idle models until the budget is met"""
+        if not self.budget_bytes:
+            return
+        idle = sorted((e for e in self._entries.values() if e.pins == 0 and e.nbytes and e.loading is None),
+                      key=lambda e: e.last_used)
+        if self.park_dtype:
+            for entry in idle:
+                if self._total_bytes() <= self.budget_bytes:
+                    return
+                if entry.state == STATE_RESIDENT and _is_keras(entry.predictor):
+                    self._park(entry)
+        for entry in idle:
+            if self._total_bytes() <= self.budget_bytes:
+                return
+            self._unload(entry)
+
+    def unload_all(self):
+        """Drop every idle model and clear load failures so the next use loads from disk"""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.pins == 0 and entry.loading is None:
+                    self._unload(entry)
+                    entry.error = None
+
+    def stats(self):
+        """Budget, total resident size and the state of every registered model"""
+        with self._lock:
+            return {
+                "budget_mb": self.budget_bytes / 2**20 if self.budget_bytes else None,
+                "park_dtype": self.park_dtype,
+                "resident_mb": self._total_bytes() / 2**20,
+                "models": {
+                    name: {
+                        "state": entry.state,
+                        "resident_mb": entry.nbytes / 2**20,
+                        "in_use": entry.pins,
+                        "loads": entry.loads,
+                        "evictions": entry.evictions,
+                        "error": entry.error,
+                    }
+                    for name, entry in self._entries.items()
+                },
+            }
\ No newline at end of file
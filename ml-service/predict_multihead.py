@@ -0,0 +1,146 @@
+"""
+Prediction script for the multi-head ResNet50 model
+One ResNet50 backbone produces a pooled embedding that feeds both the civic
+issue head and the garbage head, so a request runs the convolutional layers
+once instead of once per model. Build the model with build_multihead.py.
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+# Output names of the multi-head model
+EMBEDDING_OUTPUT = "embedding"
+HEAD_OUTPUTS = ["civic", "garbage"]
+
+
+class MultiHeadPredictor:
+    """Predictor class for the shared-backbone multi-head model"""
+
+    def __init__(self, model_path=None, heads_path=None):
+        self.model = None
+        self.heads = {}
+        self.input_size = (224, 224)
+        self.is_loaded = False
+
+        if model_path and heads_path:
+            self.load_model(model_path, heads_path)
+
+    def load_model(self, model_path, heads_path):
+        """Load the multi-head model and the class names of each head"""
+        try:
+            self.model = tf.keras.models.load_model(model_path)
+
+            with open(heads_path, 'r') as f:
+                heads_info = json.load(f)
+
+            # Reverse mapping (index to class name) for each head
+            self.heads = {
+                name: {int(idx): class_name for class_name, idx in info["class_indices"].items()}
+                for name, info in heads_info["heads"].items()
+            }
+            self.output_names = [EMBEDDING_OUTPUT] + [name for name in HEAD_OUTPUTS if name in self.heads]
+            self.input_size = tuple(heads_info.get("input_size", self.input_size))
+
+            self.is_loaded = True
+            print(f"Multi-head model loaded successfully from {model_path}")
+            for name, class_names in self.heads.items():
+                print(f"{name} classes: {list(class_names.values())}")
+        except Exception as e:
+            print(f"Failed to load multi-head model: {e}")
+            self.is_loaded = False
+
+    def preprocess_image(self, image_path):
+        """Preprocess image for prediction"""
+        try:
+            img = Image.open(image_path)
+            img = img.convert('RGB')
+            img = img.resize(self.input_size)
+
+            img_array = np.array(img).astype(np.float32) / 255.0
+            return np.expand_dims(img_array, axis=0)
+        except Exception as e:
+            print(f"Error processing image {image_path}: {e}")
+            return None
+
+    def predict_array(self, img_batch):
+        """Run a preprocessed batch, returning the embeddings and per-head probabilities"""
+        outputs = self.model.predict(img_batch, verbose=0)
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        outputs = dict(zip(self.output_names, outputs))
+        return outputs[EMBEDDING_OUTPUT], {name: outputs[name] for name in self.heads}
+
+    def _head_result(self, name, probabilities):
+        """Format one head's probabilities like the single-model predictors do"""
+        class_names = self.heads[name]
+        predicted_class_idx = int(np.argmax(probabilities))
+        return {
+            "class": class_names[predicted_class_idx],
+            "confidence": float(probabilities[predicted_class_idx]),
+            "all_predictions": {class_name: float(probabilities[idx]) for idx, class_name in class_names.items()}
+        }
+
+    def predict_batch(self, img_batch):
+        """Predict a preprocessed batch; returns per image {head: result, "embedding": vector}"""
+        embeddings, head_probabilities = self.predict_array(img_batch)
+        results = []
+        for i, embedding in enumerate(embeddings):
+            result = {name: self._head_result(name, probs[i]) for name, probs in head_probabilities.items()}
+            result["embedding"] = embedding
+            results.append(result)
+        return results
+
+    def predict(self, image_path):
+        """Predict civic and garbage classes of an image with one backbone pass"""
+        if not self.is_loaded:
+            print("Model not loaded. Please load model first.")
+            return None
+
+        img_array = self.preprocess_image(image_path)
+        if img_array is None:
+            return None
+
+        try:
+            embeddings, head_probabilities = self.predict_array(img_array)
+            result = {name: self._head_result(name, probs[0]) for name, probs in head_probabilities.items()}
+            result["embedding"] = embeddings[0]
+            return result
+        except Exception as e:
+            print(f"Error during prediction: {e}")
+            return None
+
+
+def main():
+    """Main function to test the predictor"""
+    print("Multi-head ResNet50 Predictor for Civic Issue Classification")
+    print("=" * 50)
+
+    model_path = "../ml-models/model_weights/resnet50_multihead_model.h5"
+    heads_path = "../ml-models/model_weights/multihead_heads.json"
+
+    if not os.path.exists(model_path) or not os.path.exists(heads_path):
+        print(f"Multi-head model not found: {model_path}")
+        print("Please build it first using build_multihead.py")
+        return
+
+    predictor = MultiHeadPredictor(model_path, heads_path)
+    if not predictor.is_loaded:
+        print("Failed to load model")
+        return
+
+    test_image = "test_image.jpg"
+    if os.path.exists(test_image):
+        result = predictor.predict(test_image)
+        if result:
+            for name in predictor.heads:
+                print(f"{name}: {result[name]['class']} ({result[name]['confidence']:.4f})")
+            print(f"Embedding size: {result['embedding'].shape[0]}")
+        else:
+            print("Prediction failed")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
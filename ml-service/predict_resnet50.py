@@ -16,6 +16,7 @@ class ResNet50Predictor:
     def __init__(self, model_path=None, class_indices_path=None):
         self.model = None
         self.class_indices = None
+        self.embedding_model = None
         self.is_loaded = False
         
         if model_path and class_indices_path:
@@ -60,6 +61,47 @@ class ResNet50Predictor:
             print(f"Error processing image {image_path}: {e}")
             return None
     
+    def get_embedding_model(self):
+        """Model that outputs the pooled (penultimate) ResNet50 features"""
+        if self.embedding_model is None:
+            pool_layer = None
+            for layer in self.model.layers:
+                if isinstance(layer, GlobalAveragePooling2D):
+                    pool_layer = layer
+            if pool_layer is None:
+                raise ValueError("Model has no GlobalAveragePooling2D layer")
+            self.embedding_model = Model(self.model.input, pool_layer.output)
+        return self.embedding_model
+    
+    def get_embedding(self, image_path):
+        """Compute the pooled ResNet50 embedding of an image"""
+        if not self.is_loaded:
+            print("Model not loaded. Please load model first.")
+            return None
+        
+        img_array = self.preprocess_image(image_path)
+        if img_array is None:
+            return None
+        
+        try:
+            return self.get_embedding_model().predict(img_array, verbose=0)[0]
+        except Exception as e:
+            print(f"Error computing embedding: {e}")
+            return None
+    
+    def predict_batch(self, img_batch):
+        """Predict a preprocessed float32 batch (N, 224, 224, 3); returns one result dict per image"""
+        predictions = self.model.predict(img_batch, verbose=0)
+        results = []
+        for probabilities in predictions:
+            predicted_class_idx = int(np.argmax(probabilities))
+            results.append({
+                "class": self.class_names[predicted_class_idx],
+                "confidence": float(probabilities[predicted_class_idx]),
+                "all_predictions": {class_name: float(probabilities[idx]) for idx, class_name in self.class_names.items()}
+            })
+        return results
+    
     def predict(self, image_path):
         """Predict the class of an image"""
         if not self.is_loaded:
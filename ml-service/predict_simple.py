@@ -56,6 +56,21 @@ class SimpleCNNPredictor:
                 print(f"[ERROR] Error processing image {image_path}: {e}")
             return None
     
+    def predict_batch(self, img_batch):
+        """Predict a preprocessed float32 batch (N, 64, 64, 3); returns one result dict per image"""
+        img_data = np.asarray(img_batch, dtype=np.float32).reshape(len(img_batch), -1)
+        probabilities = self.model.predict_proba(img_data)
+        classes = self.label_encoder.classes_
+        results = []
+        for probs in probabilities:
+            best = int(np.argmax(probs))
+            results.append({
+                "class": classes[best],
+                "confidence": float(probs[best]),
+                "all_predictions": {class_name: float(probs[i]) for i, class_name in enumerate(classes)}
+            })
+        return results
+    
     def predict(self, image_path):
         """Predict the class of a single image"""
         if not self.is_loaded:
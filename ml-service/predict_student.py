@@ -0,0 +1,123 @@
+"""
+Prediction script for the distilled student classifier
+A small depthwise-separable CNN trained by distill.py on the soft labels of
+the full ensemble (civic ResNet50, garbage ResNet50 and SimpleCNN after
+fusion). It predicts the issue types directly, at a fraction of the cost.
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+
+class StudentPredictor:
+    """Predictor class for the distilled student model"""
+
+    def __init__(self, model_path=None, info_path=None):
+        self.model = None
+        self.class_names = {}
+        self.input_size = (112, 112)
+        self.info = {}
+        self.is_loaded = False
+
+        if model_path and info_path:
+            self.load_model(model_path, info_path)
+
+    def load_model(self, model_path, info_path):
+        """Load the student model and its description (classes, input size, teacher)"""
+        try:
+            self.model = tf.keras.models.load_model(model_path)
+
+            with open(info_path, 'r') as f:
+                self.info = json.load(f)
+
+            # Reverse mapping (index to class name)
+            self.class_names = {int(idx): class_name for class_name, idx in self.info["class_indices"].items()}
+            self.input_size = tuple(self.info.get("input_size", self.input_size))
+
+            self.is_loaded = True
+            print(f"Student model loaded successfully from {model_path}")
+            print(f"Classes: {list(self.class_names.values())}")
+        except Exception as e:
+            print(f"Failed to load student model: {e}")
+            self.is_loaded = False
+
+    def preprocess_image(self, image_path):
+        """Preprocess image for prediction"""
+        try:
+            img = Image.open(image_path)
+            img = img.convert('RGB')
+            img = img.resize(self.input_size)
+
+            img_array = np.array(img).astype(np.float32) / 255.0
+            return np.expand_dims(img_array, axis=0)
+        except Exception as e:
+            print(f"Error processing image {image_path}: {e}")
+            return None
+
+    def predict_batch(self, img_batch):
+        """Predict a preprocessed float32 batch (N, height, width, 3); returns one result dict per image"""
+        # Calling the model directly avoids predict()'s per-call setup, which dominates for small batches
+        predictions = np.asarray(self.model(np.asarray(img_batch, dtype=np.float32), training=False))
+        results = []
+        for probabilities in predictions:
+            predicted_class_idx = int(np.argmax(probabilities))
+            results.append({
+                "class": self.class_names[predicted_class_idx],
+                "confidence": float(probabilities[predicted_class_idx]),
+                "all_predictions": {class_name: float(probabilities[idx]) for idx, class_name in self.class_names.items()}
+            })
+        return results
+
+    def predict(self, image_path):
+        """Predict the issue type of an image"""
+        if not self.is_loaded:
+            print("Model not loaded. Please load model first.")
+            return None
+
+        img_array = self.preprocess_image(image_path)
+        if img_array is None:
+            return None
+
+        try:
+            return self.predict_batch(img_array)[0]
+        except Exception as e:
+            print(f"Error during prediction: {e}")
+            return None
+
+
+def main():
+    """Main function to test the predictor"""
+    print("Distilled Student Predictor for Civic Issue Classification")
+    print("=" * 50)
+
+    model_path = "../ml-models/model_weights/student_model.h5"
+    info_path = "../ml-models/model_weights/student_model.json"
+
+    if not os.path.exists(model_path) or not os.path.exists(info_path):
+        print(f"Student model not found: {model_path}")
+        print("Please train it first using distill.py")
+        return
+
+    predictor = StudentPredictor(model_path, info_path)
+    if not predictor.is_loaded:
+        print("Failed to load model")
+        return
+
+    metrics = predictor.info.get("metrics", {})
+    if metrics:
+        print(f"Teacher agreement: {metrics.get('agreement')}, speedup: {metrics.get('speedup')}")
+
+    test_image = "test_image.jpg"
+    if os.path.exists(test_image):
+        result = predictor.predict(test_image)
+        if result:
+            print(f"Predicted class: {result['class']} ({result['confidence']:.4f})")
+        else:
+            print("Prediction failed")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
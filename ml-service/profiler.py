@@ -0,0 +1,78 @@
+"""
+On-demand sampling profiler for the ML service
+While a profile is running, a background thread snapshots the Python stack
+of every thread with sys._current_frames() at a fixed interval and counts
+identical stacks. The result is written in the collapsed-stack format used by
+flamegraph.pl and speedscope ("thread;outer;...;inner count" per line).
+Nothing is installed or hooked while no profile is running, so the service
+pays no cost between profiles.
+"""
+import collections
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+    # ';' separates frames in the collapsed format (the count follows the last space)
+    return label.replace(";", ":")
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def sample_stacks(seconds, interval=0.005):
+    """Sample all thread stacks (except the sampler's own) for a number of seconds"""
+    own_id = threading.get_ident()
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            thread_name = names.get(thread_id, str(thread_id)).replace(";", ":")
+            counts[f"{thread_name};{_collapse(frame)}"] += 1
+        samples += 1
+        time.sleep(interval)
+    return counts, samples
+
+
+def format_collapsed(counts):
+    """Render stack counts as collapsed-stack text, most frequent first"""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def profile(seconds, interval=0.005, tensorflow=False):
+    """Run one profile; returns (collapsed text, number of samples, TensorFlow trace dir or None)
+
+    Only one profile can run at a time; raises RuntimeError if one is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        trace_dir = None
+        if tensorflow:
+            import tensorflow as tf
+            trace_dir = tempfile.mkdtemp(prefix="ml-profile-")
+            tf.profiler.experimental.start(trace_dir)
+        try:
+            counts, samples = sample_stacks(seconds, interval)
+        finally:
+            if trace_dir:
+                tf.profiler.experimental.stop()
+        return format_collapsed(counts), samples, trace_dir
+    finally:
+        _profile_lock.release()
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+Consistent-hash replica selection with bounded loads and health ejection
+Each ML service replica keeps per-process caches (tensor cache, explanation
+heatmaps, loaded models), so the router sends every image to the same replica
+by hashing the image's content hash onto a ring of virtual nodes. Adding or
+removing a replica only moves the keys next to its virtual nodes.
+
+Popular keys must not overload one replica: with bounded loads a replica takes
+a request only while its in-flight count is below
+ceil(load_factor * (total in flight + 1) / healthy replicas); otherwise the
+request walks on along the ring to the next replica under that bound.
+
+Replicas that fail max_failures requests in a row (or an active health check)
+are ejected for eject_seconds, doubling on every consecutive ejection up to
+max_eject_seconds. Their keys move to the next replicas on the ring and come
+back once the replica is readmitted. If every replica is ejected, all of them
+are tried anyway.
+"""
+import bisect
+import hashlib
+import math
+import threading
+import time
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Ring of virtual nodes mapping keys to nodes"""
+
+    def __init__(self, nodes=(), vnodes=160):
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            point = ring_hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def walk(self, key):
+        """Distinct nodes in ring order starting at the key's position"""
+        if not self._points:
+            return []
+        start = bisect.bisect(self._points, ring_hash(key))
+        seen = []
+        for i in range(len(self._points)):
+            owner = self._owners[(start + i) % len(self._points)]
+            if owner not in seen:
+                seen.append(owner)
+        return seen
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.consecutive_ejections = 0
+        self.ejected_until = 0.0
+        self.overflow = 0
+
+    def ejected(self, now):
+        return now < self.ejected_until
+
+
+class ReplicaPool:
+    """Replicas on a hash ring with in-flight accounting and ejection"""
+
+    def __init__(self, urls, vnodes=160, load_factor=1.25, max_failures=3, eject_seconds=10.0,
+                 max_eject_seconds=300.0):
+        if not urls:
+            raise ValueError("At least one replica is required")
+        self.replicas = {url: Replica(url) for url in urls}
+        self.ring = HashRing(urls, vnodes)
+        self.load_factor = load_factor
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def candidates(self, key=None):
+        """Replica URLs to try in order: the bounded-load choice first, then failover order
+
+        Without a key the least loaded healthy replica comes first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            order = self.ring.walk(key) if key is not None else sorted(
+                self.replicas, key=lambda url: self.replicas[url].in_flight)
+            healthy = [url for url in order if not self.replicas[url].ejected(now)]
+            ejected = [url for url in order if self.replicas[url].ejected(now)]
+            if not healthy:
+                return ejected
+            total = sum(self.replicas[url].in_flight for url in healthy)
+            capacity = math.ceil(self.load_factor * (total + 1) / len(healthy))
+            chosen = next((url for url in healthy if self.replicas[url].in_flight < capacity), healthy[0])
+            if chosen != healthy[0]:
+                self.replicas[healthy[0]].overflow += 1
+            return [chosen] + [url for url in healthy if url != chosen] + ejected
+
+    def owner(self, key):
+        """Replica a key maps to when every replica is healthy and idle"""
+        return self.ring.walk(key)[0]
+
+    def acquire(self, url):
+        with self._lock:
+            replica = self.replicas[url]
+            replica.in_flight += 1
+            replica.requests += 1
+
+    def release(self, url, failed=False):
+        with self._lock:
+            replica = self.replicas[url]
+            replica.in_flight -= 1
+            self._record(replica, failed)
+
+    def _record(self, replica, failed):
+        if not failed:
+            replica.consecutive_failures = 0
+            replica.consecutive_ejections = 0
+            return
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.max_failures and not replica.ejected(time.monotonic()):
+            self._eject(replica)
+
+    def _eject(self, replica):
+        seconds = min(self.max_eject_seconds, self.eject_seconds * 2 ** replica.consecutive_ejections)
+        replica.ejected_until = time.monotonic() + seconds
+        replica.ejections += 1
+        replica.consecutive_ejections += 1
+        replica.consecutive_failures = 0
+        print(f"⚠️  Ejected replica {replica.url} for {seconds:.0f}s")
+
+    def record_health(self, url, ok):
+        """Outcome of an active health check: a failure ejects, a success readmits"""
+        with self._lock:
+            replica = self.replicas[url]
+            if ok:
+                if replica.ejected(time.monotonic()):
+                    print(f"✅ Replica {url} is healthy again")
+                replica.ejected_until = 0.0
+                replica.consecutive_failures = 0
+            elif not replica.ejected(time.monotonic()):
+                self._eject(replica)
+
+    def start_health_checks(self, probe, interval=5.0):
+        """Call probe(url) -> bool for every replica every interval seconds in a background thread"""
+        def run():
+            while not self._stop.wait(interval):
+                for url in list(self.replicas):
+                    try:
+                        ok = probe(url)
+                    except Exception:
+                        ok = False
+                    self.record_health(url, ok)
+
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=run, name="replica-health", daemon=True)
+            self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                url: {
+                    "in_flight": replica.in_flight,
+                    "requests": replica.requests,
+                    "failures": replica.failures,
+                    "ejections": replica.ejections,
+                    "ejected_for_s": max(0.0, replica.ejected_until - now),
+                    # Requests this replica owned but passed on because it was over its load bound
+                    "overflow": replica.overflow,
+                }
+                for url, replica in self.replicas.items()
+            }
\ No newline at end of file
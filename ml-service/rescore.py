@@ -0,0 +1,112 @@
+"""
+Re-score the tensor cache with the current models
+Runs the current model files over every image in the preprocessed-tensor
+cache in large batches (no image decoding), fuses them like the service does
+and writes a report of every complaint image whose label changed compared to
+the label stored at classification time. Run it after retraining and
+/models/reload to see what a model upgrade changes across the archive.
+
+Usage:
+    python rescore.py
+    python rescore.py --cache ./tensor_cache --batch_size 512 --update
+"""
+import argparse
+import collections
+import json
+import os
+import time
+from pathlib import Path
+
+from batch_predict import score_batch
+from fit_fusion import ISSUE_TYPES, load_predictors
+from fusion import EnsembleFusion
+from tensor_cache import TensorCache
+
+script_dir = Path(__file__).parent
+weights_dir = script_dir.parent / "ml-models" / "model_weights"
+
+
+def load_fusion():
+    path = weights_dir / "fusion_weights.json"
+    return EnsembleFusion.load(str(path)) if path.exists() else EnsembleFusion.default(ISSUE_TYPES)
+
+
+def rescore(cache, predictors, fusion, batch_size=256, update=False):
+    """Score every cached image; returns the diff report as a dict"""
+    changes = []
+    transitions = collections.Counter()
+    total = 0
+    started = time.perf_counter()
+
+    for entries, tensors in cache.iter_batches(batch_size):
+        decisions = fusion.decide(score_batch(predictors, tensors))
+        new_labels = []
+        for entry, decision in zip(entries, decisions):
+            total += 1
+            if decision is None:
+                continue
+            new_labels.append((entry["hash"], decision["issueType"], decision["confidence"]))
+            if decision["issueType"] != entry["issue_type"]:
+                transitions[f"{entry['issue_type']} -> {decision['issueType']}"] += 1
+                changes.append({
+                    "hash": entry["hash"],
+                    "source": entry["source"],
+                    "old": entry["issue_type"],
+                    "old_confidence": entry["confidence"],
+                    "new": decision["issueType"],
+                    "new_confidence": decision["confidence"],
+                })
+        if update:
+            cache.record_results(new_labels)
+        elapsed = time.perf_counter() - started
+        print(f"  {total} images scored ({total / elapsed:.1f} images/sec), {len(changes)} changed")
+
+    return {
+        "generated_at": time.time(),
+        "models": sorted(predictors),
+        "fusion": fusion.meta,
+        "total": total,
+        "changed": len(changes),
+        "transitions": dict(transitions.most_common()),
+        "changes": changes,
+        "updated": update,
+    }
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Re-score cached image tensors with the current models")
+    parser.add_argument("--cache", default=os.environ.get("ML_TENSOR_CACHE_DIR", str(script_dir / "tensor_cache")))
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--report", default=None, help="Report path (default: <cache>/reports/rescore_<time>.json)")
+    parser.add_argument("--update", action="store_true", help="Store the new labels in the cache index")
+    args = parser.parse_args()
+
+    print("Civic Connect - Archive Re-scoring")
+    print("=" * 45)
+    if not os.path.exists(os.path.join(args.cache, "index.sqlite")):
+        print(f"No tensor cache found at {args.cache}")
+        return
+
+    cache = TensorCache(args.cache)
+    predictors = load_predictors()
+    if not predictors:
+        print("No models could be loaded")
+        return
+    print(f"Models: {sorted(predictors)}, cached images: {len(cache)}")
+
+    report = rescore(cache, predictors, load_fusion(), args.batch_size, args.update)
+
+    report_path = Path(args.report or Path(args.cache) / "reports" / f"rescore_{int(report['generated_at'])}.json")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{report['changed']} of {report['total']} labels changed")
+    for transition, count in report["transitions"].items():
+        print(f"  {transition}: {count}")
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
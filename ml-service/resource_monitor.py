@@ -0,0 +1,114 @@
+"""
+Process resource counters and allocation tracking for long-running services
+process_stats() reads RSS, open file descriptors, threads and leftover upload
+temp files of the current process (from /proc where available). With
+tracemalloc tracing started, top_allocations() lists the allocation sites
+whose live memory grew most since the last baseline, which is what the soak
+test (soak_test.py) reports when memory keeps growing.
+"""
+import glob
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+_baseline_lock = threading.Lock()
+_baseline = None
+_baseline_at = None
+
+
+def rss_bytes():
+    """Current resident set size, or None if the platform does not expose it"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def open_fds():
+    """Number of open file descriptors, or None if the platform does not expose it"""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def native_threads():
+    """OS threads of the process (TensorFlow and BLAS pools included), or None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def process_stats(temp_pattern="tmp*.jpg"):
+    """Snapshot of the process's resource counters"""
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+    return {
+        "time": time.time(),
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "open_fds": open_fds(),
+        "native_threads": native_threads(),
+        "python_threads": threading.active_count(),
+        # Uploads are written to mkstemp(suffix=".jpg") files; any that survive a request leaked
+        "temp_files": len(glob.glob(os.path.join(tempfile.gettempdir(), temp_pattern))),
+        "tracemalloc": {"tracing": tracing, "current_bytes": current, "peak_bytes": peak},
+    }
+
+
+def start_tracing(frames=10):
+    """Start tracemalloc (if needed) and take a new baseline snapshot"""
+    global _baseline, _baseline_at
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    with _baseline_lock:
+        _baseline = tracemalloc.take_snapshot()
+        _baseline_at = time.time()
+    return _baseline_at
+
+
+def stop_tracing():
+    global _baseline, _baseline_at
+    with _baseline_lock:
+        _baseline = None
+        _baseline_at = None
+    tracemalloc.stop()
+
+
+def top_allocations(limit=20, group_by="traceback"):
+    """Allocation sites with the largest growth since the baseline (largest live size without one)"""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    with _baseline_lock:
+        baseline, baseline_at = _baseline, _baseline_at
+    if baseline is not None:
+        stats = snapshot.compare_to(baseline, group_by)
+        stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+    else:
+        stats = snapshot.statistics(group_by)
+
+    sites = []
+    for stat in stats[:limit]:
+        # Oldest frame first, so the allocating line is last, like a Python traceback
+        frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        sites.append({
+            "site": frames[-1] if frames else "?",
+            "size_bytes": stat.size,
+            "count": stat.count,
+            "size_diff_bytes": getattr(stat, "size_diff", None),
+            "count_diff": getattr(stat, "count_diff", None),
+            "traceback": frames,
+        })
+    return {"baseline_at": baseline_at, "group_by": group_by, "sites": sites}
\ No newline at end of file
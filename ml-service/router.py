@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Content-hash router for several ML service replicas
+Round-robin routing scatters repeat images over the replicas and defeats
+their per-process caches. This router forwards every request to a replica
+chosen by consistent hashing (see replica_pool.py):
+
+- uploads (/classify, /severity, /jobs) by the SHA-256 of the image, the
+  imageHash /classify returns
+- /explain/{image_hash} by the hash in the path, i.e. to the replica that
+  classified the image and holds its tensors
+- /similar* always by one fixed key, so the similarity index lives on one
+  replica
+- /jobs/{job_id} to the replica that accepted the job (asking every replica
+  for jobs created before the router started)
+- everything else to the least loaded replica
+
+Connection failures are retried on the next replica on the ring; replicas
+that keep failing, or fail the health check on GET /, are ejected for a
+while. Point the API server's ML_SERVICE_URL at the router.
+
+Usage:
+    python router.py --replicas http://localhost:8001,http://localhost:8002 --port 8000
+    ML_REPLICAS=http://ml-1:8000,http://ml-2:8000 python router.py
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import urllib.error
+import urllib.request
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from replica_pool import ReplicaPool
+from tensor_cache import content_hash
+
+# Hop-by-hop and recomputed headers are not forwarded
+SKIPPED_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "upgrade"}
+
+# All similarity index requests go to the ring owner of this key
+SIMILARITY_KEY = "similarity-index"
+
+app = FastAPI(title="Civic Connect ML Router")
+pool = None
+request_timeout = float(os.environ.get("ML_ROUTER_TIMEOUT", "60"))
+max_attempts = int(os.environ.get("ML_ROUTER_ATTEMPTS", "2"))
+# Job ID -> replica URL of the most recent jobs, for polling
+job_replicas = collections.OrderedDict()
+max_tracked_jobs = 100000
+
+
+def forward(url, method, body, headers, timeout):
+    """(status, headers, body) of a request to a replica; HTTP errors are responses too"""
+    request = urllib.request.Request(url, data=body or None, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def is_healthy(url, timeout=2.0):
+    with urllib.request.urlopen(f"{url}/", timeout=timeout) as response:
+        return response.status == 200
+
+
+async def routing_key(request, path):
+    """Consistent-hash key of a request, or None to use the least loaded replica"""
+    parts = path.split("/")
+    if parts[0] == "explain" and len(parts) > 1:
+        return parts[1]
+    if parts[0] == "similar":
+        return SIMILARITY_KEY
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # The body is cached by Starlette, so it can still be forwarded as is
+        form = await request.form()
+        upload = form.get("file")
+        if upload is not None and hasattr(upload, "read"):
+            return content_hash(await upload.read())
+        if form.get("image_path"):
+            return form["image_path"]
+    return None
+
+
+def job_not_found(status, body):
+    try:
+        return status == 200 and json.loads(body).get("message") == "Job not found"
+    except (ValueError, AttributeError):
+        return False
+
+
+def remember_job(url, status, body):
+    try:
+        job_id = json.loads(body).get("jobId") if status == 200 else None
+    except (ValueError, AttributeError):
+        job_id = None
+    if job_id:
+        job_replicas[job_id] = url
+        while len(job_replicas) > max_tracked_jobs:
+            job_replicas.popitem(last=False)
+
+
+@app.get("/router/stats")
+async def router_stats():
+    """Per-replica load, failures and ejection state"""
+    return {"replicas": pool.stats(), "tracked_jobs": len(job_replicas)}
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def route(path: str, request: Request):
+    """Forward a request to the replica its routing key maps to"""
+    body = await request.body()
+    key = await routing_key(request, path)
+    candidates = pool.candidates(key)
+    parts = path.split("/")
+    attempts = max_attempts
+    polling_job = parts[0] == "jobs" and len(parts) > 1 and request.method == "GET"
+    if polling_job and parts[1] in job_replicas:
+        known = job_replicas[parts[1]]
+        candidates = [known] + [url for url in candidates if url != known]
+    elif polling_job:
+        attempts = len(candidates)
+
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in SKIPPED_HEADERS}
+    target = f"/{path}" + (f"?{request.url.query}" if request.url.query else "")
+    loop = asyncio.get_running_loop()
+    last_error = None
+    for url in candidates[:attempts]:
+        pool.acquire(url)
+        failed = True
+        try:
+            status, response_headers, content = await loop.run_in_executor(
+                None, forward, url + target, request.method, body, headers, request_timeout)
+            failed = status >= 500
+        except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+            last_error = e
+            timed_out = isinstance(e, socket.timeout) or isinstance(getattr(e, "reason", None), socket.timeout)
+            if timed_out:
+                # The replica may still be working on it; do not run the request twice
+                break
+            continue
+        finally:
+            pool.release(url, failed=failed)
+
+        if parts[0] == "jobs" and request.method == "POST":
+            remember_job(url, status, content)
+        if polling_job and parts[1] not in job_replicas and url != candidates[attempts - 1]:
+            if job_not_found(status, content):
+                continue
+            job_replicas[parts[1]] = url
+        forwarded = {name: value for name, value in response_headers.items()
+                     if name.lower() not in SKIPPED_HEADERS and name.lower() != "content-type"}
+        forwarded["X-Ml-Replica"] = url
+        return Response(content, status_code=status, headers=forwarded,
+                        media_type=response_headers.get("Content-Type"))
+
+    return JSONResponse(status_code=502, content={"message": f"No replica could serve the request: {last_error}",
+                                                  "success": False})
+
+
+def main():
+    """Main function"""
+    global pool
+    parser = argparse.ArgumentParser(description="Route ML service requests to replicas by image content hash")
+    parser.add_argument("--replicas", default=os.environ.get("ML_REPLICAS", ""),
+                        help="Comma-separated replica base URLs")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("ML_ROUTER_PORT", "8000")))
+    parser.add_argument("--vnodes", type=int, default=160, help="Virtual nodes per replica")
+    parser.add_argument("--load_factor", type=float, default=1.25,
+                        help="Bound on a replica's in-flight requests relative to the average")
+    parser.add_argument("--max_failures", type=int, default=3, help="Consecutive failures before ejection")
+    parser.add_argument("--eject_seconds", type=float, default=10.0)
+    parser.add_argument("--health_interval", type=float, default=5.0, help="Seconds between health checks")
+    args = parser.parse_args()
+
+    urls = [url.strip().rstrip("/") for url in args.replicas.split(",") if url.strip()]
+    if not urls:
+        parser.error("No replicas given (--replicas or ML_REPLICAS)")
+    pool = ReplicaPool(urls, vnodes=args.vnodes, load_factor=args.load_factor, max_failures=args.max_failures,
+                       eject_seconds=args.eject_seconds)
+    pool.start_health_checks(is_healthy, args.health_interval)
+    print(f"Routing to {len(urls)} replicas: {', '.join(urls)}")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
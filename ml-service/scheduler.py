@@ -0,0 +1,182 @@
+"""
+Priority-lane inference scheduler
+All model work (live /classify requests and queued jobs) goes through one
+scheduler thread that runs micro-batches. Lanes are served by weighted fair
+queuing: every lane has a virtual finish time that advances by
+batch_size / weight each time it is served, and the non-empty lane with the
+smallest virtual time runs next. Scheduling decisions are made at every batch
+boundary and lower lanes use smaller batches, so a large backfill in the bulk
+lane can delay an interactive request by at most one small bulk batch.
+
+Futures are marked running when their item is dequeued. Items whose future
+was cancelled while queued (e.g. an asyncio wrapper of a request whose
+client went away) are dropped, and a running future can no longer be
+cancelled, so delivering its result cannot fail.
+"""
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# lane -> (weight, max batch size)
+DEFAULT_LANES = {
+    "interactive": (8.0, 8),
+    "admin": (3.0, 8),
+    "bulk": (1.0, 4),
+}
+
+
+class _Lane:
+    def __init__(self, name, weight, batch_size, history=1000):
+        self.name = name
+        self.weight = weight
+        self.batch_size = batch_size
+        self.queue = collections.deque()
+        self.virtual_time = 0.0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.waits = collections.deque(maxlen=history)
+        self.run_times = collections.deque(maxlen=history)
+
+
+class InferenceScheduler:
+    """Single-consumer micro-batching scheduler with weighted fair lanes
+
+    handler receives a list of items and returns one entry per item: a
+    result, or an Exception instance that is raised from that item's future.
+    """
+
+    def __init__(self, handler, lanes=None, max_wait_ms=0.0):
+        self.handler = handler
+        self.max_wait = max_wait_ms / 1000.0
+        self.lanes = collections.OrderedDict(
+            (name, _Lane(name, weight, batch_size)) for name, (weight, batch_size) in (lanes or DEFAULT_LANES).items())
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def configure(self, max_wait_ms=None, batch_sizes=None):
+        """Adjust micro-batching parameters at runtime"""
+        with self._cond:
+            if max_wait_ms is not None:
+                self.max_wait = max_wait_ms / 1000.0
+            for name, batch_size in (batch_sizes or {}).items():
+                if name in self.lanes:
+                    self.lanes[name].batch_size = int(batch_size)
+
+    def submit(self, item, lane="interactive"):
+        """Queue an item in a lane and return a Future for its result"""
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {list(self.lanes)}")
+        future = Future()
+        with self._cond:
+            target = self.lanes[lane]
+            if not target.queue:
+                # A lane that was idle must not bank credit for the time it had no work
+                active = [l.virtual_time for l in self.lanes.values() if l.queue]
+                if active:
+                    target.virtual_time = max(target.virtual_time, min(active))
+            target.queue.append((item, future, time.perf_counter()))
+            target.submitted += 1
+            self._cond.notify()
+        return future
+
+    def _next_lane(self):
+        candidates = [lane for lane in self.lanes.values() if lane.queue]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda lane: lane.virtual_time)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                lane = self._next_lane()
+                while lane is None and not self._stop:
+                    self._cond.wait()
+                    lane = self._next_lane()
+                if self._stop:
+                    return
+
+                # Optionally hold a short while so a partial batch can fill up
+                if self.max_wait > 0 and len(lane.queue) < lane.batch_size:
+                    deadline = time.perf_counter() + self.max_wait
+                    while len(lane.queue) < lane.batch_size and not self._stop:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+
+                batch = []
+                while lane.queue and len(batch) < lane.batch_size:
+                    entry = lane.queue.popleft()
+                    if entry[1].set_running_or_notify_cancel():
+                        batch.append(entry)
+                    else:
+                        lane.cancelled += 1
+                if not batch:
+                    continue
+                lane.virtual_time += len(batch) / lane.weight
+
+            self._run_batch(lane, batch)
+
+    def _run_batch(self, lane, batch):
+        started = time.perf_counter()
+        for _, _, queued_at in batch:
+            lane.waits.append(started - queued_at)
+
+        try:
+            results = self.handler([item for item, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        lane.run_times.append(time.perf_counter() - started)
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                # Already resolved elsewhere; a second result would raise and kill this thread
+                continue
+            if isinstance(result, Exception):
+                lane.failed += 1
+                future.set_exception(result)
+            else:
+                lane.completed += 1
+                future.set_result(result)
+
+    def depth(self, lane):
+        return len(self.lanes[lane].queue)
+
+    def stats(self):
+        """Per-lane queue depth, throughput counters and wait-time percentiles"""
+        with self._cond:
+            snapshot = {name: (lane, list(lane.waits), list(lane.run_times)) for name, lane in self.lanes.items()}
+        stats = {}
+        for name, (lane, waits, run_times) in snapshot.items():
+            waits_ms = np.asarray(waits) * 1000.0
+            stats[name] = {
+                "weight": lane.weight,
+                "batch_size": lane.batch_size,
+                "depth": len(lane.queue),
+                "submitted": lane.submitted,
+                "completed": lane.completed,
+                "failed": lane.failed,
+                "cancelled": lane.cancelled,
+                "wait_ms_p50": float(np.percentile(waits_ms, 50)) if len(waits_ms) else None,
+                "wait_ms_p99": float(np.percentile(waits_ms, 99)) if len(waits_ms) else None,
+                "batch_ms_avg": float(np.mean(run_times) * 1000.0) if run_times else None,
+            }
+        return {"max_wait_ms": self.max_wait * 1000.0, "lanes": stats}
\ No newline at end of file
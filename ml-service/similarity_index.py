@@ -0,0 +1,332 @@
+"""
+Image-embedding index for duplicate complaint detection
+Embeddings (ResNet50 pooled features) are L2-normalised and bucketed into a
+fixed geographic grid. A lookup only scans the cells that intersect the search
+radius, filters them by exact distance and ranks the survivors with one NumPy
+dot product per cell, so latency depends on local complaint density rather
+than on the total size of the index.
+
+Persistence is incremental: a directory holds a snapshot (index.npz) and an
+append-only log (index.log) of the inserts and removals since. Every change
+appends one record to the log. Once the log holds as many records as the
+index has entries (and at least compact_min_records), a background thread
+writes a new snapshot and starts a fresh log, so the cost of a snapshot is
+spread over as many inserts as it contains.
+"""
+import json
+import math
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = 111320.0
+
+# Log record: op, complaint id length, latitude, longitude, then the id and (for adds) the vector
+LOG_HEADER = struct.Struct("<BHdd")
+OP_ADD = 1
+OP_REMOVE = 2
+LOG_NAME = "index.log"
+# The previous log while a compaction writes the snapshot that replaces it
+ROTATED_LOG_NAME = "index.log.old"
+
+
+def haversine_m(lat, lon, lats, lons):
+    """Distance in meters from one point to arrays of points"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class _Cell:
+    """Growable block of vectors for one grid cell"""
+
+    def __init__(self, dim, capacity=16):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.coords = np.empty((capacity, 2), dtype=np.float64)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, complaint_id, vector, lat, lon):
+        n = len(self.ids)
+        if n == len(self.vectors):
+            # Double the capacity so inserts stay amortised O(1)
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+            self.coords = np.concatenate([self.coords, np.empty_like(self.coords)])
+        self.vectors[n] = vector
+        self.coords[n] = (lat, lon)
+        self.ids.append(complaint_id)
+        return n
+
+    def remove(self, slot):
+        """Remove a slot by moving the last entry into it; returns the moved id or None"""
+        last = len(self.ids) - 1
+        moved = None
+        if slot != last:
+            self.vectors[slot] = self.vectors[last]
+            self.coords[slot] = self.coords[last]
+            self.ids[slot] = self.ids[last]
+            moved = self.ids[slot]
+        self.ids.pop()
+        return moved
+
+
+def encode_record(op, complaint_id, lat=0.0, lon=0.0, vector=None):
+    encoded_id = complaint_id.encode("utf-8")
+    record = LOG_HEADER.pack(op, len(encoded_id), lat, lon) + encoded_id
+    return record + vector.astype(np.float32).tobytes() if vector is not None else record
+
+
+def read_log(path, dim):
+    """Yield (op, complaint id, lat, lon, vector or None) records, stopping at a torn last record"""
+    vector_bytes = dim * 4
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(LOG_HEADER.size)
+            if len(header) < LOG_HEADER.size:
+                return
+            op, id_length, lat, lon = LOG_HEADER.unpack(header)
+            encoded_id = f.read(id_length)
+            if len(encoded_id) < id_length:
+                return
+            vector = None
+            if op == OP_ADD:
+                data = f.read(vector_bytes)
+                if len(data) < vector_bytes:
+                    return
+                vector = np.frombuffer(data, dtype=np.float32)
+            yield op, encoded_id.decode("utf-8"), lat, lon, vector
+
+
+class EmbeddingIndex:
+    """Location-bucketed vector index of complaint image embeddings"""
+
+    def __init__(self, dim=2048, cell_size_m=500.0, compact_min_records=1000):
+        self.dim = dim
+        self.cell_size_m = float(cell_size_m)
+        self.cell_deg = self.cell_size_m / METERS_PER_DEGREE
+        self.compact_min_records = compact_min_records
+        self.path = None  # directory changes are logged to, if any
+        self._cells = {}
+        self._locations = {}  # complaint id -> (cell key, slot)
+        self._log = None
+        self._log_records = 0
+        self._compacting = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one snapshot at a time
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _cell_key(self, lat, lon):
+        return int(math.floor((lat + 90.0) / self.cell_deg)), int(math.floor((lon + 180.0) / self.cell_deg))
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Expected a {self.dim}-dimensional embedding, got {vector.shape[0]}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def add(self, complaint_id, embedding, latitude, longitude):
+        """Insert or replace the embedding of a complaint"""
+        complaint_id = str(complaint_id)
+        vector = self._normalize(embedding)
+        key = self._cell_key(latitude, longitude)
+        with self._lock:
+            self._remove_locked(complaint_id)
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = _Cell(self.dim)
+            self._locations[complaint_id] = (key, cell.append(complaint_id, vector, latitude, longitude))
+            self._append_log_locked(encode_record(OP_ADD, complaint_id, latitude, longitude, vector))
+
+    def remove(self, complaint_id):
+        """Remove a complaint from the index"""
+        complaint_id = str(complaint_id)
+        with self._lock:
+            removed = self._remove_locked(complaint_id)
+            if removed:
+                self._append_log_locked(encode_record(OP_REMOVE, complaint_id))
+            return removed
+
+    def _append_log_locked(self, record):
+        """Append a change to the log (under the lock, so the log order is the change order)"""
+        if self.path is None:
+            return
+        if self._log is None:
+            os.makedirs(self.path, exist_ok=True)
+            if not os.path.exists(os.path.join(self.path, "index.json")):
+                # The log is only readable with the dimension it was written with
+                self._write_meta(self.path, 0)
+            self._log = open(os.path.join(self.path, LOG_NAME), 'ab')
+        self._log.write(record)
+        self._log.flush()
+        self._log_records += 1
+        if (not self._compacting and self._log_records >= self.compact_min_records
+                and self._log_records >= len(self._locations)):
+            self._compacting = True
+            threading.Thread(target=self._compact, name="similarity-compaction", daemon=True).start()
+
+    def _compact(self):
+        try:
+            self.save(self.path)
+        except Exception as e:
+            print(f"⚠️  Failed to compact the similarity index: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _remove_locked(self, complaint_id):
+        location = self._locations.pop(complaint_id, None)
+        if location is None:
+            return False
+        key, slot = location
+        cell = self._cells[key]
+        moved = cell.remove(slot)
+        if moved is not None:
+            self._locations[moved] = (key, slot)
+        if not len(cell):
+            del self._cells[key]
+        return True
+
+    def search(self, embedding, latitude, longitude, radius_m=100.0, k=5, min_similarity=0.0):
+        """Find the most similar complaints within radius_m of a location"""
+        query = self._normalize(embedding)
+        row, col = self._cell_key(latitude, longitude)
+        row_span = int(math.ceil(radius_m / self.cell_size_m))
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        col_span = int(math.ceil(radius_m / (self.cell_size_m * cos_lat)))
+
+        ids, similarities, distances = [], [], []
+        with self._lock:
+            for r in range(row - row_span, row + row_span + 1):
+                for c in range(col - col_span, col + col_span + 1):
+                    cell = self._cells.get((r, c))
+                    if cell is None:
+                        continue
+                    n = len(cell)
+                    cell_distances = haversine_m(latitude, longitude, cell.coords[:n, 0], cell.coords[:n, 1])
+                    nearby = np.nonzero(cell_distances <= radius_m)[0]
+                    if not len(nearby):
+                        continue
+                    ids.extend(cell.ids[i] for i in nearby)
+                    similarities.append(cell.vectors[nearby] @ query)
+                    distances.append(cell_distances[nearby])
+
+        if not ids:
+            return []
+        similarities = np.concatenate(similarities)
+        distances = np.concatenate(distances)
+        order = np.argsort(-similarities)[:k]
+        return [
+            {"complaint_id": ids[i], "similarity": float(similarities[i]), "distance_m": float(distances[i])}
+            for i in order if similarities[i] >= min_similarity
+        ]
+
+    def save(self, path):
+        """Write a full snapshot to a directory and start a new log there (atomic replace of its files)
+
+        The lock is only held to copy the vectors and rotate the log; the
+        snapshot is written while inserts go on into the new log.
+        """
+        os.makedirs(path, exist_ok=True)
+        with self._save_lock:
+            with self._lock:
+                ids = [cid for cell in self._cells.values() for cid in cell.ids]
+                if ids:
+                    vectors = np.concatenate([cell.vectors[:len(cell)] for cell in self._cells.values()])
+                    coords = np.concatenate([cell.coords[:len(cell)] for cell in self._cells.values()])
+                else:
+                    vectors = np.empty((0, self.dim), dtype=np.float32)
+                    coords = np.empty((0, 2), dtype=np.float64)
+                if self._log is not None:
+                    self._log.close()
+                    self._log = None
+                rotated = None
+                if self.path == path:
+                    # Replayed after the new snapshot if saving is interrupted, which is harmless
+                    rotated = os.path.join(path, ROTATED_LOG_NAME)
+                    if os.path.exists(os.path.join(path, LOG_NAME)):
+                        os.replace(os.path.join(path, LOG_NAME), rotated)
+                self._log_records = 0
+                self.path = path
+
+            tmp_path = os.path.join(path, "index.tmp.npz")
+            np.savez(tmp_path, vectors=vectors, coords=coords, ids=np.asarray(ids, dtype=object))
+            os.replace(tmp_path, os.path.join(path, "index.npz"))
+            self._write_meta(path, len(ids))
+            if rotated and os.path.exists(rotated):
+                os.remove(rotated)
+
+    def _write_meta(self, path, count):
+        meta = {"dim": self.dim, "cell_size_m": self.cell_size_m, "count": count, "saved_at": time.time()}
+        tmp_path = os.path.join(path, "index.tmp.json")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, "index.json"))
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    @classmethod
+    def load(cls, path, dim=2048, cell_size_m=500.0, compact_min_records=1000):
+        """Load an index (snapshot plus log) from a directory, or create an empty one bound to it"""
+        meta_path = os.path.join(path, "index.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            dim, cell_size_m = meta["dim"], meta["cell_size_m"]
+
+        index = cls(dim=dim, cell_size_m=cell_size_m, compact_min_records=compact_min_records)
+        data_path = os.path.join(path, "index.npz")
+        if os.path.exists(data_path):
+            data = np.load(data_path, allow_pickle=True)
+            for complaint_id, vector, (lat, lon) in zip(data["ids"], data["vectors"], data["coords"]):
+                index.add(complaint_id, vector, lat, lon)
+
+        rotated_path = os.path.join(path, ROTATED_LOG_NAME)
+        log_path = os.path.join(path, LOG_NAME)
+        for replay_path in (rotated_path, log_path):
+            if not os.path.exists(replay_path):
+                continue
+            valid_bytes = 0
+            for op, complaint_id, lat, lon, vector in read_log(replay_path, index.dim):
+                if op == OP_ADD:
+                    index.add(complaint_id, vector, lat, lon)
+                else:
+                    index.remove(complaint_id)
+                valid_bytes += LOG_HEADER.size + len(complaint_id.encode("utf-8")) + (
+                    vector.nbytes if vector is not None else 0)
+                if replay_path == log_path:
+                    index._log_records += 1
+            if valid_bytes < os.path.getsize(replay_path):
+                # Drop a record torn by a crash so new records can be appended after the last whole one
+                os.truncate(replay_path, valid_bytes)
+        index.path = path
+        if os.path.exists(rotated_path):
+            # A compaction was interrupted; fold both logs into a new snapshot before appending again
+            index.save(path)
+        return index
+
+    def stats(self):
+        """Summary of the index contents"""
+        with self._lock:
+            sizes = [len(cell) for cell in self._cells.values()]
+        return {
+            "count": len(self._locations),
+            "cells": len(sizes),
+            "log_records": self._log_records,
+            "max_cell_size": max(sizes) if sizes else 0,
+            "dim": self.dim,
+            "cell_size_m": self.cell_size_m,
+        }
\ No newline at end of file
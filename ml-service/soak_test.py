@@ -0,0 +1,294 @@
+"""
+Soak test for the ML service
+Drives the service's endpoints continuously from a few concurrent clients for
+a configurable duration while sampling its resource counters from
+/debug/memory: RSS, open file descriptors, threads, leftover upload temp files
+and job images. After a warm-up the service's tracemalloc baseline is reset,
+so the final report can name the allocation sites that grew since.
+
+Growth is measured between the medians of the first and last tenth of the
+post-warm-up samples. The run fails (exit status 1) if RSS grows by more than
+--max_rss_growth_mb or file descriptors, threads, temp files or job images
+keep growing, and prints the allocation sites responsible.
+
+The service must run with ML_ADMIN_TOKEN set; pass the same token with
+--admin_token or the ML_ADMIN_TOKEN environment variable.
+
+Usage:
+    python soak_test.py --duration 3600
+    python soak_test.py --url http://localhost:8000 --duration 600 --concurrency 8 --endpoints classify,similar
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def post_image(path, **kwargs):
+    def send(session, url, image, rng):
+        return session.post(f"{url}{path}", files={"file": ("soak.jpg", image, "image/jpeg")}, **kwargs)
+    return send
+
+
+def random_location(rng):
+    return {"latitude": rng.uniform(12.8, 13.1), "longitude": rng.uniform(77.4, 77.8)}
+
+
+# Endpoint name -> request function(session, base url, image bytes, rng)
+ENDPOINTS = {
+    "classify": post_image("/classify"),
+    "classify_tiled": post_image("/classify", params={"tiled": "true", "tile_budget": 5}),
+    "severity": post_image("/severity"),
+    "similar": lambda session, url, image, rng: session.post(
+        f"{url}/similar", files={"file": ("soak.jpg", image, "image/jpeg")}, data=random_location(rng)),
+    "area-type": lambda session, url, image, rng: session.post(f"{url}/area-type", params=random_location(rng)),
+    "jobs": post_image("/jobs", data={"priority": "bulk"}),
+}
+
+# Counters compared between the start and the end of the run
+COUNTERS = ["rss_bytes", "open_fds", "native_threads", "temp_files", "job_images"]
+
+
+class LoadGenerator:
+    """Concurrent clients calling random endpoints until stopped"""
+
+    def __init__(self, url, endpoints, images, concurrency=4, seed=None):
+        self.url = url.rstrip("/")
+        self.endpoints = endpoints
+        self.images = images
+        self.concurrency = concurrency
+        self.seed = seed
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _client(self, index):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        session = requests.Session()
+        while not self._stop.is_set():
+            name = rng.choice(self.endpoints)
+            started = time.perf_counter()
+            try:
+                response = ENDPOINTS[name](session, self.url, rng.choice(self.images), rng)
+                status = str(response.status_code)
+                if response.ok and response.headers.get("content-type", "").startswith("application/json"):
+                    body = response.json()
+                    if body.get("success") is False or "error" in body:
+                        status = "failed"
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.latencies[name].append(elapsed)
+                self.statuses[name][status] += 1
+        session.close()
+
+    def run(self, seconds):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for index in range(self.concurrency):
+                pool.submit(self._client, index)
+            self._stop.wait(seconds)
+            self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+
+    def summary(self):
+        with self._lock:
+            return {
+                name: {
+                    "requests": len(latencies),
+                    "statuses": dict(self.statuses[name]),
+                    "p50_ms": statistics.median(latencies) * 1000.0,
+                    "p99_ms": sorted(latencies)[int(0.99 * (len(latencies) - 1))] * 1000.0,
+                }
+                for name, latencies in self.latencies.items() if latencies
+            }
+
+
+class ServiceMonitor:
+    """Client for the service's /debug/memory endpoints"""
+
+    def __init__(self, url, admin_token):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["X-Admin-Token"] = admin_token or ""
+
+    def sample(self, top=0):
+        response = self.session.get(f"{self.url}/debug/memory", params={"top": top}, timeout=120)
+        if response.status_code == 403:
+            raise SystemExit("The service rejected the admin token (set ML_ADMIN_TOKEN on both sides)")
+        response.raise_for_status()
+        return response.json()
+
+    def reset_baseline(self, frames):
+        self.session.post(f"{self.url}/debug/memory/baseline", params={"frames": frames}, timeout=120).raise_for_status()
+
+    def stop_tracing(self):
+        self.session.delete(f"{self.url}/debug/memory/baseline", timeout=30)
+
+
+def growth(samples, key):
+    """Start/end medians, total growth and least-squares growth rate of one counter"""
+    points = [(sample["time"], sample[key]) for sample in samples if sample.get(key) is not None]
+    if len(points) < 2:
+        return None
+    window = max(1, len(points) // 10)
+    start = statistics.median(value for _, value in points[:window])
+    end = statistics.median(value for _, value in points[-window:])
+    times = [t for t, _ in points]
+    mean_t = statistics.fmean(times)
+    mean_v = statistics.fmean(value for _, value in points)
+    variance = sum((t - mean_t) ** 2 for t in times)
+    slope = sum((t - mean_t) * (value - mean_v) for t, value in points) / variance if variance else 0.0
+    return {"start": start, "end": end, "growth": end - start, "per_hour": slope * 3600.0}
+
+
+def check_limits(growths, args):
+    """Failure messages for counters that grew past their limits"""
+    limits = {
+        "rss_bytes": args.max_rss_growth_mb * 2**20,
+        "open_fds": args.max_fd_growth,
+        "native_threads": args.max_thread_growth,
+        "temp_files": args.max_temp_file_growth,
+        "job_images": args.max_job_image_growth,
+    }
+    failures = []
+    for key, limit in limits.items():
+        result = growths.get(key)
+        if result is not None and result["growth"] > limit:
+            failures.append(f"{key} grew by {result['growth']:,.0f} (limit {limit:,.0f}, "
+                            f"{result['per_hour']:,.0f} per hour)")
+    return failures
+
+
+def print_allocations(top_allocations, frames=4):
+    if not top_allocations or not top_allocations.get("sites"):
+        print("  (no tracemalloc data; run without --no_tracemalloc)")
+        return
+    for site in top_allocations["sites"]:
+        print(f"  +{(site['size_diff_bytes'] or 0) / 2**20:8.2f} MB  {site['count_diff'] or 0:+8d} blocks  {site['site']}")
+        for frame in site["traceback"][-frames:-1][::-1]:
+            print(f"      from {frame}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Soak-test the ML service and watch for resource leaks")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--admin_token", default=os.environ.get("ML_ADMIN_TOKEN"))
+    parser.add_argument("--duration", type=float, default=600.0, help="Seconds of load after warm-up")
+    parser.add_argument("--warmup", type=float, default=60.0, help="Seconds of load before the baseline")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--endpoints", default="classify,severity,similar,area-type",
+                        help=f"Comma-separated, from {sorted(ENDPOINTS)}")
+    parser.add_argument("--images", nargs="+", default=["test_image.jpg"])
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between resource samples")
+    parser.add_argument("--top", type=int, default=15, help="Allocation sites to report")
+    parser.add_argument("--frames", type=int, default=10, help="tracemalloc frames per allocation")
+    parser.add_argument("--no_tracemalloc", action="store_true", help="Do not trace allocations on the service")
+    parser.add_argument("--max_rss_growth_mb", type=float, default=100.0)
+    parser.add_argument("--max_fd_growth", type=int, default=16)
+    parser.add_argument("--max_thread_growth", type=int, default=8)
+    parser.add_argument("--max_temp_file_growth", type=int, default=4)
+    parser.add_argument("--max_job_image_growth", type=int, default=16,
+                        help="Queued job images may back up under load; a steady climb is a leak")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="JSON report path (default: soak_<time>.json)")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints {unknown}, expected some of {sorted(ENDPOINTS)}")
+    images = []
+    for path in args.images:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+
+    print("Civic Connect - ML Service Soak Test")
+    print("=" * 45)
+    monitor = ServiceMonitor(args.url, args.admin_token)
+    samples = [monitor.sample()]
+    load = LoadGenerator(args.url, endpoints, images, args.concurrency, args.seed)
+    runner = threading.Thread(target=load.run, args=(args.warmup + args.duration,), daemon=True)
+    started = time.time()
+    runner.start()
+
+    baseline_reset = False
+    try:
+        while runner.is_alive():
+            runner.join(args.interval)
+            if not baseline_reset and time.time() - started >= args.warmup:
+                if not args.no_tracemalloc:
+                    monitor.reset_baseline(args.frames)
+                baseline_reset = True
+                print(f"Warm-up done, measuring for {args.duration:.0f}s")
+            sample = monitor.sample()
+            sample["phase"] = "measure" if baseline_reset else "warmup"
+            samples.append(sample)
+            rss = sample.get("rss_bytes")
+            print(f"  {time.time() - started:7.0f}s  rss {rss / 2**20 if rss else float('nan'):8.1f} MB  "
+                  f"fds {sample.get('open_fds')}  threads {sample.get('native_threads')}  "
+                  f"temp files {sample.get('temp_files')}  job images {sample.get('job_images')}")
+    except KeyboardInterrupt:
+        print("Interrupted, stopping the load")
+        load.stop()
+        runner.join()
+
+    final = monitor.sample(top=args.top)
+    final["phase"] = "measure"
+    samples.append(final)
+    if not args.no_tracemalloc:
+        monitor.stop_tracing()
+
+    measured = [sample for sample in samples if sample.get("phase") == "measure"]
+    growths = {key: growth(measured, key) for key in COUNTERS}
+    failures = check_limits(growths, args)
+    report = {
+        "url": args.url,
+        "started_at": started,
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency,
+        "requests": load.summary(),
+        "growth": growths,
+        "failures": failures,
+        "top_allocations": final.get("top_allocations"),
+        "samples": samples,
+    }
+    output = args.output or f"soak_{int(started)}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\nRequests:")
+    for name, stats in report["requests"].items():
+        print(f"  {name:<16}{stats['requests']:>8}  p50 {stats['p50_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  "
+              f"{stats['statuses']}")
+    print("Growth after warm-up:")
+    for key, result in growths.items():
+        if result is not None:
+            print(f"  {key:<16}{result['start']:>14,.0f} -> {result['end']:>14,.0f}  ({result['per_hour']:+,.0f}/h)")
+    print(f"Report written to {output}")
+
+    if failures:
+        print("\n❌ Soak test failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        print("Allocation sites that grew most since the baseline:")
+        print_allocations(final.get("top_allocations"))
+        sys.exit(1)
+    print("\n✅ No resource growth beyond the limits")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
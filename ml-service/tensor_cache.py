@@ -0,0 +1,186 @@
+"""
+Content-addressed cache of preprocessed image tensors
+Each classified image is stored once, keyed by the SHA-256 of its bytes, as
+the uint8 arrays the predictors compute before normalisation: 224x224 RGB for
+the ResNet50 models and 64x64 RGB for SimpleCNN. The arrays live in one
+memory-mapped file per size and a SQLite index maps hashes to rows together
+with the label the service returned, so rescore.py can run new model
+versions over the whole archive in large batches without decoding a single
+upload again.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# Canonical tensor name -> (width, height), matching the predictors' preprocessing
+CANONICAL_SIZES = {
+    "224": (224, 224),
+    "64": (64, 64),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tensors (
+    hash TEXT PRIMARY KEY,
+    row INTEGER NOT NULL UNIQUE,
+    source TEXT,
+    issue_type TEXT,
+    confidence REAL,
+    created_at REAL NOT NULL,
+    scored_at REAL
+);
+"""
+
+
+def content_hash(data):
+    """SHA-256 hex digest of image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def canonical_tensors(image, sizes=CANONICAL_SIZES):
+    """uint8 RGB arrays of an image (path or PIL image) at every canonical size"""
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image = image.convert('RGB')
+    return {name: np.asarray(image.resize(size), dtype=np.uint8) for name, size in sizes.items()}
+
+
+def to_float(images):
+    """uint8 tensors to the float32 0-1 range the predictors use"""
+    return images.astype(np.float32) / 255.0
+
+
+class TensorCache:
+    """Memory-mapped, hash-keyed store of canonical image tensors"""
+
+    def __init__(self, path, sizes=CANONICAL_SIZES, initial_capacity=1024):
+        self.path = path
+        self.sizes = dict(sizes)
+        self.initial_capacity = initial_capacity
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tensors").fetchone()[0]
+
+    def __contains__(self, image_hash):
+        return self.lookup(image_hash) is not None
+
+    def _data_path(self, name):
+        return os.path.join(self.path, f"tensors_{name}.u8")
+
+    def _row_bytes(self, name):
+        width, height = self.sizes[name]
+        return width * height * 3
+
+    def _capacity(self, name):
+        path = self._data_path(name)
+        return os.path.getsize(path) // self._row_bytes(name) if os.path.exists(path) else 0
+
+    def _memmap(self, name):
+        """Memory map of a tensor file, reopened whenever the file has grown"""
+        capacity = self._capacity(name)
+        current = self._maps.get(name)
+        if current is None or len(current) != capacity:
+            width, height = self.sizes[name]
+            current = np.memmap(self._data_path(name), dtype=np.uint8, mode='r+', shape=(capacity, height, width, 3))
+            self._maps[name] = current
+        return current
+
+    def _ensure_capacity(self, rows):
+        for name in self.sizes:
+            capacity = self._capacity(name)
+            if capacity >= rows:
+                continue
+            new_capacity = max(rows, capacity * 2, self.initial_capacity)
+            with open(self._data_path(name), 'ab') as f:
+                f.truncate(new_capacity * self._row_bytes(name))
+
+    def put(self, image_hash, image, source=None, result=None):
+        """Store an image's tensors (if new) and the label it was given; returns its row"""
+        # Decode outside the lock; a concurrent insert of the same image is resolved below
+        tensors = None if image_hash in self else canonical_tensors(image, self.sizes)
+        now = time.time()
+        with self._lock:
+            # The write lock serialises row allocation and file growth between processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._conn.execute("SELECT row FROM tensors WHERE hash = ?", (image_hash,)).fetchone()
+                if found is None:
+                    if tensors is None:
+                        tensors = canonical_tensors(image, self.sizes)
+                    row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM tensors").fetchone()[0]
+                    self._ensure_capacity(row + 1)
+                    for name, array in tensors.items():
+                        data = self._memmap(name)
+                        data[row] = array
+                        data.flush()
+                    self._conn.execute(
+                        "INSERT INTO tensors (hash, row, source, created_at) VALUES (?, ?, ?, ?)",
+                        (image_hash, row, source, now))
+                else:
+                    row = found["row"]
+                if result is not None:
+                    self._conn.execute(
+                        "UPDATE tensors SET issue_type = ?, confidence = ?, scored_at = ? WHERE hash = ?",
+                        (result["issueType"], result["confidence"], now, image_hash))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return row
+
+    def lookup(self, image_hash):
+        """Index entry of a hash as a dict, or None"""
+        with self._lock:
+            found = self._conn.execute("SELECT * FROM tensors WHERE hash = ?", (image_hash,)).fetchone()
+        return dict(found) if found else None
+
+    def get(self, image_hash, name="224"):
+        """uint8 tensor of a cached image at one canonical size, or None"""
+        entry = self.lookup(image_hash)
+        if entry is None:
+            return None
+        with self._lock:
+            return np.array(self._memmap(name)[entry["row"]])
+
+    def record_results(self, results):
+        """Store new labels for many hashes: iterable of (hash, issue_type, confidence)"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE tensors SET issue_type = ?, confidence = ?, scored_at = ? WHERE hash = ?",
+                [(issue_type, confidence, now, image_hash) for image_hash, issue_type, confidence in results])
+            self._conn.commit()
+
+    def iter_batches(self, batch_size=256):
+        """Yield (index entries, {size name: uint8 batch}) over the whole cache in row order"""
+        with self._lock:
+            entries = [dict(row) for row in self._conn.execute("SELECT * FROM tensors ORDER BY row")]
+        for offset in range(0, len(entries), batch_size):
+            chunk = entries[offset:offset + batch_size]
+            rows = np.array([entry["row"] for entry in chunk])
+            with self._lock:
+                # Fancy indexing copies the rows out of the memory map
+                batches = {name: self._memmap(name)[rows] for name in self.sizes}
+            yield chunk, batches
+
+    def stats(self):
+        count = len(self)
+        return {
+            "path": self.path,
+            "count": count,
+            "bytes": sum(self._capacity(name) * self._row_bytes(name) for name in self.sizes),
+        }
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Test the content-hash router (router.py) against local stub replicas
+Starts three stub processes that answer like the ML service and report which
+replica served a request, then the router in front of them, and checks that
+repeat images stick to one replica, that keys spread over all replicas, and
+that a killed replica is ejected and its keys fail over.
+
+Usage:
+    python test_router.py
+"""
+import hashlib
+import http.server
+import json
+import subprocess
+import sys
+import time
+
+import requests
+
+STUB_PORTS = [8101, 8102, 8103]
+ROUTER_PORT = 8100
+
+
+def run_stub(port):
+    """A stand-in replica: GET / is healthy, other requests echo the replica and body size"""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def _reply(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply({"message": "Civic Connect ML Service", "replica": port})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            self._reply({"issueType": "other", "confidence": 0.0, "replica": port, "bytes": length})
+
+        def log_message(self, *args):
+            pass
+
+    http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def wait_for(url, seconds=15.0):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def classify(image):
+    response = requests.post(f"http://localhost:{ROUTER_PORT}/classify",
+                             files={"file": ("test.jpg", image, "image/jpeg")}, timeout=10)
+    return response.json()["replica"]
+
+
+def check(name, ok):
+    print(f"{'✅' if ok else '❌'} {name}")
+    return ok
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--stub":
+        run_stub(int(sys.argv[2]))
+        return
+
+    stubs = {port: subprocess.Popen([sys.executable, __file__, "--stub", str(port)]) for port in STUB_PORTS}
+    replicas = ",".join(f"http://127.0.0.1:{port}" for port in STUB_PORTS)
+    router = subprocess.Popen([sys.executable, "router.py", "--replicas", replicas, "--port", str(ROUTER_PORT),
+                               "--max_failures", "1", "--health_interval", "1"])
+    passed = True
+    try:
+        for port in STUB_PORTS:
+            wait_for(f"http://127.0.0.1:{port}/")
+        if not wait_for(f"http://localhost:{ROUTER_PORT}/router/stats"):
+            print("❌ Router did not start")
+            sys.exit(1)
+
+        images = [hashlib.sha256(str(i).encode()).digest() * 64 for i in range(60)]
+        first = [classify(image) for image in images]
+        second = [classify(image) for image in images]
+        passed &= check("Repeat images go to the same replica", first == second)
+        passed &= check(f"Keys spread over all replicas {sorted(set(first))}", set(first) == set(STUB_PORTS))
+
+        victim = STUB_PORTS[0]
+        stubs[victim].terminate()
+        stubs[victim].wait()
+        after = [classify(image) for image in images]
+        passed &= check("Requests fail over while a replica is down", victim not in after)
+        moved = [i for i in range(len(images)) if first[i] != after[i]]
+        passed &= check(f"Only the dead replica's keys moved ({len(moved)} of {len(images)})",
+                        all(first[i] == victim for i in moved))
+
+        stubs[victim] = subprocess.Popen([sys.executable, __file__, "--stub", str(victim)])
+        wait_for(f"http://127.0.0.1:{victim}/")
+        # The health check readmits the replica within a couple of intervals
+        time.sleep(3)
+        back = [classify(image) for image in images]
+        passed &= check("Keys return once the replica is healthy again", back == first)
+        print(json.dumps(requests.get(f"http://localhost:{ROUTER_PORT}/router/stats").json(), indent=2))
+    finally:
+        router.terminate()
+        for stub in stubs.values():
+            stub.terminate()
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
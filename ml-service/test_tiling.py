@@ -0,0 +1,77 @@
+"""
+Test tile planning and early stopping of tiled inference (tiling.py)
+Runs offline with a stand-in predictor; no models or service needed.
+
+Usage:
+    python test_tiling.py
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from tiling import plan_tiles, predict_tiled
+
+
+class StubPredictor:
+    """Answers "pothole" with the given confidence for every image, counting the images scored"""
+
+    input_size = (224, 224)
+
+    def __init__(self, confidence):
+        self.confidence = confidence
+        self.calls = []
+
+    def predict_batch(self, batch):
+        self.calls.append(len(batch))
+        rest = (1.0 - self.confidence) / 2
+        return [{"class": "pothole", "confidence": self.confidence,
+                 "all_predictions": {"pothole": self.confidence, "garbage": rest, "other": rest}}
+                for _ in batch]
+
+
+def check(name, ok):
+    print(f"{'✅' if ok else '❌'} {name}")
+    return ok
+
+
+def covers(boxes, width, height):
+    """Every pixel column and row of the image lies in some tile"""
+    columns = np.zeros(width, dtype=bool)
+    rows = np.zeros(height, dtype=bool)
+    for left, top, right, bottom in boxes:
+        columns[left:right] = True
+        rows[top:bottom] = True
+    return columns.all() and rows.all()
+
+
+def main():
+    passed = True
+    for width, height in [(4000, 3000), (3000, 4000), (4000, 2000), (2400, 1000), (4000, 1000),
+                          (1000, 4000), (2000, 4000)]:
+        boxes = plan_tiles(width, height, 9)
+        passed &= check(f"{width}x{height}: {len(boxes)} tiles within the budget, covering the photo",
+                        0 < len(boxes) <= 8 and covers(boxes, width, height))
+        passed &= check(f"{width}x{height}: tiles are square and inside the photo",
+                        all(right - left == bottom - top and right <= width and bottom <= height
+                            for left, top, right, bottom in boxes))
+
+    path = os.path.join(tempfile.mkdtemp(), "wide.jpg")
+    Image.fromarray(np.zeros((1000, 4000, 3), dtype=np.uint8)).save(path)
+
+    confident = StubPredictor(0.95)
+    result = predict_tiled(confident, path, tile_budget=9, threshold=0.8)
+    passed &= check(f"A confident whole image skips the tiles (batches {confident.calls})",
+                    confident.calls == [1] and result["tiles"]["early_stop"])
+
+    unsure = StubPredictor(0.5)
+    result = predict_tiled(unsure, path, tile_budget=9, threshold=0.8)
+    passed &= check(f"An unsure image is tiled (batches {unsure.calls}, {result['tiles']})",
+                    sum(unsure.calls) == result["tiles"]["planned"] > 1 and not result["tiles"]["early_stop"])
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Tiled inference for large photos
+A pothole or a small pile of litter in one corner of a 12 MP photo all but
+disappears when the whole photo is squashed to 224x224. In tiled mode the
+image is scored as a whole and as a grid of overlapping tiles at the model's
+input resolution. The whole image is scored first on its own, then the tiles
+in batches, and scoring stops as soon as the image or any tile is confidently
+positive or the tile budget is used up, so latency is bounded by the
+request's budget. Photos too wide or tall for even a 2-tile grid in the
+budget get one row of short-side squares along their long axis instead.
+
+Tile scores are aggregated per class: positive classes take their maximum
+over all tiles (an object anywhere counts), background classes such as
+"other" or "not_garbage" take their minimum (the photo is only background if
+every tile is), and the result is renormalised.
+"""
+import math
+
+import numpy as np
+from PIL import Image
+
+from batch_predict import predict_batch
+from fusion import normalize_label
+
+# Labels that mean "nothing found" for the civic and garbage models
+BACKGROUND_LABELS = {"other", "not_garbage", "non_garbage", "no_garbage", "clean"}
+
+
+def is_background(class_name):
+    return normalize_label(class_name) in BACKGROUND_LABELS
+
+
+def grid_boxes(width, height, grid, overlap):
+    """Overlapping square tiles covering the image, grid tiles along the short side"""
+    short = min(width, height)
+    side = short / (1 + (grid - 1) * (1 - overlap))
+    stride = side * (1 - overlap)
+    boxes = []
+    for axis_length in (height, width):
+        count = max(1, math.ceil((axis_length - side) / stride - 1e-9) + 1)
+        # Spread the tiles so the last one is flush with the edge
+        step = (axis_length - side) / (count - 1) if count > 1 else 0
+        boxes.append([int(round(i * step)) for i in range(count)])
+    tops, lefts = boxes
+    return [(left, top, int(left + side), int(top + side)) for top in tops for left in lefts]
+
+
+def strip_boxes(width, height, count, overlap):
+    """Up to count squares of the short side along the long axis, spread edge to edge"""
+    short, long = min(width, height), max(width, height)
+    needed = max(1, math.ceil((long - short) / (short * (1 - overlap)) - 1e-9) + 1)
+    count = min(count, needed)
+    step = (long - short) / (count - 1) if count > 1 else (long - short) / 2
+    starts = [int(round(i * step)) for i in range(count)] if count > 1 else [int(round(step))]
+    if width >= height:
+        return [(start, 0, start + short, short) for start in starts]
+    return [(0, start, short, start + short) for start in starts]
+
+
+def plan_tiles(width, height, tile_budget, max_grid=4, overlap=0.25):
+    """Tile boxes of the finest grid whose tiles plus the whole image fit in the budget
+
+    If not even the 2-tile grid fits (wide or tall photos), one row of
+    short-side squares along the long axis is used instead.
+    """
+    best = []
+    for grid in range(2, max_grid + 1):
+        boxes = grid_boxes(width, height, grid, overlap)
+        if 1 + len(boxes) > tile_budget:
+            break
+        best = boxes
+    if not best and tile_budget > 1 and max(width, height) > min(width, height):
+        best = strip_boxes(width, height, tile_budget - 1, overlap)
+    return best
+
+
+def _aggregate(results):
+    """Combine per-tile result dicts into one (max for objects, min for background)"""
+    class_names = list(results[0]["all_predictions"])
+    scores = np.array([[result["all_predictions"][name] for name in class_names] for result in results])
+    background = np.array([is_background(name) for name in class_names])
+    combined = np.where(background, scores.min(axis=0), scores.max(axis=0))
+    combined = combined / combined.sum() if combined.sum() > 0 else combined
+    best = int(np.argmax(combined))
+    return {
+        "class": class_names[best],
+        "confidence": float(combined[best]),
+        "all_predictions": {name: float(p) for name, p in zip(class_names, combined)},
+    }
+
+
+def _confident_object(result, threshold):
+    return not is_background(result["class"]) and result["confidence"] >= threshold
+
+
+def predict_tiled(predictor, image_path, heads=None, tile_budget=9, threshold=0.8, overlap=0.25,
+                  max_grid=4, batch_size=8):
+    """Score an image and its tiles with a batch-capable predictor
+
+    heads selects outputs of a multi-head predictor (results are then returned
+    per head); otherwise one result dict is returned. Each result carries a
+    "tiles" summary: tiles scored, tiles planned and whether it stopped early.
+    """
+    input_size = tuple(getattr(predictor, "input_size", (224, 224)))
+    image = Image.open(image_path)
+    tile_budget = max(1, tile_budget)
+    # Decode large JPEGs at reduced resolution, keeping tiles at least at input size
+    scale = max_grid if tile_budget > 1 else 1
+    image.draft("RGB", (input_size[0] * scale, input_size[1] * scale))
+    image = image.convert('RGB')
+
+    tiles = plan_tiles(image.width, image.height, tile_budget, max_grid, overlap)
+    boxes = [None] + tiles
+    # The whole image runs alone first: a confident answer there skips every tile
+    chunks = [[None]] + [tiles[offset:offset + batch_size] for offset in range(0, len(tiles), batch_size)]
+    tile_results = []
+    early_stop = False
+    for k, chunk in enumerate(chunks):
+        batch = np.stack([
+            np.asarray((image if box is None else image.crop(box)).resize(input_size), dtype=np.float32) / 255.0
+            for box in chunk
+        ])
+        outputs = predictor.predict_batch(batch) if heads else predict_batch(predictor, batch)
+        tile_results.extend(outputs)
+        if any(_confident_object(output[head] if heads else output, threshold)
+               for output in outputs for head in (heads or [None])):
+            early_stop = k + 1 < len(chunks)
+            break
+
+    summary = {"scored": len(tile_results), "planned": len(boxes), "early_stop": early_stop}
+    if not heads:
+        return dict(_aggregate(tile_results), tiles=summary)
+    return {head: dict(_aggregate([output[head] for output in tile_results]), tiles=summary) for head in heads}
\ No newline at end of file
@@ -7,8 +7,8 @@ import os
 import shutil
 from pathlib import Path
 
-# Use absolute path
-BASE_DIR = Path("e:/mini/civic-connect")
+# Use relative path based on script location
+BASE_DIR = Path(__file__).parent.parent
 
 def cleanup_remaining_files():
     """Move remaining files from Garbage to garbage directory"""
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Dataset ingestion script for Civic Connect ML models
+Scans the raw source folders in parallel, drops exact duplicates by content hash
+and organizes the unique images into the class structure used for training:
+data/raw/
+├── pothole/
+├── garbage/
+├── streetlight/
+└── water_leak/
+
+Every ingested file is recorded in data/raw/manifest.json (path, class, hash,
+size, dimensions). On re-runs only files whose size or mtime changed since the
+previous run are hashed again, so organizing a large corpus a second time is
+just a directory scan. With --copy the sources stay in place, so their hashes
+are recorded under "sources" and reused the same way.
+
+A source folder that is the same directory as a class folder (Garbage and
+garbage on a case-insensitive filesystem) is skipped, and files recorded in
+the manifest are never deleted as duplicates.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Use relative path based on script location
+BASE_DIR = Path(__file__).parent.parent
+RAW_DIR = BASE_DIR / "data" / "raw"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+CATEGORIES = ["pothole", "garbage", "streetlight", "water_leak"]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Source folders (relative to data/raw) -> (class, prefix for ingested file names)
+SOURCES = {
+    "pothole_image_data/Pothole_Image_Data": ("pothole", ""),
+    "Garbage": ("garbage", ""),
+    "trash/trash": ("garbage", "trash_"),
+}
+
+# Folders that only hold annotations and can be dropped once ingested
+ANNOTATION_DIRS = ["annotation"]
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def load_manifest(manifest_path):
+    """Load a dataset manifest, returning an empty one if it does not exist"""
+    manifest_path = Path(manifest_path)
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+            print(f"Ignoring manifest with unknown version: {manifest_path}")
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def save_manifest(manifest, manifest_path):
+    """Atomically write a dataset manifest"""
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def scan_directory(directory):
+    """List image files in a directory with their size and mtime (one scandir pass)"""
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    entries.append((Path(entry.path), stat.st_size, stat.st_mtime))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def describe_file(path):
+    """Hash a file and read its image dimensions from the header"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    width = height = None
+    if Image is not None:
+        try:
+            with Image.open(path) as img:
+                width, height = img.size
+        except Exception:
+            pass
+
+    return {"sha256": digest.hexdigest(), "width": width, "height": height}
+
+
+def is_unchanged(record, size, mtime):
+    """Check whether a manifest record still matches the file on disk"""
+    return record is not None and record.get("size") == size and record.get("mtime") == mtime
+
+
+def is_class_directory(directory, raw_dir):
+    """Check whether a source folder is one of the class folders under another name"""
+    if not directory.is_dir():
+        return False
+    for category in CATEGORIES:
+        class_dir = raw_dir / category
+        if class_dir.is_dir() and os.path.samefile(directory, class_dir):
+            return True
+    return False
+
+
+def unique_destination(dest_dir, name, sha256):
+    """Pick a destination name, disambiguating collisions with the content hash"""
+    destination = dest_dir / name
+    if not destination.exists():
+        return destination
+    stem, suffix = os.path.splitext(name)
+    return dest_dir / f"{stem}_{sha256[:8]}{suffix}"
+
+
+def ingest(raw_dir=RAW_DIR, copy=False, dry_run=False, cleanup=False, workers=None):
+    """Scan, deduplicate and organize the raw dataset, updating its manifest"""
+    raw_dir = Path(raw_dir)
+    manifest_path = raw_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    files = manifest["files"]
+    sources = manifest.get("sources", {})
+    start = time.time()
+
+    # Scan the class folders and the source folders in parallel
+    scan_targets = [(category, None, "") for category in CATEGORIES]
+    for source, (cls, prefix) in SOURCES.items():
+        if is_class_directory(raw_dir / source, raw_dir):
+            print(f"Skipping source {source}: it is the same directory as a class folder")
+            continue
+        scan_targets.append((source, cls, prefix))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        listings = list(pool.map(lambda target: scan_directory(raw_dir / target[0]), scan_targets))
+
+    organized = []  # (relpath, path, size, mtime, class)
+    incoming = []   # (path, size, mtime, class, prefix)
+    for (folder, cls, prefix), listing in zip(scan_targets, listings):
+        for path, size, mtime in listing:
+            if cls is None:
+                organized.append((path.relative_to(raw_dir).as_posix(), path, size, mtime, folder))
+            else:
+                incoming.append((path, size, mtime, cls, prefix))
+
+    # Only hash files that changed since the last run (incoming files are only known when copied)
+    to_describe = [item[1] for item in organized if not is_unchanged(files.get(item[0]), item[2], item[3])]
+    rehashed = len(to_describe)
+    for path, size, mtime, cls, prefix in incoming:
+        if not is_unchanged(sources.get(path.relative_to(raw_dir).as_posix()), size, mtime):
+            to_describe.append(path)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        descriptions = dict(zip(to_describe, pool.map(describe_file, to_describe)))
+
+    # Rebuild the organized part of the manifest, dropping entries for deleted files
+    new_files = {}
+    known_hashes = {}
+    duplicates_in_place = 0
+    for relpath, path, size, mtime, cls in sorted(organized):
+        record = files.get(relpath) if path not in descriptions else None
+        if record is None:
+            record = dict(descriptions[path], **{"class": cls, "size": size, "mtime": mtime})
+        if record["sha256"] in known_hashes:
+            duplicates_in_place += 1
+            print(f"Duplicate of {known_hashes[record['sha256']]}: {relpath}")
+        else:
+            known_hashes[record["sha256"]] = relpath
+        new_files[relpath] = record
+
+    removed = len(set(files) - set(new_files))
+    # Never delete a file the manifest knows about, whatever its case on disk
+    recorded = {relpath.casefold() for relpath in list(files) + list(new_files)}
+
+    # Move (or copy) unique incoming files into their class folder
+    ingested = 0
+    skipped = 0
+    new_sources = {}
+    transfer = shutil.copy2 if copy else shutil.move
+    for path, size, mtime, cls, prefix in sorted(incoming):
+        source_relpath = path.relative_to(raw_dir).as_posix()
+        if path in descriptions:
+            description = descriptions[path]
+        else:
+            description = {key: sources[source_relpath][key] for key in ("sha256", "width", "height")}
+        if copy:
+            new_sources[source_relpath] = dict(description, size=size, mtime=mtime)
+        sha256 = description["sha256"]
+        if sha256 in known_hashes:
+            skipped += 1
+            if not copy and not dry_run and source_relpath.casefold() not in recorded:
+                path.unlink()
+            continue
+
+        dest_dir = raw_dir / cls
+        destination = unique_destination(dest_dir, prefix + path.name, sha256)
+        relpath = destination.relative_to(raw_dir).as_posix()
+        if not dry_run:
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            transfer(str(path), str(destination))
+            stat = destination.stat()
+            size, mtime = stat.st_size, stat.st_mtime
+        new_files[relpath] = dict(description, **{"class": cls, "size": size, "mtime": mtime})
+        known_hashes[sha256] = relpath
+        ingested += 1
+
+    manifest["files"] = new_files
+    manifest["sources"] = new_sources
+    if not dry_run:
+        save_manifest(manifest, manifest_path)
+        if cleanup:
+            remove_source_directories(raw_dir)
+
+    elapsed = time.time() - start
+    print(f"Scanned {len(organized) + len(incoming)} files in {elapsed:.2f}s "
+          f"({rehashed} re-hashed, {len(incoming)} incoming, "
+          f"{len(to_describe) - rehashed} incoming hashed)")
+    print(f"Ingested {ingested} new images, skipped {skipped} duplicates, "
+          f"dropped {removed} stale manifest entries")
+    if duplicates_in_place:
+        print(f"⚠️  {duplicates_in_place} duplicates already inside class folders (left in place)")
+
+    counts = {}
+    for record in new_files.values():
+        counts[record["class"]] = counts.get(record["class"], 0) + 1
+    for category in CATEGORIES:
+        print(f"  {category}: {counts.get(category, 0)} images")
+
+    return manifest
+
+
+def remove_source_directories(raw_dir):
+    """Remove annotation folders and source folders that no longer hold images"""
+    for name in ANNOTATION_DIRS:
+        annotation_dir = raw_dir / name
+        if annotation_dir.exists():
+            shutil.rmtree(annotation_dir)
+            print(f"Removed {name} directory")
+
+    for source in SOURCES:
+        # Remove the top-level source folder (e.g. trash/ for trash/trash)
+        top_level = raw_dir / Path(source).parts[0]
+        if not top_level.exists():
+            continue
+        leftover_images = [p for p in top_level.rglob("*") if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS]
+        if leftover_images:
+            print(f"⚠️  Keeping {top_level.name}: {len(leftover_images)} images were not ingested")
+            continue
+        shutil.rmtree(top_level)
+        print(f"Removed {top_level.name} directory")
+
+
+def main():
+    """Main function to ingest the raw dataset"""
+    parser = argparse.ArgumentParser(description="Organize and deduplicate the Civic Connect raw dataset")
+    parser.add_argument("--raw_dir", default=str(RAW_DIR), help="Root of the raw dataset")
+    parser.add_argument("--copy", action="store_true", help="Copy incoming files instead of moving them")
+    parser.add_argument("--dry_run", action="store_true", help="Report what would change without touching files")
+    parser.add_argument("--cleanup", action="store_true", help="Remove emptied source and annotation folders")
+    parser.add_argument("--workers", type=int, default=None, help="Number of scanner/hasher threads")
+    args = parser.parse_args()
+
+    print("Ingesting Civic Connect raw data...")
+    print("=" * 40)
+    ingest(args.raw_dir, copy=args.copy, dry_run=args.dry_run, cleanup=args.cleanup, workers=args.workers)
+    print("=" * 40)
+    print("Data ingestion complete!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
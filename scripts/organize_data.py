@@ -7,6 +7,9 @@ data/raw/
 ├── garbage/
 ├── streetlight/
 └── water_leak/
+
+For repeated runs prefer ingest_data.py, which deduplicates by content hash and
+keeps a manifest so only changed files are rescanned.
 """
 
 import os
@@ -14,8 +17,8 @@ import shutil
 from pathlib import Path
 import glob
 
-# Use absolute path
-BASE_DIR = Path("e:/mini/civic-connect")
+# Use relative path based on script location
+BASE_DIR = Path(__file__).parent.parent
 
 def create_directories():
     """Create the required directory structure"""
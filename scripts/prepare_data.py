@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 """
 Data Preparation Script for Civic Connect ML Models
-This script demonstrates how to prepare data for training the ML models.
+Resizes and splits raw images for training the ML models (run with --help for options).
 """
 
+import argparse
+import json
 import os
 import shutil
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import numpy as np
 
+from ingest_data import IMAGE_EXTENSIONS, load_manifest, save_manifest
+
+RESIZE_MANIFEST_NAME = ".resize_manifest.json"
+SPLIT_MANIFEST_VERSION = 1
+SPLITS = ['train', 'val', 'test']
+
 def create_directory_structure(base_dir):
     """Create the directory structure for training data"""
     classes = ['pothole', 'garbage', 'streetlight', 'water_leak', 'other']
@@ -24,88 +35,245 @@ def create_directory_structure(base_dir):
     
     print(f"Created directory structure in {base_dir}")
 
-def resize_images(source_dir, target_dir, size=(224, 224)):
-    """Resize images to a consistent size"""
+def _size_label(size):
+    """Directory name for a target size, e.g. 224x224"""
+    return f"{size[0]}x{size[1]}"
+
+def _resize_one(task):
+    """Decode one image once and write it at every requested size"""
+    source_path, outputs = task
+    try:
+        with Image.open(source_path) as img:
+            # Let the JPEG decoder downscale while decoding (no-op for other formats)
+            largest = max(max(size) for size, _ in outputs)
+            img.draft('RGB', (largest, largest))
+            img = img.convert('RGB')
+            for size, target_path in outputs:
+                img.resize(size).save(target_path)
+        return source_path, None
+    except Exception as e:
+        return source_path, str(e)
+
+def resize_images(source_dir, target_dir, size=(224, 224), sizes=None, workers=None, force=False):
+    """Resize images to consistent sizes in parallel, skipping up-to-date outputs
+
+    Class sub-directories of source_dir are mirrored in target_dir. With several
+    sizes each one is written to its own sub-directory (e.g. 224x224/ and 64x64/)
+    from a single decode of the source image. A manifest in target_dir records the
+    source size and mtime so unchanged images are skipped on the next run.
+    """
     if not os.path.exists(source_dir):
         print(f"Source directory {source_dir} does not exist")
         return
-    
+
+    sizes = [tuple(s) for s in (sizes or [size])]
+    size_dirs = [os.path.join(target_dir, _size_label(s)) if len(sizes) > 1 else target_dir for s in sizes]
+    labels = sorted(_size_label(s) for s in sizes)
+
+    manifest_path = os.path.join(target_dir, RESIZE_MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    files = manifest["files"]
+
+    tasks = []
+    up_to_date = 0
+    for root, _, filenames in os.walk(source_dir):
+        rel_root = os.path.relpath(root, source_dir)
+        for filename in filenames:
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            source_path = os.path.join(root, filename)
+            relpath = os.path.normpath(os.path.join(rel_root, filename)).replace(os.sep, '/')
+            stat = os.stat(source_path)
+            outputs = [(s, os.path.join(d, rel_root, filename)) for s, d in zip(sizes, size_dirs)]
+
+            record = files.get(relpath)
+            if (not force and record is not None
+                    and record.get("size") == stat.st_size and record.get("mtime") == stat.st_mtime
+                    and set(labels) <= set(record.get("outputs", []))
+                    and all(os.path.exists(path) for _, path in outputs)):
+                up_to_date += 1
+                continue
+
+            for _, target_path in outputs:
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            tasks.append((source_path, outputs))
+            files[relpath] = {"size": stat.st_size, "mtime": stat.st_mtime, "outputs": labels}
+
+    start = time.time()
+    errors = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 8))
+            for source_path, error in pool.map(_resize_one, tasks, chunksize=chunksize):
+                if error:
+                    errors += 1
+                    print(f"Error processing {source_path}: {error}")
+                    relpath = os.path.relpath(source_path, source_dir).replace(os.sep, '/')
+                    files.pop(relpath, None)
+    elapsed = time.time() - start
+
     os.makedirs(target_dir, exist_ok=True)
-    
-    for filename in os.listdir(source_dir):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            source_path = os.path.join(source_dir, filename)
-            target_path = os.path.join(target_dir, filename)
-            
-            try:
-                with Image.open(source_path) as img:
-                    # Resize image
-                    img_resized = img.resize(size)
-                    # Convert to RGB if necessary
-                    if img_resized.mode != 'RGB':
-                        img_resized = img_resized.convert('RGB')
-                    # Save resized image
-                    img_resized.save(target_path)
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-    
+    save_manifest(manifest, manifest_path)
+
+    processed = len(tasks) - errors
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Resized {processed} images to {', '.join(labels)} in {elapsed:.2f}s ({rate:.1f} images/sec)")
+    print(f"Skipped {up_to_date} up-to-date images, {errors} errors")
     print(f"Resized images from {source_dir} to {target_dir}")
 
-def split_dataset(source_dir, train_dir, val_dir, test_dir, split_ratios=(0.7, 0.2, 0.1)):
-    """Split dataset into train, validation, and test sets"""
-    train_ratio, val_ratio, test_ratio = split_ratios
-    
-    for class_name in os.listdir(source_dir):
+def split_dataset(source_dir, manifest_path, split_ratios=(0.7, 0.2, 0.1), seed=42):
+    """Split dataset into train, validation, and test sets as a manifest file
+
+    The split is stratified per class and reproducible: each class's files are
+    sorted and shuffled with a RandomState derived from the seed and the class
+    name. No images are copied; use materialize_split() if a directory tree
+    is needed.
+    """
+    train_ratio, val_ratio, _ = split_ratios
+    manifest_path = os.path.abspath(manifest_path)
+    source_dir = os.path.abspath(source_dir)
+
+    splits = {split: [] for split in SPLITS}
+    for class_name in sorted(os.listdir(source_dir)):
         class_dir = os.path.join(source_dir, class_name)
-        if not os.path.isdir(class_dir):
+        if not os.path.isdir(class_dir) or class_name.startswith('.'):
             continue
-        
-        # Get all images in class directory
-        images = [f for f in os.listdir(class_dir) 
-                 if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        
-        # Shuffle images
-        np.random.shuffle(images)
-        
-        # Calculate split indices
+
+        with os.scandir(class_dir) as it:
+            images = sorted(entry.name for entry in it
+                            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
+        rng = np.random.RandomState((seed + zlib.crc32(class_name.encode())) % (2 ** 32))
+        images = [images[i] for i in rng.permutation(len(images))]
+
         train_end = int(len(images) * train_ratio)
         val_end = int(len(images) * (train_ratio + val_ratio))
-        
-        # Split images
-        train_images = images[:train_end]
-        val_images = images[train_end:val_end]
-        test_images = images[val_end:]
-        
-        # Copy images to respective directories
-        for img in train_images:
-            src = os.path.join(class_dir, img)
-            dst = os.path.join(train_dir, class_name, img)
-            shutil.copy2(src, dst)
-        
-        for img in val_images:
-            src = os.path.join(class_dir, img)
-            dst = os.path.join(val_dir, class_name, img)
-            shutil.copy2(src, dst)
-        
-        for img in test_images:
-            src = os.path.join(class_dir, img)
-            dst = os.path.join(test_dir, class_name, img)
-            shutil.copy2(src, dst)
-    
-    print("Dataset split completed")
+        for split, chunk in zip(SPLITS, (images[:train_end], images[train_end:val_end], images[val_end:])):
+            splits[split].extend([f"{class_name}/{img}", class_name] for img in chunk)
+
+    manifest = {
+        "version": SPLIT_MANIFEST_VERSION,
+        "seed": seed,
+        "ratios": list(split_ratios),
+        # Stored relative to the manifest so the dataset folder can be moved
+        "source_dir": os.path.relpath(source_dir, os.path.dirname(manifest_path)).replace(os.sep, '/'),
+        "splits": splits,
+    }
+    save_manifest(manifest, manifest_path)
+
+    counts = ", ".join(f"{split}: {len(items)}" for split, items in splits.items())
+    print(f"Dataset split completed (seed {seed}) - {counts}")
+    print(f"Split manifest written to {manifest_path}")
+    return manifest
+
+def load_split_manifest(manifest_path):
+    """Load a split manifest as {split: [(absolute image path, class)]}"""
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != SPLIT_MANIFEST_VERSION:
+        raise ValueError(f"Unsupported split manifest version in {manifest_path}")
+
+    source_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(manifest_path)),
+                                               manifest["source_dir"]))
+    return {
+        split: [(os.path.join(source_dir, *relpath.split('/')), class_name) for relpath, class_name in items]
+        for split, items in manifest["splits"].items()
+    }
+
+def materialize_split(manifest_path, target_dir, mode="hardlink"):
+    """Materialize a split manifest as target_dir/<split>/<class>/ links
+
+    mode is 'hardlink' (no extra space, same filesystem only), 'symlink' or
+    'copy'. Existing correct entries are kept and files that are no longer
+    part of a split are removed, so re-materializing is incremental.
+    """
+    samples = load_split_manifest(manifest_path)
+    linked = kept = removed = 0
+
+    for split, items in samples.items():
+        expected = set()
+        for source_path, class_name in items:
+            target_path = os.path.join(target_dir, split, class_name, os.path.basename(source_path))
+            expected.add(os.path.normpath(target_path))
+            if os.path.lexists(target_path):
+                if mode == "hardlink" and os.path.samefile(source_path, target_path):
+                    kept += 1
+                    continue
+                if mode == "symlink" and os.path.islink(target_path) and \
+                        os.readlink(target_path) == os.path.abspath(source_path):
+                    kept += 1
+                    continue
+                if mode == "copy":
+                    kept += 1
+                    continue
+                os.remove(target_path)
+
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            if mode == "hardlink":
+                try:
+                    os.link(source_path, target_path)
+                except OSError as e:
+                    print(f"Hardlink failed ({e}), copying {source_path}")
+                    shutil.copy2(source_path, target_path)
+            elif mode == "symlink":
+                os.symlink(os.path.abspath(source_path), target_path)
+            else:
+                shutil.copy2(source_path, target_path)
+            linked += 1
+
+        split_dir = os.path.join(target_dir, split)
+        for root, _, filenames in os.walk(split_dir):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(root, filename))
+                if path not in expected and filename.lower().endswith(IMAGE_EXTENSIONS):
+                    os.remove(path)
+                    removed += 1
+
+    print(f"Materialized split in {target_dir} ({mode}): {linked} added, {kept} kept, {removed} removed")
 
 def main():
-    """Main function to demonstrate data preparation"""
+    """Main function to run the data preparation steps"""
+    parser = argparse.ArgumentParser(description="Civic Connect Data Preparation Script")
+    subparsers = parser.add_subparsers(dest="command")
+
+    resize_parser = subparsers.add_parser("resize", help="Resize images to one or more target sizes")
+    resize_parser.add_argument("--source_dir", default="../data/raw")
+    resize_parser.add_argument("--target_dir", default="../data/processed")
+    resize_parser.add_argument("--sizes", type=int, nargs="+", default=[224, 64],
+                               help="Square target sizes, e.g. 224 for ResNet50 and 64 for SimpleCNN")
+    resize_parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    resize_parser.add_argument("--force", action="store_true", help="Re-process images even if up to date")
+
+    split_parser = subparsers.add_parser("split", help="Write a seeded, stratified train/val/test manifest")
+    split_parser.add_argument("--source_dir", default="../data/raw")
+    split_parser.add_argument("--manifest", default="../data/splits.json")
+    split_parser.add_argument("--ratios", type=float, nargs=3, default=[0.7, 0.2, 0.1])
+    split_parser.add_argument("--seed", type=int, default=42)
+    split_parser.add_argument("--materialize", choices=["hardlink", "symlink", "copy"], default=None,
+                              help="Also build train/val/test/<class> folders from the manifest")
+    split_parser.add_argument("--target_dir", default="../data/processed")
+
+    args = parser.parse_args()
+
     print("Civic Connect Data Preparation Script")
     print("=" * 40)
-    print("This script demonstrates how to prepare data for training ML models.")
-    print("\nIn a real implementation, you would:")
-    print("1. Organize your raw images in class-specific directories")
-    print("2. Resize images to a consistent size")
-    print("3. Split the dataset into train/validation/test sets")
-    print("4. Apply any necessary preprocessing")
-    print("\nExample usage:")
-    print("python prepare_data.py --source_dir ../data/raw --target_dir ../data/processed")
+
+    if args.command == "resize":
+        resize_images(args.source_dir, args.target_dir,
+                      sizes=[(s, s) for s in args.sizes], workers=args.workers, force=args.force)
+    elif args.command == "split":
+        split_dataset(args.source_dir, args.manifest, tuple(args.ratios), seed=args.seed)
+        if args.materialize:
+            materialize_split(args.manifest, args.target_dir, mode=args.materialize)
+    else:
+        print("Steps to prepare data for training ML models:")
+        print("1. Organize your raw images in class-specific directories (ingest_data.py)")
+        print("2. Resize images to consistent sizes")
+        print("3. Split the dataset into train/validation/test sets (a manifest, no copies)")
+        print("4. Apply any necessary preprocessing")
+        print("\nExample usage:")
+        print("python prepare_data.py resize --source_dir ../data/raw --target_dir ../data/processed --sizes 224 64")
+        print("python prepare_data.py split --source_dir ../data/raw --manifest ../data/splits.json --seed 42")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped dataset shards for Civic Connect ML models
+Packs preprocessed images into fixed-size uint8 .npy shards (one set per split)
+with matching label arrays and a pack.json manifest, so training and evaluation
+read pixels straight from disk instead of re-decoding JPEGs every epoch.
+
+Pack once per input size, from a split manifest or a directory tree:
+    python shard_dataset.py --splits ../data/splits.json --output_dir ../data/shards/224 --size 224
+    python shard_dataset.py --source_dir ../data/processed --output_dir ../data/shards/64 --size 64
+
+Then read batches with ShardDataset:
+    dataset = ShardDataset("../data/shards/64", "train")
+    for images, labels in dataset.batches(64, flatten=True):   # SimpleCNN
+        ...
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from ingest_data import IMAGE_EXTENSIONS
+from prepare_data import load_split_manifest
+
+PACK_MANIFEST_NAME = "pack.json"
+PACK_VERSION = 1
+SPLITS = ['train', 'val', 'test']
+
+
+def collect_samples(source_dir):
+    """Collect (path, class) samples per split from a directory tree
+
+    source_dir may either hold split folders (train/<class>/...) or class
+    folders directly, in which case everything goes into a single 'all' split.
+    """
+    source_dir = Path(source_dir)
+    split_dirs = {split: source_dir / split for split in SPLITS if (source_dir / split).is_dir()}
+    if not split_dirs:
+        split_dirs = {"all": source_dir}
+
+    samples = {}
+    for split, split_dir in split_dirs.items():
+        items = []
+        for class_dir in sorted(p for p in split_dir.iterdir() if p.is_dir()):
+            with os.scandir(class_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        items.append((entry.path, class_dir.name))
+        samples[split] = sorted(items)
+    return samples
+
+
+def load_image(path, size):
+    """Decode an image into a (size, size, 3) uint8 array"""
+    with Image.open(path) as img:
+        img.draft('RGB', (size, size))
+        img = img.convert('RGB')
+        img = img.resize((size, size))
+        return np.asarray(img, dtype=np.uint8)
+
+
+def _load_for_pack(task):
+    path, size = task
+    try:
+        return load_image(path, size), None
+    except Exception as e:
+        return None, str(e)
+
+
+def pack_dataset(samples, output_dir, size=224, shard_size=1024, seed=42, workers=None):
+    """Write samples ({split: [(path, class)]}) as uint8 shards plus a manifest"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Label ids follow sorted class names, matching Keras flow_from_directory
+    classes = sorted({cls for items in samples.values() for _, cls in items})
+    class_to_id = {cls: i for i, cls in enumerate(classes)}
+
+    manifest = {
+        "version": PACK_VERSION,
+        "image_shape": [size, size, 3],
+        "dtype": "uint8",
+        "classes": classes,
+        "shard_size": shard_size,
+        "seed": seed,
+        "splits": {},
+    }
+
+    start = time.time()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for split, items in samples.items():
+            # Shuffle once at pack time so contiguous slices are already mixed batches
+            order = np.random.RandomState(seed).permutation(len(items))
+            items = [items[i] for i in order]
+
+            shards = []
+            for shard_index, offset in enumerate(range(0, len(items), shard_size)):
+                chunk = items[offset:offset + shard_size]
+                results = pool.map(_load_for_pack, [(path, size) for path, _ in chunk], chunksize=16)
+
+                images = []
+                labels = []
+                sources = []
+                for (path, cls), (array, error) in zip(chunk, results):
+                    if error:
+                        print(f"Error processing {path}: {error}")
+                        continue
+                    images.append(array)
+                    labels.append(class_to_id[cls])
+                    sources.append(path)
+                if not images:
+                    continue
+
+                images_name = f"{split}_{shard_index:05d}.npy"
+                labels_name = f"{split}_{shard_index:05d}_labels.npy"
+                shard = np.lib.format.open_memmap(output_dir / images_name, mode='w+', dtype=np.uint8,
+                                                  shape=(len(images), size, size, 3))
+                shard[:] = np.stack(images)
+                shard.flush()
+                del shard
+                np.save(output_dir / labels_name, np.asarray(labels, dtype=np.int16))
+
+                shards.append({"images": images_name, "labels": labels_name,
+                               "count": len(images), "sources": sources})
+                total += len(images)
+
+            manifest["splits"][split] = {"count": sum(s["count"] for s in shards), "shards": shards}
+            print(f"Packed {manifest['splits'][split]['count']} {split} images into {len(shards)} shards")
+
+    with open(output_dir / PACK_MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    elapsed = time.time() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Packed {total} images at {size}x{size} in {elapsed:.2f}s ({rate:.1f} images/sec)")
+    return manifest
+
+
+class ShardDataset:
+    """Memory-mapped reader for one split of a packed dataset"""
+
+    def __init__(self, pack_dir, split="train"):
+        self.pack_dir = Path(pack_dir)
+        with open(self.pack_dir / PACK_MANIFEST_NAME, 'r') as f:
+            self.manifest = json.load(f)
+        if split not in self.manifest["splits"]:
+            raise KeyError(f"Split '{split}' not found in {self.pack_dir}")
+
+        self.split = split
+        self.classes = self.manifest["classes"]
+        self.image_shape = tuple(self.manifest["image_shape"])
+        self.shards = self.manifest["splits"][split]["shards"]
+        self._images = [None] * len(self.shards)
+        self._labels = [None] * len(self.shards)
+
+    def __len__(self):
+        return self.manifest["splits"][self.split]["count"]
+
+    @property
+    def class_indices(self):
+        """Class name -> label id, in the same format as the Keras class_indices.npy files"""
+        return {cls: i for i, cls in enumerate(self.classes)}
+
+    def shard(self, index):
+        """Return the (images, labels) memory maps of one shard"""
+        if self._images[index] is None:
+            info = self.shards[index]
+            self._images[index] = np.load(self.pack_dir / info["images"], mmap_mode='r')
+            self._labels[index] = np.load(self.pack_dir / info["labels"], mmap_mode='r')
+        return self._images[index], self._labels[index]
+
+    def batches(self, batch_size=32, shuffle=True, seed=None, flatten=False, drop_last=False):
+        """Yield (images, labels) batches as zero-copy views into the shards
+
+        Samples were shuffled when packing, so shuffling here only reorders
+        shards and contiguous batch windows (with a random start offset per
+        shard); every yielded array is a read-only view of the memory map.
+        Batches never span two shards. Use to_float() for model input.
+        """
+        rng = np.random.RandomState(seed)
+        shard_order = rng.permutation(len(self.shards)) if shuffle else range(len(self.shards))
+        for index in shard_order:
+            images, labels = self.shard(index)
+            count = len(labels)
+            offset = int(rng.randint(batch_size)) if shuffle and count > batch_size else 0
+            bounds = ([0] if offset else []) + list(range(offset, count, batch_size))
+            windows = list(zip(bounds, bounds[1:] + [count]))
+            if shuffle:
+                rng.shuffle(windows)
+            for start, stop in windows:
+                if drop_last and stop - start < batch_size:
+                    continue
+                batch = images[start:stop]
+                if flatten:
+                    batch = batch.reshape(len(batch), -1)
+                yield batch, labels[start:stop]
+
+    def arrays(self, flatten=False):
+        """Load the whole split into memory as (images, labels)"""
+        parts = [self.shard(i) for i in range(len(self.shards))]
+        if not parts:
+            return np.empty((0,) + self.image_shape, dtype=np.uint8), np.empty((0,), dtype=np.int16)
+        images = np.concatenate([p[0] for p in parts])
+        labels = np.concatenate([p[1] for p in parts])
+        if flatten:
+            images = images.reshape(len(images), -1)
+        return images, labels
+
+    def sources(self):
+        """Original image paths in shard order"""
+        return [path for info in self.shards for path in info["sources"]]
+
+
+def to_float(images):
+    """Convert uint8 pixels to the float32 0-1 range the models were trained on"""
+    return np.asarray(images, dtype=np.float32) / 255.0
+
+
+def main():
+    """Main function to pack a dataset into shards"""
+    parser = argparse.ArgumentParser(description="Pack images into memory-mapped .npy shards")
+    parser.add_argument("--source_dir", default="../data/processed",
+                        help="Directory with train/val/test/<class> folders or <class> folders")
+    parser.add_argument("--splits", default=None, help="Split manifest from prepare_data.py split")
+    parser.add_argument("--output_dir", default="../data/shards/224")
+    parser.add_argument("--size", type=int, default=224, help="224 for ResNet50, 64 for SimpleCNN")
+    parser.add_argument("--shard_size", type=int, default=1024, help="Images per shard")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    print("Civic Connect Dataset Packer")
+    print("=" * 40)
+    samples = load_split_manifest(args.splits) if args.splits else collect_samples(args.source_dir)
+    pack_dataset(samples, args.output_dir, size=args.size, shard_size=args.shard_size,
+                 seed=args.seed, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -165,9 +165,17 @@ exports.classifySeverity = async (imageUrl) => {
 // @return  areaType - urban, busy, residential, or rural
 exports.classifyAreaType = async (latitude, longitude) => {
   try {
-    // For now, return a default area type since we don't have a specific model for this
-    // In a real implementation, you might use additional data sources or models
-    return 'urban';
+    // Ask the ML service, which answers from an offline land-use index
+    const response = await axios.post(`${config.ML_SERVICE_URL}/area-type`, null, {
+      params: { latitude, longitude },
+      timeout: 2000
+    });
+    const { areaType, confidence, source } = response.data;
+    // Without a land-use index the service only returns a placeholder; do not store it
+    if (!areaType || source === 'simulated' || !confidence) {
+      return 'urban';
+    }
+    return areaType;
   } catch (error) {
     console.error('Area classification failed:', error.message);
     // Return a default area type instead of throwing error
@@ -1,8 +1,16 @@
 """
 Test script to verify garbage dataset and prepare for training
 """
+import os
 from pathlib import Path
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def count_images(directory):
+    """Count images in a directory with a single scan"""
+    with os.scandir(directory) as it:
+        return sum(1 for entry in it if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
 def check_garbage_dataset():
     """Check if we have the garbage dataset available"""
     print("Checking garbage dataset...")
@@ -20,20 +28,19 @@ def check_garbage_dataset():
         return False
     
     # Count garbage images
-    garbage_images = list(garbage_dir.glob("*.[jJ][pP][gG]")) + list(garbage_dir.glob("*.[jJ][pP][eE][gG]")) + list(garbage_dir.glob("*.[pP][nN][gG]"))
-    print(f"✅ Found {len(garbage_images)} garbage images")
+    garbage_count = count_images(garbage_dir)
+    print(f"✅ Found {garbage_count} garbage images")
     
     # Check other classes
     classes = ["pothole", "streetlight"]
     for class_name in classes:
         class_dir = data_dir / class_name
         if class_dir.exists():
-            images = list(class_dir.glob("*.[jJ][pP][gG]")) + list(class_dir.glob("*.[jJ][pP][eE][gG]")) + list(class_dir.glob("*.[pP][nN][gG]"))
-            print(f"✅ Found {len(images)} {class_name} images")
+            print(f"✅ Found {count_images(class_dir)} {class_name} images")
         else:
             print(f"⚠️  {class_name} directory not found")
     
-    return len(garbage_images) > 0
+    return garbage_count > 0
 
 def main():
     print("Civic Connect - Garbage Dataset Verification")